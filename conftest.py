@@ -52,6 +52,7 @@ def app_context(app):
             dex.db.init_db()
             yield ctx
     finally:
+        dex.db.close_db()
         os.close(db_fd)
         os.unlink(app.config['SQLITE_PATH'])
 
@@ -87,6 +88,14 @@ def tmpdir(config, tmpdir):
     return pathlib.Path(tmpdir)
 
 
+@pytest.fixture(autouse=True)
+def profile_dir(config, tmp_path):
+    """Store request profiles in a temporary dir, as requests from tests that enable the
+    debug panel are profiled."""
+    config['REQUEST_PROFILE_DIR'] = tmp_path / 'profiles'
+    return config['REQUEST_PROFILE_DIR']
+
+
 @pytest.fixture
 def docs_path():
     return TEST_DOCS
@@ -1,27 +1,59 @@
 import contextlib
 import functools
+import gzip
 import logging
 import lzma
+import os
 import pathlib
 import shutil
 import sys
 import tempfile
 import threading
 import time
+import uuid
 
 import fasteners
 import flask
 import lxml.etree
 
+import dex.cache_index
 import dex.db
 import dex.exc
 import dex.filesystem
+import dex.memory
+import dex.metrics
+import dex.timing
 
 try:
     import cPickle as pickle
 except ImportError:
     import pickle
 
+try:
+    from compression import zstd
+except ImportError:
+    try:
+        from backports import zstd
+    except ImportError:
+        zstd = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+# Compression codecs that can be used for cached objects, and the file extension that
+# records the codec in the name of the cache file. Readers select the decoder by the
+# extension, so existing cache files remain readable after the codec configuration is
+# changed. The order is the order in which we look for existing files.
+CODEC_EXT_DICT = {
+    'none': '',
+    'xz': '.xz',
+    'zstd': '.zst',
+    'lz4': '.lz4',
+    'gzip': '.gz',
+}
+
 
 class NamedThreadLocks:
     def __init__(self):
@@ -57,17 +89,34 @@ LOCK_ROOT.mkdir(0o755, parents=True, exist_ok=True)
 
 log = logging.getLogger(__name__)
 
+# When the size of the permanent cache exceeds CACHE_LIMIT_BYTES, we evict datasets
+# until the size drops below this fraction of the limit. This prevents running a new
+# eviction for each object that is added to the cache once the limit has been reached.
+EVICT_TARGET_FRACTION = 0.9
+
+# Serializes evictions between threads in this process. Evictions in different processes
+# are serialized by a file lock.
+evict_lock = threading.Lock()
+
+# Name of the file that holds the generation token in the cache directory of each rid.
+# Hidden files are not tracked by the cache index.
+GENERATION_FILE_NAME = '.generation'
+
+cache_index_dict = {}
+
 
 @contextlib.contextmanager
 def lock(rid, key, obj_type):
     rid = rid or 'global'
     log.debug(f"Waiting to acquire lock: {rid}_{key}_{obj_type}")
+    # The wait includes the time spent waiting for other threads in this process.
+    start_ts = time.time()
     with named_thread_locks(f"{rid}_{key}_{obj_type}"):
-        start_ts = time.time()
         with fasteners.InterProcessLock((LOCK_ROOT / f"{rid}_{key}_{obj_type}").as_posix()):
-            log.debug(
-                f"Acquired lock after {time.time() - start_ts : .02f}s: " f"{rid}_{key}_{obj_type}"
-            )
+            wait_sec = time.time() - start_ts
+            dex.timing.add('cache-lock', wait_sec, f'{key}.{obj_type}')
+            dex.metrics.observe('dex_lock_wait_seconds', wait_sec, lock='cache')
+            log.debug(f"Acquired lock after {wait_sec:.3f}s: {rid}_{key}_{obj_type}")
             yield
         log.debug(f"Released lock: {rid}_{key}_{obj_type}")
 
@@ -108,7 +157,9 @@ def disk(key, obj_type):
         def wrapper(rid, *args, **kwargs):
             with lock(rid, key, obj_type):
                 if flask.current_app.config["DISK_CACHE_ENABLED"] and is_cached(rid, key, obj_type):
-                    obj = read_from_cache(rid, key, obj_type)
+                    dex.metrics.inc('dex_cache_lookups_total', obj_type=obj_type, result='hit')
+                    with dex.timing.span('cache-read', f'{key}.{obj_type}'):
+                        obj = read_from_cache(rid, key, obj_type)
                     log.debug(
                         f'Using cached object. key="{key}" obj_type="{obj_type}" '
                         f'class="{obj.__class__.__name__}" '
@@ -121,8 +172,14 @@ def disk(key, obj_type):
                     )
                     # except dex.exc.CacheError as e:
                     #     log.debug(f'Error: {repr(e)}')
-                    obj = fn(rid, *args, **kwargs)
-                    save_to_cache(rid, key, obj_type, obj)
+                    dex.metrics.inc('dex_cache_lookups_total', obj_type=obj_type, result='miss')
+                    with dex.timing.span('cache-generate', f'{key}.{obj_type}'):
+                        with dex.metrics.timer('dex_cache_generate_seconds', key=key):
+                            with dex.memory.track(f'{key}.{obj_type}', rid) as mem_dict:
+                                obj = fn(rid, *args, **kwargs)
+                                mem_dict['obj'] = obj
+                    with dex.timing.span('cache-write', f'{key}.{obj_type}'):
+                        save_to_cache(rid, key, obj_type, obj)
                     log.debug(
                         f'Caching new object, then returning it to client. '
                         f'key="{key}" obj_type="{obj_type}" '
@@ -140,8 +197,7 @@ def is_cached(rid, key, obj_type):
     if not flask.current_app.config["DISK_CACHE_ENABLED"]:
         return False
 
-    for is_compressed in (False, True):
-        cache_path = _get_cache_path(rid, key, obj_type, is_compressed)
+    for _codec, cache_path in _iter_cache_path(rid, key, obj_type):
         if cache_path.exists():
             return True
     return False
@@ -153,12 +209,12 @@ def read_from_cache(rid, key, obj_type):
 
 def read_gen(rid, key, obj_type):
     with open_file(rid, key, obj_type, for_write=False) as f:
-        if obj_type in ("text", "csv", "html", "eml"):
+        if obj_type in ("text", "csv", "html", "eml", "page"):
             return f.read().decode("utf-8")
         elif obj_type in ("lxml", "etree"):
             return lxml.etree.parse(f)
         # elif obj_type in ('path',):
-        #     cache_path, is_compressed = get_cache_path(rid, key, obj_type)
+        #     cache_path, codec = get_cache_path(rid, key, obj_type)
         else:
             log.debug(f'unpickling object type {obj_type}')
             return pickle.load(f)
@@ -170,7 +226,7 @@ def save_to_cache(rid, key, obj_type, obj):
 
 def save_gen(rid, key, obj_type, obj):
     with open_file(rid, key, obj_type, for_write=True) as f:
-        if obj_type in ("text", "csv", "html", "eml", 'xml'):
+        if obj_type in ("text", "csv", "html", "eml", 'xml', 'page'):
             return f.write(obj.encode("utf-8"))
         elif obj_type in ("lxml", "etree"):
             with contextlib.suppress(LookupError, TypeError):
@@ -196,41 +252,278 @@ def get_tag_str(rid, key, obj_type):
 
 @contextlib.contextmanager
 def open_file(rid, key, obj_type, for_write=False):
-    cache_path, is_compressed = get_cache_path(rid, key, obj_type)
+    cache_path, codec = get_cache_path(rid, key, obj_type)
     if for_write:
-        if flask.current_app.config["DISK_CACHE_ENABLED"] and cache_path.exists():
-            raise dex.exc.CacheError(f"Cache file already exists: {cache_path.as_posix()}")
+        if cache_path.exists():
+            if flask.current_app.config["DISK_CACHE_ENABLED"]:
+                raise dex.exc.CacheError(f"Cache file already exists: {cache_path.as_posix()}")
+            # With the disk cache disabled, we overwrite the existing object, which may
+            # have been written with another codec.
+            delete_cache_file(rid, key, obj_type)
+            cache_path, codec = get_cache_path(rid, key, obj_type)
         cache_path.parent.mkdir(parents=True, exist_ok=True)
     else:
         if not cache_path.exists():
             raise dex.exc.CacheError(f"Cache file does not exist: {cache_path.as_posix()}")
-    if is_compressed:
-        with lzma.LZMAFile(
-            filename=cache_path.as_posix(),
-            mode="w" if for_write else "r",
+        get_cache_index().touch(cache_path.parent.name, cache_path.name)
+        dex.metrics.inc(
+            'dex_cache_read_bytes_total', cache_path.stat().st_size, obj_type=obj_type
+        )
+    with open_codec(cache_path, codec, for_write) as f:
+        yield f
+    if for_write:
+        byte_count = cache_path.stat().st_size
+        get_cache_index().add(
+            cache_path.parent.name,
+            cache_path.name,
+            byte_count,
+            obj_type=obj_type,
+            rid=rid,
+        )
+        dex.metrics.inc('dex_cache_written_bytes_total', byte_count, obj_type=obj_type)
+        start_evict_if_over_limit()
+
+
+def open_codec(file_path, codec, for_write=False):
+    """Open a file for binary read or write through the given compression codec.
+
+    Args:
+        file_path (pathlib.Path): Path to the file
+        codec (str): One of the keys in CODEC_EXT_DICT
+        for_write (bool): Open for write instead of read
+
+    Returns:
+        Binary file-like object, usable as a context manager
+    """
+    if not is_codec_available(codec):
+        raise dex.exc.CacheError(
+            f'Compression codec is not available: {codec}. path="{file_path.as_posix()}"'
+        )
+    mode = "w" if for_write else "r"
+    if codec == 'none':
+        return file_path.open(f"{mode}b")
+    elif codec == 'xz':
+        return lzma.LZMAFile(
+            filename=file_path.as_posix(),
+            mode=mode,
             format=lzma.FORMAT_XZ,
             check=-1,
             preset=(lzma.PRESET_DEFAULT if for_write else None),
             filters=None,
-        ) as f:
-            yield f
+        )
+    elif codec == 'zstd':
+        return zstd.ZstdFile(file_path.as_posix(), mode=mode)
+    elif codec == 'lz4':
+        return lz4.frame.open(file_path.as_posix(), mode=f"{mode}b")
+    elif codec == 'gzip':
+        return gzip.open(file_path.as_posix(), mode=f"{mode}b")
     else:
-        with cache_path.open("wb" if for_write else "rb") as f:
-            yield f
+        raise AssertionError(f'Invalid codec: {codec}')
+
+
+def is_codec_available(codec):
+    """Return True if the libraries required by the codec are installed."""
+    if codec == 'zstd':
+        return zstd is not None
+    if codec == 'lz4':
+        return lz4 is not None
+    return codec in CODEC_EXT_DICT
+
+
+def get_write_codec(obj_type):
+    """Return the codec to use when writing a new cache file for the given object
+    type. Falls back to no compression if the configured codec is not installed.
+    """
+    config = flask.current_app.config
+    codec = config['CACHE_CODEC_DICT'].get(obj_type, config['CACHE_DEFAULT_CODEC'])
+    if not is_codec_available(codec):
+        log.warning(f'Compression codec is not available, writing uncompressed: {codec}')
+        return 'none'
+    return codec
 
 
 def delete_cache_file(rid, key, obj_type):
-    for is_compressed in (False, True):
-        cache_path = _get_cache_path(rid, key, obj_type, is_compressed)
+    for _codec, cache_path in _iter_cache_path(rid, key, obj_type):
         if cache_path.exists():
             log.debug(f"Deleting cache file: {cache_path.as_posix()}")
             cache_path.unlink()
+            get_cache_index().remove(cache_path.parent.name, cache_path.name)
 
 
 def flush_cache(rid):
     """Delete all cache files for the given rid"""
     cache_entity_root_path = _get_cache_entity_root_path(rid)
     shutil.rmtree(cache_entity_root_path.as_posix(), ignore_errors=True)
+    get_cache_index().remove(cache_entity_root_path.name)
+
+
+def get_generation(rid):
+    """Return a token that identifies the current generation of the cached objects for
+    the rid.
+
+    Cached objects are not modified after they have been written, so anything derived
+    from them stays valid until the cache for the rid is flushed. The token is stored in
+    the cache directory for the rid, so is removed together with the objects when the
+    cache is flushed, and a new token is created on the next call. Eviction keeps the
+    token, as the evicted objects are recreated from the same source objects.
+
+    Responses that are revalidated with the token are served without reading the cached
+    objects, so this also records an access to the objects for the rid.
+
+    Returns None if the disk cache is disabled, as objects are then not kept.
+    """
+    if not flask.current_app.config["DISK_CACHE_ENABLED"]:
+        return None
+    touch(rid)
+    gen_path = _get_cache_entity_root_path(rid) / GENERATION_FILE_NAME
+    with contextlib.suppress(FileNotFoundError):
+        return gen_path.read_text()
+    gen_path.parent.mkdir(parents=True, exist_ok=True)
+    # The token is written to a temporary file, then linked into place, which fails if
+    # the token already exists. So concurrent callers all end up with the same, complete
+    # token.
+    tmp_path = gen_path.with_name(f'{GENERATION_FILE_NAME}.{uuid.uuid4().hex}')
+    tmp_path.write_text(uuid.uuid4().hex)
+    try:
+        os.link(tmp_path, gen_path)
+    except FileExistsError:
+        pass
+    finally:
+        tmp_path.unlink()
+    return gen_path.read_text()
+
+
+# Size accounting and eviction
+
+
+def touch(rid):
+    """Record an access to the cached objects for the rid, for reads that do not go
+    through open_file(), such as objects that are held in memory, or files that are sent
+    directly to the client.
+    """
+    if not flask.current_app.config["DISK_CACHE_ENABLED"]:
+        return
+    get_cache_index().touch_group(_get_cache_entity_root_path(rid).name)
+
+
+def get_cache_index():
+    """Return the index of sizes and access times for the objects in the permanent
+    cache.
+    """
+    index_path = flask.current_app.config['CACHE_INDEX_PATH']
+    if index_path not in cache_index_dict:
+        cache_index_dict[index_path] = dex.cache_index.CacheIndex(index_path)
+    return cache_index_dict[index_path]
+
+
+def rebuild_cache_index():
+    """Rebuild the cache index from the files in the permanent cache. Used for adding
+    caches that were created before the index existed.
+    """
+    get_cache_index().scan(flask.current_app.config['CACHE_ROOT_DIR'], _get_obj_type_from_path)
+
+
+def _get_obj_type_from_path(cache_path):
+    """Get the obj_type from a cache file name on the form, key.obj_type[.codec_ext]"""
+    name_list = cache_path.name.split('.')
+    if len(name_list) > 2 and f'.{name_list[-1]}' in CODEC_EXT_DICT.values():
+        name_list.pop()
+    return name_list[-1] if len(name_list) > 1 else None
+
+
+def start_evict_if_over_limit():
+    """If the permanent cache has grown above its size limit, start evicting the least
+    recently used datasets in a background thread, and return without waiting for the
+    eviction to complete.
+    """
+    config = flask.current_app.config
+    if config['CACHE_LIMIT_BYTES'] is None:
+        return
+    cache_index = get_cache_index()
+    if cache_index.get_total_bytes() <= config['CACHE_LIMIT_BYTES']:
+        return
+    threading.Thread(
+        target=evict,
+        args=(
+            cache_index,
+            pathlib.Path(config['CACHE_ROOT_DIR']).resolve(),
+            config['CACHE_LIMIT_BYTES'],
+            config['CACHE_EVICT_MIN_AGE_SEC'],
+        ),
+        name='dex-cache-evict',
+        daemon=True,
+    ).start()
+
+
+def evict(cache_index, cache_root_path, limit_bytes, min_age_sec):
+    """Delete the least recently used datasets from the permanent cache until its size
+    is below EVICT_TARGET_FRACTION of the limit.
+
+    This does not acquire the locks that serialize access to the cached objects, so it
+    never blocks live requests. Instead, datasets that have been accessed within the
+    last `min_age_sec` seconds are left alone, which prevents deleting objects that are
+    in use. If another thread or process is already evicting, returns immediately.
+
+    The generation token of an evicted dataset is kept, so the ETags of the views for
+    the dataset don't change. See get_generation().
+
+    Returns:
+        int: Number of evicted datasets
+    """
+    if not evict_lock.acquire(blocking=False):
+        return 0
+    try:
+        process_lock = fasteners.InterProcessLock((LOCK_ROOT / 'evict').as_posix())
+        if not process_lock.acquire(blocking=False):
+            return 0
+        try:
+            return _evict(cache_index, cache_root_path, limit_bytes, min_age_sec)
+        finally:
+            process_lock.release()
+    finally:
+        evict_lock.release()
+
+
+def _evict(cache_index, cache_root_path, limit_bytes, min_age_sec):
+    total_bytes = cache_index.get_total_bytes()
+    target_bytes = limit_bytes * EVICT_TARGET_FRACTION
+    evict_count = 0
+    for row in cache_index.get_group_list():
+        if total_bytes <= target_bytes:
+            break
+        # Accesses are recorded with a resolution of ACCESS_RESOLUTION_SEC, so the
+        # dataset may have been accessed that much later than access_ts.
+        if time.time() - row.access_ts < min_age_sec + dex.cache_index.ACCESS_RESOLUTION_SEC:
+            log.warning(
+                f'Unable to evict enough datasets to get below the cache size limit, '
+                f'as the remaining datasets are in use. total_bytes={total_bytes:,}'
+            )
+            break
+        log.info(
+            f'Evicting dataset from cache. grp="{row.grp}" rid={row.rid} '
+            f'byte_count={row.byte_count:,}'
+        )
+        _delete_evicted_dir(cache_root_path / row.grp)
+        cache_index.remove(row.grp)
+        total_bytes -= row.byte_count
+        evict_count += 1
+    return evict_count
+
+
+def _delete_evicted_dir(grp_path):
+    """Delete the cached objects in the cache directory of an evicted dataset. The
+    generation token is kept, and the directory is only removed if it does not hold a
+    token.
+    """
+    for path in grp_path.iterdir() if grp_path.is_dir() else []:
+        if path.name.startswith(GENERATION_FILE_NAME):
+            continue
+        if path.is_dir():
+            shutil.rmtree(path.as_posix(), ignore_errors=True)
+        else:
+            path.unlink(missing_ok=True)
+    with contextlib.suppress(OSError):
+        grp_path.rmdir()
 
 
 def get_cache_path(rid, key, obj_type):
@@ -241,17 +534,27 @@ def get_cache_path(rid, key, obj_type):
         obj_type:
 
     Returns:
-        If path + '.xz' exists, returns (path + '.xz', is_compressed=True).
-        Else, returns (path, is_compressed=False). path may or may not exist.
+        If a cache file exists for the object, written with any of the codecs, returns
+        (path, codec) for the existing file.
+        Else, returns (path, codec) for the file that will be written, using the codec
+        configured for the object type. path does not exist.
     """
-    cache_path = _get_cache_path(rid, key, obj_type, is_compressed=True)
-    if cache_path.exists():
-        return cache_path, True
-    return _get_cache_path(rid, key, obj_type, is_compressed=False), False
+    for codec, cache_path in _iter_cache_path(rid, key, obj_type):
+        if cache_path.exists():
+            return cache_path, codec
+    codec = get_write_codec(obj_type)
+    return _get_cache_path(rid, key, obj_type, codec), codec
+
+
+def _iter_cache_path(rid, key, obj_type):
+    """Yield (codec, path) for each of the possible locations of the cache file."""
+    root_path = _get_cache_entity_root_path(rid)
+    for codec, ext_str in CODEC_EXT_DICT.items():
+        yield codec, root_path / f"{key}.{obj_type}{ext_str}"
 
 
-def _get_cache_path(rid, key, obj_type, is_compressed):
-    return _get_cache_entity_root_path(rid) / f"{key}.{obj_type}{'.xz' if is_compressed else ''}"
+def _get_cache_path(rid, key, obj_type, codec):
+    return _get_cache_entity_root_path(rid) / f"{key}.{obj_type}{CODEC_EXT_DICT[codec]}"
 
 
 def _get_cache_entity_root_path(rid):
@@ -0,0 +1,211 @@
+"""Track the size and last access time of objects in the DeX disk caches.
+
+The index is a small SQLite database that holds a row for each cached file. Files are
+grouped by the directory that holds all the cached objects for a single dataset, and
+eviction works on whole groups, least recently used first.
+
+The index is kept separate from the main DeX database, so that updating it never holds
+locks that block the live requests that look up entities.
+"""
+import contextlib
+import logging
+import pathlib
+import sqlite3
+import threading
+import time
+
+import dex.db
+
+log = logging.getLogger(__name__)
+
+# Updates of the last access time for an object are skipped if the object was already
+# touched by this process within this number of seconds. This prevents a DB write for
+# each cache hit, while still giving the eviction an access time that is accurate enough
+# for selecting the coldest datasets.
+ACCESS_RESOLUTION_SEC = 60
+
+# Max time to wait for another process to release a write lock on the index.
+SQLITE_TIMEOUT_SEC = 30
+
+SCHEMA_SQL = """
+create table if not exists cache_obj
+(
+    grp        text    not null,
+    name       text    not null,
+    obj_type   text,
+    rid        integer,
+    byte_count integer not null,
+    access_ts  real    not null,
+    primary key (grp, name)
+);
+create index if not exists cache_obj_access_ts_index on cache_obj (access_ts);
+"""
+
+
+class CacheIndex:
+    def __init__(self, db_path):
+        self._db_path = pathlib.Path(db_path)
+        self._is_initialized = False
+        self._touch_ts_dict = {}
+        self._lock = threading.Lock()
+
+    def add(self, grp, name, byte_count, obj_type=None, rid=None, access_ts=None):
+        """Add or replace a cached object."""
+        with self._connect() as cnx:
+            cnx.execute(
+                """
+                insert or replace into cache_obj
+                (grp, name, obj_type, rid, byte_count, access_ts)
+                values (?, ?, ?, ?, ?, ?)
+                """,
+                (grp, name, obj_type, rid, byte_count, access_ts or time.time()),
+            )
+
+    def touch(self, grp, name):
+        """Record an access to a cached object."""
+        now_ts = time.time()
+        with self._lock:
+            if now_ts - self._touch_ts_dict.get((grp, name), 0) < ACCESS_RESOLUTION_SEC:
+                return
+            self._touch_ts_dict[(grp, name)] = now_ts
+        with self._connect() as cnx:
+            cnx.execute(
+                """update cache_obj set access_ts = ? where grp = ? and name = ?""",
+                (now_ts, grp, name),
+            )
+
+    def touch_group(self, grp):
+        """Record an access to all cached objects in a group, for accesses that are
+        not made through a single cached file.
+        """
+        now_ts = time.time()
+        with self._lock:
+            if now_ts - self._touch_ts_dict.get((grp, None), 0) < ACCESS_RESOLUTION_SEC:
+                return
+            self._touch_ts_dict[(grp, None)] = now_ts
+        with self._connect() as cnx:
+            cnx.execute("""update cache_obj set access_ts = ? where grp = ?""", (now_ts, grp))
+
+    def remove(self, grp, name=None):
+        """Remove a single cached object, or all objects in the group if name is not
+        provided.
+        """
+        with self._connect() as cnx:
+            if name is None:
+                cnx.execute("""delete from cache_obj where grp = ?""", (grp,))
+            else:
+                cnx.execute("""delete from cache_obj where grp = ? and name = ?""", (grp, name))
+
+    def clear(self):
+        with self._connect() as cnx:
+            cnx.execute("""delete from cache_obj""")
+        with self._lock:
+            self._touch_ts_dict.clear()
+
+    def get_total_bytes(self):
+        with self._connect() as cnx:
+            row = cnx.execute("""select coalesce(sum(byte_count), 0) from cache_obj""").fetchone()
+        return row[0]
+
+    def get_group_list(self):
+        """Return a list of namedtuples with the total size and last access time for
+        each group, ordered from least to most recently used.
+
+        namedtuple members: grp, rid, obj_count, byte_count, access_ts
+        """
+        return self._query(
+            """
+            select grp, max(rid) as rid, count(*) as obj_count,
+                sum(byte_count) as byte_count, max(access_ts) as access_ts
+            from cache_obj
+            group by grp
+            order by max(access_ts)
+            """
+        )
+
+    def get_group_obj_list(self, grp):
+        """Return a list of namedtuples for the objects in a group.
+
+        namedtuple members: name, obj_type, byte_count, access_ts
+        """
+        return self._query(
+            """
+            select name, obj_type, byte_count, access_ts
+            from cache_obj where grp = ?
+            order by name
+            """,
+            (grp,),
+        )
+
+    def get_type_list(self):
+        """Return a list of namedtuples with the total size for each object type,
+        ordered from largest to smallest.
+
+        namedtuple members: obj_type, obj_count, byte_count
+        """
+        return self._query(
+            """
+            select obj_type, count(*) as obj_count, sum(byte_count) as byte_count
+            from cache_obj
+            group by obj_type
+            order by sum(byte_count) desc
+            """
+        )
+
+    def scan(self, root_path, get_obj_type=None):
+        """Rebuild the index from the files in a cache directory.
+
+        Each subdirectory of root_path becomes a group. As the actual access times are
+        not known, the modified times of the files are used instead.
+        """
+        row_list = []
+        root_path = pathlib.Path(root_path)
+        for grp_path in root_path.iterdir() if root_path.is_dir() else []:
+            if not grp_path.is_dir():
+                continue
+            for obj_path in grp_path.iterdir():
+                if not obj_path.is_file() or obj_path.name.startswith('.'):
+                    continue
+                stat = obj_path.stat()
+                row_list.append(
+                    (
+                        grp_path.name,
+                        obj_path.name,
+                        get_obj_type(obj_path) if get_obj_type else None,
+                        None,
+                        stat.st_size,
+                        stat.st_mtime,
+                    )
+                )
+        with self._connect() as cnx:
+            cnx.execute("""delete from cache_obj""")
+            cnx.executemany(
+                """
+                insert into cache_obj
+                (grp, name, obj_type, rid, byte_count, access_ts)
+                values (?, ?, ?, ?, ?, ?)
+                """,
+                row_list,
+            )
+        log.info(f'Rebuilt cache index. path="{self._db_path.as_posix()}" objects={len(row_list)}')
+
+    def _query(self, query, args=()):
+        with self._connect() as cnx:
+            cnx.row_factory = dex.db.namedtuple_factory
+            return cnx.execute(query, args).fetchall()
+
+    @contextlib.contextmanager
+    def _connect(self):
+        """Open a connection and commit on successful exit."""
+        if not self._is_initialized:
+            self._db_path.parent.mkdir(parents=True, exist_ok=True)
+        cnx = sqlite3.connect(self._db_path.as_posix(), timeout=SQLITE_TIMEOUT_SEC)
+        try:
+            if not self._is_initialized:
+                cnx.execute('pragma journal_mode=wal')
+                cnx.executescript(SCHEMA_SQL)
+                self._is_initialized = True
+            with cnx:
+                yield cnx
+        finally:
+            cnx.close()
@@ -0,0 +1,101 @@
+"""Compression of responses, selected by the Accept-Encoding header of the request.
+
+Browse pages, category lists, plot JSON and profile reports are text, and compress to a
+fraction of their size. Responses that already have a Content-Encoding, such as the
+pre-compressed EML page, are sent as they are. Streamed responses are compressed as
+they are streamed, so they are never held in memory in full.
+"""
+import logging
+import zlib
+
+import flask
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+log = logging.getLogger(__name__)
+
+COMPRESSIBLE_MIMETYPE_SET = {
+    'application/javascript',
+    'application/json',
+    'image/svg+xml',
+    'text/css',
+    'text/csv',
+    'text/html',
+    'text/javascript',
+    'text/plain',
+    'text/xml',
+}
+
+
+def compress_response(response):
+    """Compress the response with the best encoding that the client accepts, if the
+    response is of a type and size that benefits from it.
+    """
+    config = flask.current_app.config
+    if not config['RESPONSE_COMPRESSION_ENABLED']:
+        return response
+    if response.mimetype not in COMPRESSIBLE_MIMETYPE_SET:
+        return response
+    response.vary.add('Accept-Encoding')
+    if response.status_code != 200 or 'Content-Encoding' in response.headers:
+        return response
+    encoding = flask.request.accept_encodings.best_match(get_encoding_list())
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = _compress_gen(response.response, _get_compressor(encoding), encoding)
+        response.direct_passthrough = False
+        response.headers.pop('Content-Length', None)
+        response.headers.pop('Accept-Ranges', None)
+    else:
+        data_bytes = response.get_data()
+        if len(data_bytes) < config['RESPONSE_COMPRESSION_MIN_BYTES']:
+            return response
+        compressor = _get_compressor(encoding)
+        response.set_data(compressor.compress(data_bytes) + _finish(compressor, encoding))
+
+    response.headers['Content-Encoding'] = encoding
+    # The compressed bytes differ from the bytes the ETag was created for, so the
+    # ETag is weakened, as done by nginx. Weak comparison is used for If-None-Match,
+    # so conditional requests still match.
+    etag, is_weak = response.get_etag()
+    if etag and not is_weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def get_encoding_list():
+    """Return the supported encodings, in order of preference."""
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+
+def _compress_gen(chunk_iterable, compressor, encoding):
+    try:
+        for chunk in chunk_iterable:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            compressed_bytes = compressor.compress(chunk)
+            if compressed_bytes:
+                yield compressed_bytes
+        yield _finish(compressor, encoding)
+    finally:
+        # Close the wrapped iterable, as the WSGI server only closes this generator.
+        close_fn = getattr(chunk_iterable, 'close', None)
+        if close_fn is not None:
+            close_fn()
+
+
+def _get_compressor(encoding):
+    config = flask.current_app.config
+    if encoding == 'br':
+        return brotli.Compressor(quality=config['RESPONSE_COMPRESSION_BROTLI_QUALITY'])
+    # wbits=31 selects the gzip container.
+    return zlib.compressobj(config['RESPONSE_COMPRESSION_GZIP_LEVEL'], zlib.DEFLATED, 31)
+
+
+def _finish(compressor, encoding):
+    return compressor.finish() if encoding == 'br' else compressor.flush()
@@ -16,6 +16,8 @@ LOG_LEVEL = logging.DEBUG if DEBUG else logging.INFO
 logging.config.dictConfig(
     {
         'version': 1,
+        # Keep the loggers of the modules that were imported before this config.
+        'disable_existing_loggers': False,
         # The root logger is configured like regular loggers except that the `propagate`
         # setting is not applicable.
         'root': {
@@ -70,6 +72,13 @@ SESSION_COOKIE_HTTPONLY = True
 SESSION_COOKIE_SAMESITE = "Lax"
 SECRET_KEY = "SECRET_KEY"
 
+# Import the heavy libraries (pandas, bokeh, ydata_profiling, etc.) when the app is
+# loaded by wsgi.py, instead of on first use. Under uWSGI, the app is loaded in the
+# master process, so the modules are then shared by all the workers, and the first
+# request handled by each worker is not delayed by the imports. Leave disabled for
+# development, where fast restarts matter more.
+PRELOAD_LAZY_MODULES = False
+
 PASTA_BASE_URL = "https://pasta-d.lternet.edu/package"
 
 STATIC_PATH = HERE_PATH / 'static'
@@ -82,12 +91,57 @@ DISK_CACHE_ENABLED = True
 
 # Temporary cache
 TMP_CACHE_ROOT = TMP_PATH / 'dex-tmp-cache'
-TMP_CACHE_LIMIT = 100
+# Max total size of the downloaded objects in the temporary cache. When exceeded, the
+# least recently used objects are deleted.
+TMP_CACHE_LIMIT_BYTES = 10 * 1024**3
+# Index of sizes and access times for the objects in the temporary cache. If deleted, it
+# is rebuilt from the objects in TMP_CACHE_ROOT.
+TMP_CACHE_INDEX_PATH = TMP_PATH / 'dex-tmp-cache-index.sqlite'
+
+# Downloads
+# Objects of at least this size are downloaded in parallel segments, if the server
+# supports HTTP Range requests.
+DOWNLOAD_SEGMENT_MIN_BYTES = 256 * 1024**2
+# Number of parallel segments for large objects. Set to 1 to disable parallel downloads.
+DOWNLOAD_SEGMENT_COUNT = 4
+# Max time to wait for connecting to the server, and between received bytes.
+DOWNLOAD_TIMEOUT_SEC = 60
 
 # Permanent cache
 CACHE_ROOT_DIR = ROOT_PATH / '../../dex-cache'
 assert STATIC_PATH.is_dir()
 
+# Compression codec to use when writing objects to the permanent cache, selected by
+# object type. Valid codecs are 'none', 'xz', 'zstd', 'lz4' and 'gzip'. 'xz' gives the
+# smallest files, but is very slow for large objects. 'zstd' and 'lz4' are much faster,
+# and 'lz4' is the fastest to read. Object types that are not listed use
+# CACHE_DEFAULT_CODEC. The codec is recorded in the cache file extension, so existing
+# cache files remain readable after changing these settings. If the library for a codec
+# is not installed, objects are written uncompressed.
+#
+# Objects of type 'page' are complete HTML pages that are sent to the client as stored,
+# with the codec as the Content-Encoding, so should use a codec that browsers accept.
+CACHE_DEFAULT_CODEC = 'none'
+CACHE_CODEC_DICT = {
+    'df': 'zstd',
+    'html': 'zstd',
+    'pickle': 'zstd',
+    'page': 'gzip',
+}
+
+# Max total size of the permanent cache. When the limit is exceeded, the least recently
+# used datasets are deleted from the cache, in a background thread. Set to None to let
+# the cache grow without limit.
+CACHE_LIMIT_BYTES = 100 * 1024**3
+
+# Datasets that have been accessed within this number of seconds are never evicted from
+# the permanent cache, even if the cache is above its size limit.
+CACHE_EVICT_MIN_AGE_SEC = 60 * 60
+
+# Index of sizes and access times for the objects in the permanent cache. Use
+# tools/cache-report.py to view the index, or to rebuild it from an existing cache.
+CACHE_INDEX_PATH = ROOT_PATH / '../../dex-cache-index.sqlite'
+
 # Path to search for locally stored packages
 # For environments in which no CSV files are available in the local filesystem, point to an empty dir.
 LOCAL_PACKAGE_ROOT_DIR = pathlib.Path('/var/empty')
@@ -97,6 +151,10 @@ assert STATIC_PATH.is_dir()
 # For environments in which no CSV files are available in the local filesystem, point to an empty dir.
 LOCAL_SAMPLE_ROOT_DIR = ROOT_PATH / '../../dex-samples'
 assert STATIC_PATH.is_dir()
+# The list of sample packages is cached, and is rebuilt when files are added to or
+# removed from the sample directory. The directory is checked for changes at most once
+# per this number of seconds.
+SAMPLE_CATALOG_CHECK_SEC = 10
 
 # Set of cell values implicitly interpreted as NaN in CSV files.
 # There are in addition to those declared in EML documents.
@@ -127,6 +185,25 @@ PROFILING_CONFIG_PATH = ROOT_PATH / 'dex/profiling_config.yml'
 SQLITE_PATH = ROOT_PATH / 'sqlite.db'
 assert SQLITE_PATH.is_file()
 
+# Entity lookups are cached in each worker process. An entity that is dropped by one
+# process may still be returned by the other processes for this number of seconds.
+ENTITY_CACHE_TTL_SEC = 60
+# Max number of entities to hold in the cache of each worker process.
+ENTITY_CACHE_MAX_COUNT = 10_000
+
+# Max time for browsers to cache static files without revalidating them. The default,
+# None, makes browsers revalidate on each use, which returns 304 Not Modified if the
+# file has not changed.
+SEND_FILE_MAX_AGE_DEFAULT = None
+
+# Max time for browsers and proxies to cache pre-rendered pages, such as the syntax
+# highlighted EML. After this time, the page is revalidated with its ETag.
+PAGE_MAX_AGE_SEC = 60 * 60
+
+# Max number of parsed EML documents to hold in memory in each worker process. Parsed
+# documents for large packages can use tens of MB each.
+EML_TREE_CACHE_MAX_COUNT = 16
+
 # Max number of cells to read from CSV file. This prevents running out of memory on
 # really large CSV files.
 CSV_MAX_CELLS = 50_000_000
@@ -143,5 +220,67 @@ CSV_SAMPLE_THRESHOLD = 10000
 # Number of bytes in each chunk data in streamed responses.
 CHUNK_SIZE_BYTES = 8192
 
+# Compress text and JSON responses with gzip, or brotli if the brotli package is
+# installed, when accepted by the client. Responses that are not streamed are only
+# compressed if they are at least RESPONSE_COMPRESSION_MIN_BYTES. Disable if compression
+# is done by the web server instead.
+RESPONSE_COMPRESSION_ENABLED = True
+RESPONSE_COMPRESSION_MIN_BYTES = 1024
+# gzip level 1 (fastest) to 9 (smallest), and brotli quality 0 (fastest) to 11 (smallest).
+# Higher levels than the defaults give only slightly smaller responses, at a much higher
+# CPU cost.
+RESPONSE_COMPRESSION_GZIP_LEVEL = 6
+RESPONSE_COMPRESSION_BROTLI_QUALITY = 4
+
+# Add a Server-Timing header with the time spent in each stage of the request, such as
+# lock waits, cache reads and CSV parsing, to all responses. The header is always added
+# for clients that have enabled the debug panel. If SERVER_TIMING_LOG is also set, a
+# breakdown of each timed request is written to the log.
+SERVER_TIMING_ENABLED = False
+SERVER_TIMING_LOG = False
+
+# Serve request, cache, lock and download metrics at /metrics, in the Prometheus text
+# format. Each worker process adds its counts to the METRICS_DB_PATH DB at most once per
+# METRICS_FLUSH_SEC, so the metrics cover all the workers. Only clients with addresses in
+# METRICS_ALLOWED_ADDR_SET can fetch the metrics. Set it to None to allow all clients.
+METRICS_ENABLED = True
+METRICS_DB_PATH = TMP_PATH / 'dex-metrics.sqlite'
+METRICS_FLUSH_SEC = 10
+METRICS_ALLOWED_ADDR_SET = {'127.0.0.1', '::1'}
+
+# Profile requests from clients that send REQUEST_PROFILE_HEADER with
+# REQUEST_PROFILE_TOKEN as the value, or that have enabled the debug panel and have an
+# address in REQUEST_PROFILE_ALLOWED_ADDR_SET. The debug panel cookie can be set by any
+# client, so is not enough by itself. The profiles are stored in REQUEST_PROFILE_DIR,
+# next to the cache, and are listed from the debug panel, for the same clients. Only the
+# REQUEST_PROFILE_MAX_COUNT most recent profiles are kept. The header is ignored if
+# REQUEST_PROFILE_TOKEN is None.
+#
+# If REQUEST_PROFILE_SLOW_SEC is set, all requests are profiled, and the profiles of
+# requests that take at least that many seconds are kept. With cProfile, this roughly
+# doubles the time for pure Python code, so install pyinstrument, which samples the
+# stack instead, before enabling it in production.
+REQUEST_PROFILE_ENABLED = False
+REQUEST_PROFILE_DIR = CACHE_ROOT_DIR / '../dex-profiles'
+REQUEST_PROFILE_MAX_COUNT = 100
+REQUEST_PROFILE_HEADER = 'X-Dex-Profile-Token'
+REQUEST_PROFILE_TOKEN = None
+REQUEST_PROFILE_ALLOWED_ADDR_SET = {'127.0.0.1', '::1'}
+REQUEST_PROFILE_SLOW_SEC = None
+
+# Record the peak memory allocated by Python, and the change in resident set size, for
+# each request and for each object that is created for the disk cache. The records are
+# appended to MEMORY_TRACKING_LOG_PATH, and can be summarized with
+# tools/memory-report.py. The allocation sites of the memory that is still held at the
+# end are logged for requests and objects that use more memory than any earlier ones of
+# the same kind, and at least MEMORY_TRACKING_SNAPSHOT_MIN_BYTES. Temporary memory that
+# was freed before the end is not included. MEMORY_TRACKING_FRAME_COUNT is the number of
+# stack frames that are recorded for each allocation site. Tracing allocations slows
+# down DeX, so this should only be enabled while collecting data.
+MEMORY_TRACKING_ENABLED = False
+MEMORY_TRACKING_LOG_PATH = TMP_PATH / 'dex-memory.jsonl'
+MEMORY_TRACKING_SNAPSHOT_MIN_BYTES = 100 * 1024**2
+MEMORY_TRACKING_FRAME_COUNT = 5
+
 # Pygments style for XML syntax highlighting
 EML_STYLE_NAME = 'perldoc'
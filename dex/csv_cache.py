@@ -2,7 +2,6 @@ import datetime
 import logging
 import math
 
-import pandas as pd
 from flask import current_app as app
 
 import dex.cache
@@ -10,9 +9,12 @@ import dex.csv_parser
 import dex.eml_cache
 import dex.eml_extract
 import dex.exc
+import dex.lazy
 import dex.obj_bytes
 import dex.pasta
 
+pd = dex.lazy.LazyModule('pandas')
+
 log = logging.getLogger(__name__)
 
 
@@ -21,6 +23,35 @@ def get_full_csv(rid):
     return dex.csv_parser.get_parsed_csv(rid, eml_ctx)
 
 
+@dex.cache.disk("dataset-summary", "pickle")
+def get_dataset_summary(rid):
+    """Return a small dict with the information about the CSV that is needed for
+    rendering the HTML pages.
+
+    The pages are only shells that are filled in by the data endpoints, so once the
+    summary is cached, they can be rendered without loading the DataFrames.
+    """
+    eml_ctx = dex.csv_parser.get_eml_ctx(rid)
+    csv_df = dex.csv_parser.get_parsed_csv(rid, eml_ctx)
+    column_list = [
+        dict(
+            col_idx=d['col_idx'],
+            col_name=d['col_name'],
+            pandas_type=d['pandas_type'],
+        )
+        for d in eml_ctx['column_list']
+    ]
+    return dict(
+        row_count=len(csv_df),
+        # The CSV parser stops reading when reaching CSV_MAX_CELLS.
+        is_truncated=len(csv_df) == app.config['CSV_MAX_CELLS'] // len(column_list),
+        column_list=column_list,
+        col_name_list=csv_df.columns.to_list(),
+        datetime_col_dict=get_datetime_col_dict(csv_df, eml_ctx),
+        plottable_col_agg_dict=get_plottable_col_aggregates(csv_df, eml_ctx),
+    )
+
+
 @dex.cache.disk("head", "df")
 def get_csv_head(rid):
     return get_full_csv(rid).head()
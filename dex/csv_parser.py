@@ -6,19 +6,23 @@ corresponding EML documents.
 import logging
 import pprint
 
-import numpy as np
-import pandas as pd
 from flask import current_app as app
 
 import dex.cache
 import dex.db
 import dex.eml_cache
+import dex.eml_date_fmt
 import dex.eml_extract
 import dex.exc
+import dex.lazy
 import dex.obj_bytes
 import dex.pasta
+import dex.timing
 import dex.util
 
+np = dex.lazy.LazyModule('numpy')
+pd = dex.lazy.LazyModule('pandas')
+
 log = logging.getLogger(__name__)
 
 
@@ -31,18 +35,35 @@ def get_parsed_csv_with_context(rid):
     return csv_df, raw_df, eml_ctx
 
 
-# @dex.cache.disk("eml-ctx", "pickle")
 def get_eml_ctx(rid):
-    """Get the EML information that is required for parsing and processing the CSV."""
+    """Get the EML information that is required for parsing and processing the CSV.
+
+    This is the cached context from get_eml_ctx_data(), with the CSV dialect class and
+    the parser and formatter functions added. Those cannot be pickled, so are rebuilt
+    from the cached context on each call, which is fast.
+    """
+    ctx = dict(get_eml_ctx_data(rid))
+    ctx.update(
+        dialect=dex.eml_extract.mk_dialect(ctx['dialect_dict']),
+        parser_dict=get_parser_dict(ctx['column_list']),
+        formatter_dict=get_formatter_dict(ctx['column_list']),
+    )
+    return ctx
+
+
+@dex.cache.disk("eml-ctx", "pickle")
+def get_eml_ctx_data(rid):
+    """Get the parts of the EML context that can be pickled. Only plain data is
+    included, so that the context can be cached, and requests for which it's cached do
+    not have to read or traverse the EML doc.
+    """
     dt_el = dex.eml_cache.get_data_table_el(rid)
     column_list = dex.eml_extract.get_col_attr_list(dt_el)
     ctx = dict(
         column_list=column_list,
-        dialect=dex.eml_extract.get_dialect(dt_el),
+        dialect_dict=dex.eml_extract.get_dialect_dict(dt_el),
         header_line_count=dex.eml_extract.get_header_line_count(dt_el),
         footer_line_count=dex.eml_extract.get_footer_line_count(dt_el),
-        parser_dict=get_parser_dict(column_list),
-        formatter_dict=get_formatter_dict(column_list),
         col_name_list=[d['col_name'] for d in column_list],
         pandas_type_dict={d['col_name']: d['pandas_type'] for d in column_list},
         missing_code_dict={d['col_idx']: d['missing_code_list'] for d in column_list},
@@ -69,88 +90,91 @@ def get_parser_list(column_list):
 
 
 def get_parser(dtype_dict):
-    # TODO: Move parsers to this pattern
-    def parse_date_optimized(date_series_in, date_fmt_str=None):
-        """Date parser optimized for the common case where the same date appears in
-        many rows. The formatter runs only once for each unique date, and the result
-        is applied to all dates in the set.
-        """
-        date_series = {
-            unique_date_ser: pd.to_datetime(unique_date_ser, format=date_fmt_str)
-            for unique_date_ser in date_series_in.unique()
-        }
-        return date_series_in.map(date_series)
-
-    def date_parser(x, fmt_fn):
-        try:
-            return fmt_fn(x)
-        except Exception:
-            return None
+    d = N(**dtype_dict)
+    if d.pandas_type == dex.eml_extract.PandasType.DATETIME:
+        return dex.eml_date_fmt.get_parser_and_formatter_by_key(d.date_fmt_key)['parser']
+    try:
+        return PARSER_DICT[d.pandas_type]
+    except KeyError:
+        raise AssertionError(f'Invalid PandasType: {d.pandas_type}')
 
-    def string_parser(x):
-        return str(x)
 
-    def float_parser(x):
-        try:
-            return float(x)
-        except (ValueError, TypeError):
-            return None
+def get_formatter(dtype_dict):
+    d = N(**dtype_dict)
+    if d.pandas_type == dex.eml_extract.PandasType.DATETIME:
+        return dex.eml_date_fmt.get_parser_and_formatter_by_key(d.date_fmt_key)['formatter']
+    try:
+        return FORMATTER_DICT[d.pandas_type]
+    except KeyError:
+        raise AssertionError(f'Invalid PandasType: {d.pandas_type}')
 
-    def int_parser(x):
-        try:
-            return int(x)
-        except (ValueError, TypeError):
-            # return pd.NA
-            return None
 
-    d = N(**dtype_dict)
+# TODO: Move parsers to this pattern
+def parse_date_optimized(date_series_in, date_fmt_str=None):
+    """Date parser optimized for the common case where the same date appears in
+    many rows. The formatter runs only once for each unique date, and the result
+    is applied to all dates in the set.
+    """
+    date_series = {
+        unique_date_ser: pd.to_datetime(unique_date_ser, format=date_fmt_str)
+        for unique_date_ser in date_series_in.unique()
+    }
+    return date_series_in.map(date_series)
 
-    if d.pandas_type == dex.eml_extract.PandasType.FLOAT:
-        return float_parser
-    elif d.pandas_type == dex.eml_extract.PandasType.INT:
-        return int_parser
-    elif d.pandas_type == dex.eml_extract.PandasType.CATEGORY:
-        return string_parser
-    elif d.pandas_type == dex.eml_extract.PandasType.DATETIME:
-        return d.date_fmt_dict['parser']
-    elif d.pandas_type == dex.eml_extract.PandasType.STRING:
-        return string_parser
-    else:
-        raise AssertionError(f'Invalid PandasType: {d.pandas_type}')
 
+def string_parser(x):
+    return str(x)
 
-def get_formatter(dtype_dict):
-    def string_formatter(x):
-        return str(x)
 
-    def float_formatter(x):
-        try:
-            return '{:.2f}'.format(x)
-        except (ValueError, TypeError):
-            return None
+def float_parser(x):
+    try:
+        return float(x)
+    except (ValueError, TypeError):
+        return None
 
-    def int_formatter(x):
-        return str(x)
 
-    d = N(**dtype_dict)
+def int_parser(x):
+    try:
+        return int(x)
+    except (ValueError, TypeError):
+        # return pd.NA
+        return None
 
-    if d.pandas_type == dex.eml_extract.PandasType.FLOAT:
-        return float_formatter
-    elif d.pandas_type == dex.eml_extract.PandasType.INT:
-        return int_formatter
-    elif d.pandas_type == dex.eml_extract.PandasType.CATEGORY:
-        return string_formatter
-    elif d.pandas_type == dex.eml_extract.PandasType.DATETIME:
-        return d.date_fmt_dict['formatter']
-    elif d.pandas_type == dex.eml_extract.PandasType.STRING:
-        return string_formatter
-    else:
-        raise AssertionError(f'Invalid PandasType: {d.pandas_type}')
+
+def string_formatter(x):
+    return str(x)
+
+
+def float_formatter(x):
+    try:
+        return '{:.2f}'.format(x)
+    except (ValueError, TypeError):
+        return None
+
+
+def int_formatter(x):
+    return str(x)
+
+
+# Parsers and formatters for the column types, except DATETIME, for which they are
+# created from the date format.
+PARSER_DICT = {
+    dex.eml_extract.PandasType.FLOAT: float_parser,
+    dex.eml_extract.PandasType.INT: int_parser,
+    dex.eml_extract.PandasType.CATEGORY: string_parser,
+    dex.eml_extract.PandasType.STRING: string_parser,
+}
+
+FORMATTER_DICT = {
+    dex.eml_extract.PandasType.FLOAT: float_formatter,
+    dex.eml_extract.PandasType.INT: int_formatter,
+    dex.eml_extract.PandasType.CATEGORY: string_formatter,
+    dex.eml_extract.PandasType.STRING: string_formatter,
+}
 
 
 def get_derived_dtypes_from_eml(rid):
-    dt_el = dex.eml_cache.get_data_table_el(rid)
-    return dex.eml_extract.get_col_attr_list(dt_el)
+    return get_eml_ctx_data(rid)['column_list']
 
 
 @dex.cache.disk("parsed-csv", "df")
@@ -185,11 +209,12 @@ def _get_csv(rid, eml_ctx, do_parse):
     Returns:
         pandas.DataFrame
     """
-    csv_stream = dex.obj_bytes.open_csv(rid)
+    # Limit the number of rows, to prevent running out of memory on very large tables
+    max_row_count = app.config['CSV_MAX_CELLS'] // len(eml_ctx['column_list'])
+    footer_line_count = eml_ctx['footer_line_count']
 
     # Commented lines show the defaults
     arg_dict = dict(
-        filepath_or_buffer=csv_stream,
         header=None,  # Do not use column names from the CSV (we get them from the EML)
         names=eml_ctx['pandas_type_dict'].keys(),  # Use column names from EML
         index_col=False,  # Do not use the first column as the index
@@ -202,8 +227,10 @@ def _get_csv(rid, eml_ctx, do_parse):
         # TODO, check if we can use the C version
         engine='python',
         skiprows=eml_ctx['header_line_count'],
-        skipfooter=eml_ctx['footer_line_count'],
-        nrows=app.config['CSV_MAX_CELLS'] // len(eml_ctx['column_list']),
+        # Pandas does not support skipfooter together with nrows, so the footer lines
+        # are read as rows, and removed after reading. See below.
+        # skipfooter=0,
+        nrows=max_row_count + footer_line_count,
         dialect=eml_ctx['dialect'],  # Use dialect from EML, not inferred
         # We cannot skip blank lines here, as we need the number of rows of the parsed
         # CSV to always match that of the raw CSV.
@@ -276,13 +303,25 @@ def _get_csv(rid, eml_ctx, do_parse):
 
     log.debug('#' * 100)
     log.debug(f'pd.read_csv() kwargs:\n{pprint.pformat(arg_dict)}')
-    log.debug(f'pd.read_csv() dialect:\n{pprint.pformat(eml_ctx["dialect"].__dict__)}')
+    log.debug(f'pd.read_csv() dialect:\n{pprint.pformat(eml_ctx["dialect_dict"])}')
     log.debug('#' * 100)
 
-    try:
-        csv_df = pd.read_csv(**arg_dict)
-    except ValueError as e:
-        raise dex.exc.CSVError(str(e))
+    # If the CSV must be downloaded, parsing starts while the download is in progress.
+    with dex.obj_bytes.open_csv_stream(rid) as csv_stream:
+        try:
+            # When parsing, the values are converted by the converters while reading.
+            with dex.timing.span('csv-convert' if do_parse else 'csv-read'):
+                csv_df = pd.read_csv(csv_stream, **arg_dict)
+        except ValueError as e:
+            raise dex.exc.CSVError(str(e))
+
+    # If fewer rows than requested were read, the whole table was read, and the last
+    # rows are the footer lines. Else, the table was truncated at the row limit, and
+    # the footer lines were not reached.
+    if len(csv_df) < arg_dict['nrows']:
+        csv_df = csv_df.iloc[: len(csv_df) - footer_line_count]
+    else:
+        csv_df = csv_df.iloc[:max_row_count]
 
     if do_parse:
         # print(csv_df.describe())
@@ -300,7 +339,8 @@ def _get_csv(rid, eml_ctx, do_parse):
 
     # The initially generated DF is fragmented and may cause performance warnings.
     # Returning a copy creates a defragmented version of the DF.
-    return csv_df.copy()
+    with dex.timing.span('csv-copy'):
+        return csv_df.copy()
 
 
 def apply_nan(df, nan_set: set):
@@ -1,6 +1,10 @@
 import collections
+import functools
 import logging
+import os
 import sqlite3
+import threading
+import time
 
 import flask
 from flask import current_app as app
@@ -10,6 +14,46 @@ import dex.pasta
 
 log = logging.getLogger(__name__)
 
+# (SQLITE_PATH, row_id) -> (entity namedtuple, timestamp)
+# Entities are looked up many times while rendering a single page, and by every cache
+# path computation, while they only change when they are dropped or cleared. Lookups
+# are cached in each process, and entries are dropped when the entity is modified by
+# this process. An entity that is dropped by another process remains visible here for
+# at most ENTITY_CACHE_TTL_SEC.
+entity_cache_dict = collections.OrderedDict()
+entity_cache_lock = threading.Lock()
+
+# Connections are kept open for the lifetime of the thread that created them, instead of
+# being opened for each request. sqlite3 connections cannot be shared between threads,
+# and must not be used after a fork, so they are held in a thread local dict, keyed by
+# pid and the path to the DB.
+#
+# The connections are intentionally not closed at the end of each request. The request
+# threads of uWSGI and gunicorn are reused for the life of the worker, so there is at
+# most one connection per worker thread. When a thread exits, its thread local dict is
+# released, which closes its connections.
+connection_local = threading.local()
+
+# Max time to wait for another process to release a write lock on the DB.
+SQLITE_TIMEOUT_SEC = 30
+
+# Schema changes, applied in order to bring a DB up to date. The number of migrations
+# that have been applied to a DB is tracked in its user_version pragma. The base schema
+# is in schema.sql. Migrations are only ever appended to this list.
+MIGRATION_LIST = [
+    # 1: Unique index on dist_url. Entities are looked up by dist_url on every request
+    # that comes in from PASTA, and the index also enforces that add_entity() does not
+    # create duplicates when called concurrently. Duplicates from before the index
+    # existed are removed, keeping the one with the lowest row_id.
+    """
+    delete from entity
+    where id not in (select min(id) from entity group by dist_url);
+    create unique index if not exists entity_dist_url_uindex on entity (dist_url);
+    """,
+]
+migrated_path_set = set()
+migrate_lock = threading.Lock()
+
 
 def add_entity(dist_url, meta_url, data_url):
     """Add a new entity in the database and return its row_id.
@@ -22,26 +66,30 @@ def add_entity(dist_url, meta_url, data_url):
     # Tried using 'replace into' here, but it causes the id to increase, which could
     # break existing URLs. We want the id to remain constant, so have to do things in a
     # bit of a cumbersome way.
+    row_id = get_rid_by_dist_url(dist_url)
+    if row_id is not None:
+        return row_id
     cnx = get_db()
     try:
-        row_id = query_db(
-            """select id from entity e where dist_url = ?""",
-            (dist_url,),
-            db=cnx,
-        )
-        if row_id:
-            return row_id[0].id
-        return query_id(
+        # 'or ignore' handles the case where another process adds the same dist_url
+        # after we checked for it above.
+        cur = cnx.execute(
             """
-            insert into entity
+            insert or ignore into entity
             (dist_url, meta_url, data_url) 
             values (?, ?, ?)
             """,
             (dist_url, meta_url, data_url),
-            db=cnx,
         )
+        is_inserted = cur.rowcount == 1
+        cur.close()
     finally:
         cnx.commit()
+    row_id = get_rid_by_dist_url(dist_url)
+    if is_inserted:
+        # SQLite may reuse the row_id of an entity that was deleted by another process.
+        _invalidate_entity_cache(row_id)
+    return row_id
 
 
 def get_entity(row_id):
@@ -49,6 +97,23 @@ def get_entity(row_id):
 
     namedtuple members: dist_url, meta_url, data_url
     """
+    key = (app.config['SQLITE_PATH'], row_id)
+    now_ts = time.time()
+    with entity_cache_lock:
+        entity_tup, cache_ts = entity_cache_dict.get(key, (None, None))
+        if entity_tup is not None and now_ts - cache_ts < app.config['ENTITY_CACHE_TTL_SEC']:
+            entity_cache_dict.move_to_end(key)
+            return entity_tup
+    entity_tup = _get_entity(row_id)
+    with entity_cache_lock:
+        entity_cache_dict[key] = entity_tup, now_ts
+        entity_cache_dict.move_to_end(key)
+        while len(entity_cache_dict) > app.config['ENTITY_CACHE_MAX_COUNT']:
+            entity_cache_dict.popitem(last=False)
+    return entity_tup
+
+
+def _get_entity(row_id):
     try:
         row_tup = query_db(
             """
@@ -84,6 +149,7 @@ def get_entity_as_dict(row_id):
 
 
 def drop_entity(row_id):
+    _invalidate_entity_cache(row_id)
     cnx = get_db()
     try:
         query_db(
@@ -100,6 +166,7 @@ def clear_entities():
     filesystem caches, to force everything to be reprocessed.
     """
     log.debug('Clearing entities from DB')
+    _invalidate_entity_cache()
     cnx = get_db()
     try:
         row_list = query_db("""delete from entity;""", (), db=cnx)
@@ -114,10 +181,15 @@ def get_rid_list_by_package_id(package_id):
     """Return a list of PASTA identifiers for a given PackageID (scope.identifier.version)."""
     if not dex.pasta.is_package_id(package_id):
         raise dex.exc.DexError(f"Invalid PackageID: {package_id}")
+    # Select the dist_urls that start with the package URL with a range query, which is
+    # resolved by the dist_url index, unlike 'like'. The trailing slash prevents, e.g.,
+    # version 1 from matching version 10.
+    prefix_str = package_id.rstrip('/') + '/'
+    end_str = prefix_str[:-1] + chr(ord(prefix_str[-1]) + 1)
     row_list = query_db(
         """select id
-        from entity where dist_url like ? || '%';""",
-        (package_id,),
+        from entity where dist_url >= ? and dist_url < ?;""",
+        (prefix_str, end_str),
         one=False,
     )
     return [row.id for row in row_list]
@@ -185,26 +257,110 @@ def namedtuple_factory(cursor, row):
     Usage:
     con.row_factory = namedtuple_factory
     """
-    fields = [col[0] for col in cursor.description]
-    Row = collections.namedtuple("Row", fields)
+    Row = _get_row_class(tuple(col[0] for col in cursor.description))
     return Row(*row)
 
 
+@functools.lru_cache(maxsize=256)
+def _get_row_class(field_tup):
+    """Return a namedtuple class for the fields. Creating a namedtuple class is slow, so
+    the class is shared by all rows with the same fields.
+    """
+    return collections.namedtuple("Row", field_tup)
+
+
+def _invalidate_entity_cache(row_id=None):
+    """Remove an entity from the entity cache, or all entities if row_id is None."""
+    with entity_cache_lock:
+        if row_id is None:
+            entity_cache_dict.clear()
+        else:
+            entity_cache_dict.pop((app.config['SQLITE_PATH'], row_id), None)
+
+
 def get_db():
-    db = getattr(flask.g, "_database", None)
+    """Return the connection to the DB for this thread, opening it if required."""
+    cnx_dict = connection_local.__dict__.setdefault('cnx_dict', {})
+    key = (os.getpid(), app.config["SQLITE_PATH"])
+    db = cnx_dict.get(key)
     if db is None:
-        db = flask.g._database = sqlite3.connect(app.config["SQLITE_PATH"].as_posix())
-    # Return namedtuples.
-    db.row_factory = namedtuple_factory
+        db = cnx_dict[key] = _connect(app.config["SQLITE_PATH"])
     return db
 
 
+def close_db():
+    """Close the connections to the DB that are held by this thread. This is only
+    required when the thread continues to run, but will not use the DB again, such as
+    when a test replaces the DB.
+    """
+    cnx_dict = connection_local.__dict__.setdefault('cnx_dict', {})
+    while cnx_dict:
+        cnx_dict.popitem()[1].close()
+
+
 def init_db():
     with flask.current_app.app_context():
         db = get_db()
         with flask.current_app.open_resource("schema.sql", mode="r") as f:
             db.cursor().executescript(f.read())
         db.commit()
+        migrate_db(db)
+
+
+def migrate_db(db):
+    """Apply any migrations in MIGRATION_LIST that have not yet been applied to the DB."""
+    # An empty DB has not yet been initialized by init_db().
+    if not db.execute("select name from sqlite_master where name = 'entity'").fetchone():
+        return
+    if db.execute("pragma user_version").fetchone()[0] >= len(MIGRATION_LIST):
+        return
+    # Another process may apply the migrations while we wait for the write lock, so the
+    # version is read again, and the migrations are applied, in the same transaction.
+    # The statements are run one by one, as executescript() would commit the
+    # transaction.
+    db.execute("begin immediate")
+    try:
+        version = db.execute("pragma user_version").fetchone()[0]
+        for migration_idx in range(version, len(MIGRATION_LIST)):
+            log.info(f'Applying DB migration {migration_idx + 1}')
+            for statement_str in _split_sql(MIGRATION_LIST[migration_idx]):
+                db.execute(statement_str)
+            db.execute(f"pragma user_version = {migration_idx + 1}")
+        db.commit()
+    except sqlite3.Error:
+        db.rollback()
+        raise
+    # Entities may have been removed by the migration.
+    _invalidate_entity_cache()
+
+
+def _split_sql(script_str):
+    """Split an SQL script into statements. Statements must end at the end of a line."""
+    statement_list = []
+    statement_str = ''
+    for line_str in script_str.splitlines(keepends=True):
+        statement_str += line_str
+        if sqlite3.complete_statement(statement_str):
+            statement_list.append(statement_str.strip())
+            statement_str = ''
+    if statement_str.strip():
+        statement_list.append(statement_str.strip())
+    return statement_list
+
+
+def _connect(db_path):
+    db = sqlite3.connect(db_path.as_posix(), timeout=SQLITE_TIMEOUT_SEC)
+    # Write-ahead logging lets readers proceed while another process is writing. With
+    # WAL, synchronous=normal is still safe from corruption, and avoids a sync per commit.
+    db.execute("pragma journal_mode = wal")
+    db.execute("pragma synchronous = normal")
+    # Return namedtuples.
+    db.row_factory = namedtuple_factory
+    with migrate_lock:
+        if db_path not in migrated_path_set:
+            migrate_db(db)
+            migrated_path_set.add(db_path)
+    return db
 
 
 class OneError(Exception):
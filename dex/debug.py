@@ -3,23 +3,49 @@ import logging
 
 # from flask import current_app as app
 import flask
-import pandas as pd
 
+import dex.cache
 import dex.csv_cache
 import dex.csv_parser
 import dex.eml_cache
 import dex.eml_extract
+import dex.lazy
 import dex.util
 
+pd = dex.lazy.LazyModule('pandas')
+
 log = logging.getLogger(__name__)
 
 
 def debug(rid):
-    # return
+    """Return the context for the debug panel placeholder in the page, or None if the
+    debug panel is not enabled.
 
+    The panel itself is fetched by the client after the page has loaded, so that
+    enabling the panel does not add to the time for rendering the page. See
+    get_debug_panel_dict().
+    """
     if not flask.g.debug_panel:
         return
+    return dict(url=f'/dex/debug/{rid}')
+
+
+def get_debug_panel_dict(rid):
+    """Return the values for the debug panel template."""
+    # flask_g_html = dict_to_kv_html(dict(flask.g))
+    return dict(
+        flask_g_html=dict_to_html(flask.current_app.config, 'Config', 'Value'),
+        profile_list_url=f'/dex/debug/profiles?rid={rid}',
+        **get_debug_dict(rid),
+    )
+
 
+@dex.cache.disk('debug', 'pickle')
+def get_debug_dict(rid):
+    """Return the parts of the debug panel that are derived from the CSV and EML for
+    the rid. These require loading the CSV, so are cached with the other objects for
+    the rid.
+    """
     _csv_df, raw_df, ctx = dex.csv_parser.get_parsed_csv_with_context(rid)
 
     ctx = N(**ctx)
@@ -50,9 +76,6 @@ def debug(rid):
     buf = io.StringIO()
     col_info_txt = buf.getvalue()
 
-    # flask_g_html = dict_to_kv_html(dict(flask.g))
-    flask_g_html = dict_to_html(flask.current_app.config, 'Config', 'Value')
-
     type_list = [d['pandas_type'] for d in ctx.column_list]
     type_count = count_unique(type_list)
 
@@ -73,7 +96,6 @@ def debug(rid):
     ]
 
     dbg = {
-        'flask_g_html': flask_g_html,
         # 'column_list': to_html(),
         # ctx: ctx,
         **{
@@ -93,7 +115,7 @@ def debug(rid):
                 dialect=dex.csv_parser.get_dialect_as_dict(ctx.dialect),
             ),
             'derived_dtype_html': pd.DataFrame.from_dict({d['col_name']: d for d in column_list})
-            .style.applymap(highlight_types)
+            .style.map(highlight_types)
             .to_html(),
             'type_count_html': dict_to_html(type_count, 'Type', 'Count'),
             # 'number_type_count_html': dict_to_html(number_type_count, 'Type', 'Count'),
@@ -1,8 +1,12 @@
 """PASTA and EML utils"""
 
+import collections
+import copy
 import datetime
 import logging
+import threading
 
+import flask
 import lxml.etree
 
 import dex.cache
@@ -26,6 +30,14 @@ PYGMENTS_STYLE_LIST = [
 
 log = logging.getLogger(__name__)
 
+# (CACHE_ROOT_DIR, rid) -> (mtime_ns of the cached EML file, parsed ElementTree)
+# The disk cache stores the EML as XML, so each read of the 'etree' object re-parses the
+# full document, which can be several MB for packages with many data tables. Parsed trees
+# are held here, and are reused for as long as the cached file is unchanged. The trees
+# are shared between callers, so must not be modified. See get_eml_etree_copy().
+eml_tree_dict = collections.OrderedDict()
+eml_tree_lock = threading.Lock()
+
 # Default start and end datetimes used in the UI if the EML lists one or more datetime
 # columns, but no datetime ranges.
 FALLBACK_BEGIN_DATETIME = datetime.datetime(
@@ -95,6 +107,29 @@ def get_eml_as_highlighted_html(rid):
     return dex.util.get_etree_as_highlighted_html(root_el)
 
 
+@dex.cache.disk('eml-page', 'page')
+def get_eml_page(rid):
+    """Return the syntax highlighted EML as a complete, standalone HTML page.
+
+    The page is stored in the cache with the codec configured for the 'page' object
+    type, and is sent to the client without being decompressed. See get_eml_page_path().
+    """
+    eml_html, eml_css = get_eml_as_highlighted_html(rid)
+    return flask.render_template('eml-page.html', eml_html=eml_html, eml_css=eml_css)
+
+
+def get_eml_page_path(rid):
+    """Return (path, codec) for the cached page created by get_eml_page(), creating
+    the page if it is not already in the cache.
+    """
+    if not dex.cache.is_cached(rid, 'eml-page', 'page'):
+        get_eml_page(rid)
+    # The file is sent without being read through the cache, so the access is recorded
+    # here.
+    dex.cache.touch(rid)
+    return dex.cache.get_cache_path(rid, 'eml-page', 'page')
+
+
 # Read from the EML doc
 
 # Read the EML attribute fragments that declare the types and other information for each
@@ -106,29 +141,26 @@ def get_eml_as_highlighted_html(rid):
 # TODO: Find best way to cache dict of etree.
 def get_attributes_as_etree(rid):
     dt_el = get_data_table_el(rid)
+    attr_xpath = dex.eml_extract.get_xpath('.//attributeList/attribute')
     return {
         # Using this pattern, of creating a dict with the column index as the key
         # since we can't be sure that the attributes will always be stored in column
         # order in the EML doc.
         col_idx: attr_el
-        for col_idx, attr_el in enumerate(dt_el.xpath('.//attributeList/attribute'))
+        for col_idx, attr_el in enumerate(attr_xpath(dt_el))
     }
 
 
-@dex.cache.disk('csv_name', 'text')
 def get_csv_name(rid):
-    dt_el = get_data_table_el(rid)
-    return dex.eml_extract.first_str_orig(dt_el, './/physical/objectName/text()')
+    return get_eml_summary(rid)['csv_name']
 
 
-# @dex.cache.disk('pkg_id_str', 'text')
 def get_pkg_id_str(rid):
     """Return the Package ID for the given rid.
 
     E.g., 'knb-lter-pie.41.4'
     """
-    eml_el = get_eml_etree(rid)
-    return dex.eml_extract.first_str_orig(eml_el, '/eml:eml/@packageId')
+    return get_eml_summary(rid)['pkg_id_str']
 
 
 def get_pkg_id_dict(rid):
@@ -154,13 +186,28 @@ def get_pkg_id_dict(rid):
     }
 
 
-# @dex.cache.disk('datatable', 'etree')
 def get_data_table_el(rid):
+    """Return the dataTable element for the rid.
+
+    The element is parsed from the XML fragment in the EML summary, so is not connected
+    to the full EML tree, and can be modified by the caller.
+    """
+    return lxml.etree.fromstring(get_eml_summary(rid)['data_table_xml'])
+
+
+@dex.cache.disk('eml-summary', 'pickle')
+def get_eml_summary(rid):
+    """Return the values that are needed for rendering most pages, as a small dict that
+    can be read from the cache without parsing the full EML document.
+    """
     dist_url = dex.db.get_dist_url(rid)
     eml_el = get_eml_etree(rid)
     dt_el = dex.eml_extract.get_data_table_by_dist_url(eml_el, dist_url)
-    # log.debug(f'dt_el="{dex.util.get_etree_as_pretty_printed_xml(dt_el)}"')
-    return dt_el
+    return {
+        'pkg_id_str': dex.eml_extract.first_str_orig(eml_el, '/eml:eml/@packageId'),
+        'csv_name': dex.eml_extract.first_str_orig(dt_el, './/physical/objectName/text()'),
+        'data_table_xml': lxml.etree.tostring(dt_el, with_tail=False),
+    }
 
 
 @dex.cache.disk('eml', 'xml')
@@ -169,8 +216,54 @@ def get_eml_xml(rid):
     return dex.util.get_etree_as_pretty_printed_xml(root_el)
 
 
-@dex.cache.disk('eml', 'etree')
 def get_eml_etree(rid):
+    """Return the parsed EML document for the rid.
+
+    The returned tree is shared with other callers in this process, and must not be
+    modified. Use get_eml_etree_copy() to get a tree that can be modified.
+    """
+    key = flask.current_app.config['CACHE_ROOT_DIR'], rid
+    mtime_ns = _get_eml_mtime_ns(rid)
+    with eml_tree_lock:
+        cached_mtime_ns, eml_tree = eml_tree_dict.get(key, (None, None))
+        is_hit = mtime_ns is not None and mtime_ns == cached_mtime_ns
+        if is_hit:
+            eml_tree_dict.move_to_end(key)
+    if is_hit:
+        # The cached file is not read, so the access is recorded separately.
+        dex.cache.touch(rid)
+        return eml_tree
+    eml_tree = _get_eml_etree(rid)
+    # The cached file is written by the first call, and does not exist if the disk cache
+    # is disabled.
+    mtime_ns = _get_eml_mtime_ns(rid)
+    if mtime_ns is not None:
+        with eml_tree_lock:
+            eml_tree_dict[key] = mtime_ns, eml_tree
+            eml_tree_dict.move_to_end(key)
+            while len(eml_tree_dict) > flask.current_app.config['EML_TREE_CACHE_MAX_COUNT']:
+                eml_tree_dict.popitem(last=False)
+    return eml_tree
+
+
+def get_eml_etree_copy(rid):
+    """Return a private copy of the parsed EML document, which the caller can modify."""
+    return copy.deepcopy(get_eml_etree(rid))
+
+
+def _get_eml_mtime_ns(rid):
+    """Return the modified time of the cached EML file, or None if it is not cached."""
+    if not dex.cache.is_cached(rid, 'eml', 'etree'):
+        return None
+    cache_path, codec = dex.cache.get_cache_path(rid, 'eml', 'etree')
+    try:
+        return cache_path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+@dex.cache.disk('eml', 'etree')
+def _get_eml_etree(rid):
     eml_path = dex.obj_bytes.open_eml(rid)
     try:
         return lxml.etree.parse(eml_path.as_posix())
@@ -10,22 +10,41 @@ log = logging.getLogger(__name__)
 
 
 def get_datetime_parser_and_formatter(col_name, iso_str):
-    date_format_fn_dict = EML_DATE_FORMAT_TO_CUSTOM_DATETIME_PARSER_DICT.get(iso_str)
-    if date_format_fn_dict:
-        return mk_fn_dict2(date_format_fn_dict)
+    fmt_key = get_datetime_fmt_key(col_name, iso_str)
+    if fmt_key:
+        return get_parser_and_formatter_by_key(fmt_key)
+
+
+def get_datetime_fmt_key(col_name, iso_str):
+    """Return a key from which the parser and formatter for the datetime format can be
+    created with get_parser_and_formatter_by_key(). Unlike the parser and formatter,
+    the key is a tuple of strings, so can be pickled and cached.
+
+    Return None if the format is not supported.
+    """
+    if iso_str in EML_DATE_FORMAT_TO_CUSTOM_DATETIME_PARSER_DICT:
+        return 'custom', iso_str
 
     date_format_c_str = EML_DATE_FORMAT_TO_CTIME_DICT.get(iso_str)
     if date_format_c_str:
-        return mk_fn_dict(date_format_c_str)
+        return 'c', date_format_c_str
 
     date_format_c_str = iso8601_to_c_format(iso_str)
     if date_format_c_str:
-        return mk_fn_dict(date_format_c_str)
+        return 'c', date_format_c_str
 
     # For many "year" columns, there is no date format string in the EML. In
     # these cases, we make a guess at the format.
     if col_name.upper() == 'YEAR':
-        return 'YYYY'
+        return 'c', '%Y'
+
+
+@functools.lru_cache(maxsize=None)
+def get_parser_and_formatter_by_key(fmt_key):
+    fmt_type, fmt_str = fmt_key
+    if fmt_type == 'custom':
+        return mk_fn_dict2(EML_DATE_FORMAT_TO_CUSTOM_DATETIME_PARSER_DICT[fmt_str])
+    return mk_fn_dict(fmt_str)
 
 
 def mk_fn_dict(c_format_str):
@@ -10,6 +10,7 @@ import csv
 import datetime
 import enum
 import logging
+import threading
 
 import lxml.etree
 
@@ -29,6 +30,10 @@ DEFAULT_RECORD_DELIMITER = r'\n'
 DEFAULT_FIELD_DELIMITER = ','
 DEFAULT_QUOTE_CHARACTER = '"'
 
+# Compiled XPath expressions, keyed by (xpath, namespaces). Evaluation of an XPath
+# object is serialized by lxml, so each thread holds its own compiled copies.
+xpath_local = threading.local()
+
 
 class PandasType(str, enum.Enum):
     FLOAT = 'FLOAT'  # enum.auto()
@@ -50,6 +55,13 @@ PANDAS_TO_FRIENDLY_DICT = {
 
 
 def get_dialect(dt_el):
+    return mk_dialect(get_dialect_dict(dt_el))
+
+
+def get_dialect_dict(dt_el):
+    """Return the CSV dialect declared in the EML, as a dict of csv.Dialect attributes.
+    Unlike the Dialect class, the dict can be pickled.
+    """
     text_format_el = first(dt_el, './/physical/dataFormat/textFormat')
 
     def decode(s):
@@ -58,37 +70,47 @@ def get_dialect(dt_el):
         """
         return bytes(s, "utf-8").decode("unicode_escape")
 
-    # https://docs.python.org/3/library/csv.html#csv.Dialect
-    class Dialect(csv.Dialect):
-        _delimiter = first_str(
-            text_format_el,
-            'simpleDelimited/fieldDelimiter/text()',
-            DEFAULT_FIELD_DELIMITER,
-        )
-        _lineterminator = first_str(
-            text_format_el,
-            'recordDelimiter/text()',
-            DEFAULT_RECORD_DELIMITER,
-        )
-        _quotechar = first_str(
-            text_format_el,
-            'quoteCharacter/text()',
-            DEFAULT_QUOTE_CHARACTER,
-        )
+    return dict(
+        delimiter=decode(
+            first_str(
+                text_format_el,
+                'simpleDelimited/fieldDelimiter/text()',
+                DEFAULT_FIELD_DELIMITER,
+            )
+        ),
+        lineterminator=decode(
+            first_str(
+                text_format_el,
+                'recordDelimiter/text()',
+                DEFAULT_RECORD_DELIMITER,
+            )
+        ),
+        quotechar=decode(
+            first_str(
+                text_format_el,
+                'quoteCharacter/text()',
+                DEFAULT_QUOTE_CHARACTER,
+            )
+        ),
+        doublequote=True,
+        escapechar=None,
+        quoting=csv.QUOTE_MINIMAL,
+        skipinitialspace=True,
+        strict=False,
+    )
 
-        delimiter = decode(_delimiter)
-        lineterminator = decode(_lineterminator)
-        quotechar = decode(_quotechar)
 
-        doublequote = True
-        escapechar = None
-        quoting = csv.QUOTE_MINIMAL
-        skipinitialspace = True
-        strict = False
+def mk_dialect(dialect_dict):
+    """Create a csv.Dialect class from a dict returned by get_dialect_dict()."""
 
+    # https://docs.python.org/3/library/csv.html#csv.Dialect
+    class Dialect(csv.Dialect):
         def __repr__(self):
             return f'<Dialect {self.__class__.__name__} {self.__dict__}>'
 
+    for k, v in dialect_dict.items():
+        setattr(Dialect, k, v)
+
     return Dialect
 
 
@@ -112,23 +134,22 @@ def get_col_attr_list(dt_el):
     """Get set of column attributes for a CSV file."""
     col_attr_list = []
     # Iterate over 'attribute' elements, one for each column
-    attr_list = list(dt_el.xpath('.//attributeList/attribute'))
+    attr_list = list(get_xpath('.//attributeList/attribute')(dt_el))
 
     used_col_name_set = set()
 
     for col_idx, attr_el in enumerate(attr_list):
-        col_name = first_str_orig(attr_el, './/attributeName/text()')
-        pandas_type = derive_pandas_type(attr_el)
+        field_dict = get_attr_field_dict(attr_el)
+        col_name = field_dict['col_name']
+        pandas_type = _derive_pandas_type(field_dict)
 
         date_fmt_str = None
-        date_fmt_dict = None
+        date_fmt_key = None
         if pandas_type == PandasType.DATETIME:
-            date_fmt_str = get_date_fmt_str(attr_el, col_name)
+            date_fmt_str = field_dict['date_fmt_str']
             if dex.eml_date_fmt.has_absolute_time(date_fmt_str):
-                date_fmt_dict = dex.eml_date_fmt.get_datetime_parser_and_formatter(
-                    col_name, date_fmt_str
-                )
-            if not date_fmt_dict:
+                date_fmt_key = dex.eml_date_fmt.get_datetime_fmt_key(col_name, date_fmt_str)
+            if not date_fmt_key:
                 pandas_type = PandasType.STRING
 
         # Some CSV files have duplicate column names. Because we use column names
@@ -140,9 +161,7 @@ def get_col_attr_list(dt_el):
             unique_col_idx += 1
         used_col_name_set.add(unique_col_name)
 
-        missing_code_list = list(
-            sorted(set(multiple_str(attr_el, './/missingValueCode/code/text()')))
-        )
+        missing_code_list = list(sorted(set(field_dict['missing_code_list'])))
 
         col_attr_list.append(
             dict(
@@ -151,7 +170,9 @@ def get_col_attr_list(dt_el):
                 pandas_type=pandas_type,
                 date_fmt_str=date_fmt_str,
                 # c_date_fmt_str=c_date_fmt_str,
-                date_fmt_dict=date_fmt_dict,
+                # Key for the datetime parser and formatter. The functions themselves
+                # are not included, so that the list can be pickled.
+                date_fmt_key=date_fmt_key,
                 missing_code_list=missing_code_list,
             )
         )
@@ -176,12 +197,16 @@ def derive_pandas_type(attr_el):
     timedelta[ns]  NA            NA    Differences between two datetimes
     category       NA            NA    Finite list of text values
     """
-    if has_el(attr_el, 'enumeratedDomain'):
+    return _derive_pandas_type(get_attr_field_dict(attr_el))
+
+
+def _derive_pandas_type(field_dict):
+    if 'enumeratedDomain' in field_dict['el_name_set']:
         return PandasType.CATEGORY
-    if has_el(attr_el, 'dateTime'):
+    if 'dateTime' in field_dict['el_name_set']:
         return PandasType.DATETIME
-    if has_el(attr_el, 'numericDomain'):
-        number_type = first_str(attr_el, './/numberType/text()')
+    if 'numericDomain' in field_dict['el_name_set']:
+        number_type = field_dict['number_type']
         if number_type in ('real', 'natural'):
             return PandasType.FLOAT
         if number_type in ('integer', 'whole'):
@@ -195,17 +220,77 @@ def get_date_fmt_str(attr_el, col_name):
     return first_str(attr_el, './/measurementScale/dateTime/formatString/text()')
 
 
+def get_attr_field_dict(attr_el):
+    """Extract the values that are required for processing a column, from the
+    'attribute' element that describes the column.
+
+    This does a single pass over the elements in the attribute, instead of evaluating
+    a separate XPath expression for each value. The values match those returned by the
+    XPath based functions:
+
+    col_name: first_str_orig(attr_el, './/attributeName/text()')
+    el_name_set: Names of all elements in the attribute, for has_el()
+    number_type: first_str(attr_el, './/numberType/text()')
+    date_fmt_str: get_date_fmt_str()
+    missing_code_list: multiple_str(attr_el, './/missingValueCode/code/text()')
+    """
+    col_name = None
+    number_type = None
+    date_fmt_str = None
+    el_name_set = set()
+    missing_code_list = []
+    for el in attr_el.iterdescendants():
+        tag = el.tag
+        # Skip comments and processing instructions
+        if not isinstance(tag, str):
+            continue
+        el_name_set.add(tag)
+        text = el.text
+        if text is None:
+            continue
+        if tag == 'attributeName':
+            if col_name is None:
+                col_name = text
+        elif tag == 'numberType':
+            if number_type is None:
+                number_type = text
+        elif tag == 'formatString':
+            if date_fmt_str is None and _has_parents(el, 'dateTime', 'measurementScale'):
+                date_fmt_str = text
+        elif tag == 'code':
+            if _has_parents(el, 'missingValueCode'):
+                missing_code_list.append(text)
+    return dict(
+        col_name=str(col_name).strip(),
+        el_name_set=el_name_set,
+        number_type=None if number_type is None else number_type.strip(),
+        date_fmt_str=None if date_fmt_str is None else date_fmt_str.strip(),
+        missing_code_list=missing_code_list,
+    )
+
+
+def _has_parents(el, *tag_tup):
+    """Return True if the parent of el has the first tag, the grandparent has the second
+    tag, and so on.
+    """
+    for tag in tag_tup:
+        el = el.getparent()
+        if el is None or el.tag != tag:
+            return False
+    return True
+
+
 def get_data_table_list(root_el):
     """Return list of dataTable elements in EML doc"""
     if not root_el:
         return []
-    return root_el.xpath('//dataset/dataTable')
+    return get_xpath('//dataset/dataTable')(root_el)
 
 
 def get_data_table_by_dist_url(eml_el, dist_url):
     # Each version of EML has a different namespace, so we skip the root element, and
     # perform a relative search.
-    xpath = lxml.etree.XPath(
+    xpath = get_xpath(
         # The function attribute is not always included, so we don't check for it.
         '//dataset/dataTable/physical/distribution/online/url[text()=$url]/ancestor::dataTable',
     )
@@ -217,7 +302,7 @@ def get_data_table_by_dist_url(eml_el, dist_url):
 
 def get_dist_url_list(eml_el):
     """Return a list of distribution URLs in the EML doc"""
-    el = eml_el.xpath('//dataset/dataTable/physical/distribution/online/url/text()')
+    el = get_xpath('//dataset/dataTable/physical/distribution/online/url/text()')(eml_el)
     return [str(x) for x in el] if el else []
 
 
@@ -226,9 +311,21 @@ def get_dist_url_list(eml_el):
 #
 
 
+def get_xpath(xpath, nsmap=None):
+    """Return a compiled XPath for the xpath string, compiling it on first use."""
+    # XPath does not support a default namespace, so it's removed from the map.
+    ns_tup = tuple(sorted((k, v) for k, v in (nsmap or {}).items() if k is not None))
+    xpath_dict = xpath_local.__dict__.setdefault('xpath_dict', {})
+    key = (xpath, ns_tup)
+    compiled_xpath = xpath_dict.get(key)
+    if compiled_xpath is None:
+        compiled_xpath = xpath_dict[key] = lxml.etree.XPath(xpath, namespaces=dict(ns_tup))
+    return compiled_xpath
+
+
 def has_el(el, el_name):
     """Return True if an element with a given name exists in the branch rooted at el"""
-    return True if el.xpath(f'.//{el_name}') else False
+    return True if get_xpath(f'.//{el_name}')(el) else False
 
 
 def first(el, xpath):
@@ -239,7 +336,7 @@ def first(el, xpath):
     """
     # log.debug(f'first() xpath={xpath} ...')
     nsmap = el.getroot().nsmap if hasattr(el, 'getroot') else {}
-    res_el = el.xpath(f'({xpath})[1]', namespaces=nsmap)
+    res_el = get_xpath(f'({xpath})[1]', nsmap)(el)
     try:
         el = res_el[0]
     except IndexError:
@@ -279,7 +376,7 @@ def first_int(el, text_xpath, default_int=None):
 
 
 def multiple_str(el, text_xpath):
-    el = el.xpath(text_xpath)
+    el = get_xpath(text_xpath)(el)
     return [str(x) for x in el] if el else []
 
 
@@ -46,7 +46,7 @@ def create_subset_eml(
     col_list,
 ):
     """Create EML doc representing a CSV subset"""
-    eml_el = dex.eml_cache.get_eml_etree(rid)
+    eml_el = dex.eml_cache.get_eml_etree_copy(rid)
     dist_url = dex.db.get_dist_url(rid)
     _subset_eml(eml_el, dist_url, row_count, byte_count, md5_checksum, col_list)
     return dex.util.get_etree_as_pretty_printed_xml(eml_el)
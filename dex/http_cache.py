@@ -0,0 +1,85 @@
+"""HTTP caching for views that are derived from the cached objects for a rid.
+
+Pages, plots and lists that are rendered for a rid only depend on the cached objects
+for the rid, the request and the deployed version of DeX. The ETag is created from
+these, so it can be checked before doing any of the work of rendering the response.
+When a browser revalidates a page it has already received, we return 304 Not Modified
+without rendering the page again.
+"""
+import functools
+import hashlib
+import logging
+import pathlib
+
+import flask
+
+import dex.cache
+
+log = logging.getLogger(__name__)
+
+DEX_ROOT_PATH = pathlib.Path(__file__).parent.resolve()
+
+
+def conditional(fn):
+    """Decorator for views that take a rid, adding a weak ETag to the response, and
+    returning 304 Not Modified when the client already has the current version.
+
+    The ETag is weak, as the same ETag is used for the response in all content
+    encodings. dex.compress weakens the ETags of compressed responses, so with a strong
+    ETag, a 304 response would carry another ETag than the 200 response it validates.
+
+    Responses are sent with 'Cache-Control: no-cache', so that clients revalidate on
+    each use, as the cache for the rid may be flushed at any time.
+    """
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        etag = get_etag(kwargs['rid'])
+        if etag is None:
+            return fn(*args, **kwargs)
+        if flask.request.if_none_match.contains_weak(etag):
+            response = flask.Response(status=304)
+        else:
+            response = flask.make_response(fn(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+        response.set_etag(etag, weak=True)
+        response.cache_control.no_cache = True
+        return response
+
+    return wrapper
+
+
+def get_etag(rid):
+    """Return the ETag for the current request for the rid, or None if the response
+    cannot be cached.
+    """
+    generation_str = dex.cache.get_generation(rid)
+    if generation_str is None:
+        return None
+    return hashlib.sha1(
+        '\n'.join(
+            (
+                generation_str,
+                get_deploy_token(),
+                flask.request.full_path,
+                # The debug panel is included in the pages when enabled by cookie.
+                str(flask.g.get('debug_panel', False)),
+            )
+        ).encode('utf-8')
+    ).hexdigest()
+
+
+@functools.cache
+def get_deploy_token():
+    """Return a token that changes when the code or templates of DeX are updated.
+
+    This walks the DeX source tree, so is called once when the app is created, before
+    the worker processes are forked.
+    """
+    mtime_list = [
+        p.stat().st_mtime_ns
+        for p in DEX_ROOT_PATH.rglob('*')
+        if p.suffix in ('.py', '.html', '.yml') and p.is_file()
+    ]
+    return str(max(mtime_list, default=0))
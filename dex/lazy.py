@@ -0,0 +1,76 @@
+"""Lazy imports of heavy libraries.
+
+Importing pandas, bokeh, ydata_profiling and pygments takes several seconds, which is
+paid by every worker on startup and by every test that creates the app. Instead of
+importing them at the top of a module, modules that use them declare a proxy:
+
+    pd = dex.lazy.LazyModule('pandas')
+    bokeh = dex.lazy.LazyModule('bokeh', 'bokeh.embed', 'bokeh.models')
+
+The proxy imports the module, and any listed submodules, on first attribute access, and
+then forwards all attribute access to the module. The import is done by the import
+system, so it's thread safe, and all proxies for the same module share the same module
+object.
+
+When running under uWSGI, preload() can be called in the master process before the
+workers are forked, so that the workers share the memory pages of the imported modules.
+"""
+import importlib
+import logging
+import sys
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+lazy_module_list = []
+lazy_module_lock = threading.Lock()
+
+
+class LazyModule:
+    def __init__(self, module_name, *submodule_names):
+        # Set through __dict__, as __setattr__ is forwarded to the module.
+        self.__dict__['_module_name'] = module_name
+        self.__dict__['_submodule_tup'] = submodule_names
+        self.__dict__['_module'] = None
+        with lazy_module_lock:
+            lazy_module_list.append(self)
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._load(), name, value)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state_str = 'loaded' if self.is_loaded() else 'not loaded'
+        return f'<LazyModule {self._module_name} ({state_str})>'
+
+    def is_loaded(self):
+        return self._module is not None
+
+    def _load(self):
+        module = self._module
+        if module is None:
+            is_new = self._module_name not in sys.modules
+            start_ts = time.time()
+            module = importlib.import_module(self._module_name)
+            for submodule_name in self._submodule_tup:
+                importlib.import_module(submodule_name)
+            if is_new:
+                log.debug(f'Lazy imported {self._module_name} in {time.time() - start_ts:.2f}s')
+            self.__dict__['_module'] = module
+        return module
+
+
+def preload():
+    """Import the modules for all the lazy module proxies that have been declared."""
+    start_ts = time.time()
+    with lazy_module_lock:
+        module_list = list(lazy_module_list)
+    for lazy_module in module_list:
+        lazy_module._load()
+    log.info(f'Preloaded {len(module_list)} lazy modules in {time.time() - start_ts:.2f}s')
@@ -7,29 +7,39 @@ import logging.config
 import mimetypes
 import os
 import pathlib
+import time
 
 import flask
 import flask.logging
-import matplotlib
 
 import dex.cache
+import dex.compress
 import dex.config
 import dex.csv_cache
 import dex.db
 import dex.eml_cache
 import dex.exc
+import dex.http_cache
+import dex.memory
+import dex.metrics
 import dex.pasta
+import dex.request_profile
 import dex.sample
+import dex.timing
 import dex.util
 import dex.views.api
 import dex.views.bokeh_server
+import dex.views.debug
 import dex.views.eml
+import dex.views.metrics
 import dex.views.plot
 import dex.views.profile
 import dex.views.subset
 
-matplotlib.use('Agg')
-
+# Select the non-interactive backend for matplotlib, which is used by ydata_profiling.
+# This is done through the environment instead of calling matplotlib.use(), so that
+# matplotlib is not imported until it is needed.
+os.environ.setdefault("MPLBACKEND", "Agg")
 os.environ.setdefault("FLASK_ENV", "production")
 os.environ.setdefault("FLASK_DEBUG", "0")
 
@@ -48,8 +58,16 @@ def create_app():
     )
 
     _app.config.from_object("dex.config")
+    # Settings in the Python file at DEX_SETTINGS, if set, override those in dex.config.
+    # This allows running an instance against other caches and samples without editing
+    # the config, as done by tools/load-test.py.
+    _app.config.from_envvar("DEX_SETTINGS", silent=True)
     _app.debug = _app.config["FLASK_DEBUG"]
 
+    # Create the token for the ETags of the rid views up front, instead of walking the
+    # source tree in the first request of each worker.
+    dex.http_cache.get_deploy_token()
+
     # Add tojson_pp, a pretty printed version of tojson, to jinja.
     _app.jinja_env.filters['tojson_pp'] = lambda x: json.dumps(
         x, sort_keys=True, indent=4, separators=(', ', ': ')
@@ -61,6 +79,8 @@ def create_app():
     _app.register_blueprint(dex.views.plot.plot_blueprint)
     _app.register_blueprint(dex.views.eml.eml_blueprint)
     _app.register_blueprint(dex.views.api.api_blueprint)
+    _app.register_blueprint(dex.views.debug.debug_blueprint)
+    _app.register_blueprint(dex.views.metrics.metrics_blueprint)
 
     def handle_redirect_to_index(_):
         return flask.redirect("/", 302)
@@ -97,7 +117,11 @@ def create_app():
     @_app.before_request
     def before_request():
         log.debug(f"{flask.request.method} {flask.request.path}")
+        flask.g.request_start_ts = time.perf_counter()
         flask.g.debug_panel = flask.request.cookies.get('debug-panel', 'false') == 'true'
+        dex.timing.start()
+        dex.request_profile.start()
+        dex.memory.start_request()
 
     @_app.after_request
     def after_request(response):
@@ -114,7 +138,26 @@ def create_app():
         response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
         response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
 
-        return response
+        with dex.timing.span('compress'):
+            response = dex.compress.compress_response(response)
+
+        dex.metrics.observe(
+            'dex_request_duration_seconds',
+            time.perf_counter() - flask.g.request_start_ts,
+            endpoint=flask.request.endpoint or 'none',
+            method=flask.request.method,
+            status=response.status_code,
+        )
+        dex.metrics.flush_if_due()
+        response = dex.request_profile.stop(response)
+        dex.memory.end_request(response)
+
+        return dex.timing.add_header(response)
+
+    @_app.teardown_request
+    def teardown_request(_):
+        dex.request_profile.discard()
+        dex.memory.discard()
 
     @_app.route("/favicon.ico")
     def favicon():
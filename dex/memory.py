@@ -0,0 +1,251 @@
+"""Tracking of the memory used by requests and by the functions that create the objects
+in the disk cache, for finding the datasets and views that come close to running out
+of memory.
+
+When MEMORY_TRACKING_ENABLED is set, memory allocations are traced with tracemalloc.
+For each request, and for each object that is created by a function wrapped in
+dex.cache.disk(), we record:
+
+    peak_bytes        The highest amount of memory that was allocated by Python at any
+                      point during the request or function, above what was allocated
+                      when it started
+    rss_delta_bytes   Change in the resident set size of the process
+
+The records are appended as JSON lines to MEMORY_TRACKING_LOG_PATH, and are summarized
+by tools/memory-report.py. When an object created by the function is a table, its cell
+count is included, so the memory used per cell can be compared with CSV_MAX_CELLS.
+
+When a request or function uses more memory than any earlier one of the same name in
+the process, and at least MEMORY_TRACKING_SNAPSHOT_MIN_BYTES, the allocation sites of the
+memory that is still held at the end of the request or function are logged. These are
+retained sites, not peak sites. tracemalloc can only list the allocations that are
+still alive, so temporary buffers that were freed before the end, but contributed to
+the peak, are not included. For objects created for the cache, the snapshot is taken
+while the created object is still referenced, so its allocations are included.
+
+Tracing allocations roughly doubles the time for allocating memory, so this is intended
+to be enabled for limited periods. tracemalloc traces the whole process, so the values
+are only exact when each worker process handles a single request at a time, as is the
+default with uWSGI.
+"""
+import contextlib
+import json
+import logging
+import os
+import pathlib
+import threading
+import time
+import tracemalloc
+
+import flask
+
+log = logging.getLogger(__name__)
+
+# Number of allocation sites to log for the worst requests and functions
+TOP_SITE_COUNT = 10
+
+# Ignore the memory used by tracemalloc, by this module and by imports in the snapshots
+SNAPSHOT_FILTER_LIST = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, __file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+]
+
+# Stack of the scopes that are currently tracked in each thread
+thread_local = threading.local()
+# (kind, name) -> highest peak_bytes seen in this process
+worst_dict = {}
+worst_lock = threading.Lock()
+
+
+class MemoryScope:
+    """Memory used by a request or function.
+
+    tracemalloc only keeps a single peak for the process, so when a scope starts inside
+    another, the peak so far is saved in the outer scope before the peak is reset.
+    """
+
+    def __init__(self):
+        self.start_bytes = tracemalloc.get_traced_memory()[0]
+        self.max_bytes = self.start_bytes
+        self.start_rss_bytes = get_rss_bytes()
+        self.start_ts = time.perf_counter()
+
+    def suspend(self):
+        self.max_bytes = max(self.max_bytes, tracemalloc.get_traced_memory()[1])
+
+    def end(self):
+        self.suspend()
+        end_rss_bytes = get_rss_bytes()
+        return dict(
+            peak_bytes=self.max_bytes - self.start_bytes,
+            rss_bytes=end_rss_bytes,
+            rss_delta_bytes=(
+                None
+                if end_rss_bytes is None or self.start_rss_bytes is None
+                else end_rss_bytes - self.start_rss_bytes
+            ),
+            sec=round(time.perf_counter() - self.start_ts, 3),
+        )
+
+
+def is_enabled():
+    return (
+        flask.has_app_context()
+        and flask.current_app.config['MEMORY_TRACKING_ENABLED']
+        and tracemalloc.is_tracing()
+    )
+
+
+def start_request():
+    """Start tracing allocations if they're not already being traced, and start
+    tracking the memory used by the current request."""
+    if not flask.current_app.config['MEMORY_TRACKING_ENABLED']:
+        return
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(flask.current_app.config['MEMORY_TRACKING_FRAME_COUNT'])
+    flask.g.memory_scope = push_scope()
+
+
+def end_request(response):
+    scope = flask.g.pop('memory_scope', None)
+    if scope is None:
+        return
+    pop_scope(scope)
+    record(
+        scope,
+        kind='request',
+        name=flask.request.endpoint or 'none',
+        rid=(flask.request.view_args or {}).get('rid'),
+        method=flask.request.method,
+        path=flask.request.full_path.rstrip('?'),
+        status=response.status_code,
+    )
+
+
+def discard():
+    """Stop tracking the request if it ended without a response."""
+    scope = flask.g.pop('memory_scope', None)
+    if scope is not None:
+        pop_scope(scope)
+
+
+@contextlib.contextmanager
+def track(name, rid):
+    """Track the memory used in the enclosed block, which creates an object for the
+    disk cache. Yields a dict to which the created object can be added as 'obj', for
+    recording its cell count.
+    """
+    if not is_enabled():
+        yield {}
+        return
+    scope = push_scope()
+    result_dict = {}
+    try:
+        yield result_dict
+    finally:
+        pop_scope(scope)
+        # The created object is still referenced by result_dict, so it's included if
+        # the top allocation sites are logged.
+        record(
+            scope,
+            kind='cache',
+            name=name,
+            rid=rid,
+            cell_count=get_cell_count(result_dict.get('obj')),
+        )
+
+
+def push_scope():
+    stack = get_scope_stack()
+    if stack:
+        stack[-1].suspend()
+    tracemalloc.reset_peak()
+    scope = MemoryScope()
+    stack.append(scope)
+    return scope
+
+
+def pop_scope(scope):
+    stack = get_scope_stack()
+    if scope in stack:
+        stack.remove(scope)
+    if stack:
+        # The peak of the inner scope also counts towards the outer scope.
+        stack[-1].max_bytes = max(stack[-1].max_bytes, scope.max_bytes)
+
+
+def get_scope_stack():
+    if not hasattr(thread_local, 'scope_stack'):
+        thread_local.scope_stack = []
+    return thread_local.scope_stack
+
+
+def record(scope, kind, name, rid, **extra_dict):
+    """Append a record to the log, and log the top allocation sites if this is the
+    worst request or function of its name so far."""
+    record_dict = dict(ts=round(time.time(), 3), pid=os.getpid(), kind=kind, name=name)
+    record_dict.update(rid=None if rid is None else str(rid), **extra_dict)
+    record_dict.update(scope.end())
+    config = flask.current_app.config
+
+    log_path = pathlib.Path(config['MEMORY_TRACKING_LOG_PATH'])
+    log_path.parent.mkdir(parents=True, exist_ok=True)
+    # Records are written with a single call in append mode, so that records from
+    # concurrent processes are not interleaved.
+    try:
+        with open(log_path, 'a') as f:
+            f.write(json.dumps(record_dict) + '\n')
+    except OSError as e:
+        log.warning(f'Unable to write memory tracking record: {e}')
+
+    peak_bytes = record_dict['peak_bytes']
+    with worst_lock:
+        is_worst = peak_bytes > worst_dict.get((kind, name), -1)
+        if is_worst:
+            worst_dict[(kind, name)] = peak_bytes
+    if is_worst and peak_bytes >= config['MEMORY_TRACKING_SNAPSHOT_MIN_BYTES']:
+        log_top_sites(record_dict)
+
+
+def log_top_sites(record_dict):
+    """Log the allocation sites of the memory that is currently held. Memory that was
+    allocated during the request or function, but has already been freed, is not
+    included."""
+    snapshot = tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTER_LIST)
+    line_list = [
+        f'Highest memory use so far for {record_dict["kind"]} {record_dict["name"]} '
+        f'(rid={record_dict["rid"]}): peak {fmt_mib(record_dict["peak_bytes"])}, '
+        f'RSS delta {fmt_mib(record_dict["rss_delta_bytes"])}. '
+        f'Top allocation sites of the memory retained at the end of the '
+        f'{"request" if record_dict["kind"] == "request" else "function"}, which does '
+        f'not include freed temporary memory:'
+    ]
+    for stat in snapshot.statistics('traceback')[:TOP_SITE_COUNT]:
+        line_list.append(f'{fmt_mib(stat.size):>12} in {stat.count:,} blocks')
+        line_list.extend(stat.traceback.format(most_recent_first=True))
+    log.warning('\n'.join(line_list))
+
+
+def get_cell_count(obj):
+    shape = getattr(obj, 'shape', None)
+    if isinstance(shape, tuple) and len(shape) == 2:
+        return shape[0] * shape[1]
+    return None
+
+
+def get_rss_bytes():
+    """Return the resident set size of this process, or None if it's not available on
+    this platform."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
+
+
+def fmt_mib(byte_count):
+    if byte_count is None:
+        return 'n/a'
+    return f'{byte_count / 1024**2:,.1f} MiB'
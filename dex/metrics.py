@@ -0,0 +1,221 @@
+"""Counters and histograms for monitoring DeX, in the Prometheus text format.
+
+Each worker process counts in memory, and adds its counts to a small SQLite database
+that is shared by all the workers at most once per METRICS_FLUSH_SEC. The metrics that
+are returned by any worker then cover all the workers of the instance, and they are
+kept when workers are restarted.
+
+Only counters and histograms are supported, as both can be aggregated by adding the
+counts from each worker. Histograms are stored as cumulative bucket counters, with a
+sum and a count, as in the exposition format.
+
+Counting is done in memory under a lock, so it can be done anywhere, including in
+threads that run outside of a request.
+"""
+import collections
+import contextlib
+import logging
+import math
+import pathlib
+import sqlite3
+import threading
+import time
+
+import flask
+
+log = logging.getLogger(__name__)
+
+# Max time to wait for another process to release a write lock on the DB.
+SQLITE_TIMEOUT_SEC = 30
+
+# Upper bounds of the histogram buckets, in seconds
+BUCKET_TUP = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, math.inf)
+
+# name -> (type, help)
+METRIC_DICT = {
+    'dex_request_duration_seconds': (
+        'histogram',
+        'Time to handle requests, until the response starts streaming, by endpoint',
+    ),
+    'dex_cache_lookups_total': (
+        'counter',
+        'Lookups in the disk cache, by object type and result (hit or miss)',
+    ),
+    'dex_cache_read_bytes_total': ('counter', 'Bytes read from the disk cache, by object type'),
+    'dex_cache_written_bytes_total': (
+        'counter',
+        'Bytes written to the disk cache, by object type',
+    ),
+    'dex_cache_generate_seconds': (
+        'histogram',
+        'Time to create objects that were not in the disk cache, by key. Includes the time '
+        'to ingest and parse the EML and CSV objects',
+    ),
+    'dex_lock_wait_seconds': (
+        'histogram',
+        'Time spent waiting for the disk cache (cache) and object bytes (obj) locks',
+    ),
+    'dex_download_bytes_total': ('counter', 'Bytes of objects downloaded from PASTA'),
+    'dex_download_seconds_total': ('counter', 'Time spent downloading objects from PASTA'),
+}
+
+SCHEMA_SQL = """
+create table if not exists metric
+(
+    name   text not null,
+    labels text not null,
+    value  real not null,
+    primary key (name, labels)
+);
+"""
+
+# (series name, label str) -> value, for counts that have not yet been flushed to the DB
+pending_dict = collections.defaultdict(float)
+pending_lock = threading.Lock()
+last_flush_ts = time.time()
+initialized_path_set = set()
+
+
+def inc(name, value=1, **label_dict):
+    """Add to a counter."""
+    assert METRIC_DICT[name][0] == 'counter', name
+    with pending_lock:
+        pending_dict[(name, get_label_str(label_dict))] += value
+
+
+def observe(name, value, **label_dict):
+    """Add a value to a histogram."""
+    assert METRIC_DICT[name][0] == 'histogram', name
+    label_str = get_label_str(label_dict)
+    with pending_lock:
+        for le in BUCKET_TUP:
+            if value <= le:
+                pending_dict[(f'{name}_bucket', get_label_str(label_dict, le))] += 1
+        pending_dict[(f'{name}_sum', label_str)] += value
+        pending_dict[(f'{name}_count', label_str)] += 1
+
+
+@contextlib.contextmanager
+def timer(name, **label_dict):
+    """Add the time spent in the enclosed block to a histogram."""
+    start_ts = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start_ts, **label_dict)
+
+
+def flush_if_due():
+    """Flush the counts of this process to the DB if METRICS_FLUSH_SEC has passed since
+    the last flush.
+    """
+    config = flask.current_app.config
+    if config['METRICS_ENABLED'] and time.time() - last_flush_ts >= config['METRICS_FLUSH_SEC']:
+        flush()
+
+
+def flush():
+    """Add the counts of this process to the DB."""
+    global last_flush_ts
+    with pending_lock:
+        row_list = [(name, label_str, v) for (name, label_str), v in pending_dict.items()]
+        pending_dict.clear()
+        last_flush_ts = time.time()
+    if not row_list:
+        return
+    try:
+        with _connect() as cnx:
+            cnx.executemany(
+                """
+                insert into metric (name, labels, value) values (?, ?, ?)
+                on conflict (name, labels) do update set value = value + excluded.value
+                """,
+                row_list,
+            )
+    except sqlite3.Error as e:
+        # Metrics must never break requests. The counts are returned to the pending
+        # dict, and the flush is retried later.
+        log.warning(f'Unable to flush metrics: {e}')
+        with pending_lock:
+            for name, label_str, v in row_list:
+                pending_dict[(name, label_str)] += v
+
+
+def render():
+    """Return the metrics for all workers in the Prometheus text format."""
+    flush()
+    with _connect() as cnx:
+        row_list = cnx.execute('select name, labels, value from metric').fetchall()
+    series_dict = collections.defaultdict(list)
+    for name, label_str, value in row_list:
+        series_dict[name].append((label_str, value))
+    line_list = []
+    for name, (type_str, help_str) in METRIC_DICT.items():
+        line_list.append(f'# HELP {name} {help_str}')
+        line_list.append(f'# TYPE {name} {type_str}')
+        if type_str == 'counter':
+            suffix_list = ['']
+        else:
+            suffix_list = ['_bucket', '_sum', '_count']
+        for suffix_str in suffix_list:
+            for label_str, value in sorted(series_dict[name + suffix_str], key=_sort_key):
+                line_list.append(f'{name}{suffix_str}{label_str} {format_float(value)}')
+    return '\n'.join(line_list) + '\n'
+
+
+def clear():
+    """Delete all metrics, in this process and in the DB."""
+    with pending_lock:
+        pending_dict.clear()
+    with _connect() as cnx:
+        cnx.execute('delete from metric')
+
+
+def get_label_str(label_dict, le=None):
+    """Return the labels on the form used in the exposition format. The labels are
+    sorted, with the 'le' label of histogram buckets last.
+    """
+    pair_list = [f'{k}="{escape_label_value(v)}"' for k, v in sorted(label_dict.items())]
+    if le is not None:
+        pair_list.append(f'le="{format_float(le)}"')
+    return '{' + ','.join(pair_list) + '}' if pair_list else ''
+
+
+def escape_label_value(v):
+    return str(v).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def format_float(v):
+    if v == math.inf:
+        return '+Inf'
+    return repr(float(v)) if v != int(v) else str(int(v))
+
+
+def _sort_key(series_tup):
+    """Sort series by labels, with the buckets of each histogram in order of their
+    upper bounds.
+    """
+    label_str = series_tup[0]
+    base_str, sep_str, le_str = label_str.rpartition('le="')
+    if not sep_str:
+        return label_str, 0
+    le_str = le_str[: -len('"}')]
+    return base_str, math.inf if le_str == '+Inf' else float(le_str)
+
+
+@contextlib.contextmanager
+def _connect():
+    """Open a connection and commit on successful exit."""
+    db_path = pathlib.Path(flask.current_app.config['METRICS_DB_PATH'])
+    if db_path not in initialized_path_set:
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+    cnx = sqlite3.connect(db_path.as_posix(), timeout=SQLITE_TIMEOUT_SEC)
+    try:
+        if db_path not in initialized_path_set:
+            cnx.execute('pragma journal_mode=wal')
+            cnx.executescript(SCHEMA_SQL)
+            initialized_path_set.add(db_path)
+        with cnx:
+            yield cnx
+    finally:
+        cnx.close()
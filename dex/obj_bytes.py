@@ -15,7 +15,10 @@ bandwidth to the object bytes, as follows:
 - Starts with checking if the object is in the local temporary filesystem cache, which
 should be on locally connected storage. Only the most recently downloaded objects are
 available on this cache. The eviction policy for the cache is Least Recently Used (LRU),
-which should keep objects available locally during the initial processing.
+which should keep objects available locally during the initial processing. The sizes
+and access times of the objects are tracked in a persistent index, so the eviction does
+not have to scan the cache, and objects that are locked by another worker are never
+evicted.
 
 - Next, checks if the object is the local filesystem PASTA package store, if one is
 available and the packages stored there are for the PASTA environment that was
@@ -38,23 +41,82 @@ the same object. Instead, the download or read is triggered by the process that
 acquires the lock. While the single download occurs, subsequent processes are blocked.
 When they in turn acquire the lock, high bandwidth access to the object is already
 available.
+
+Downloads use a pooled HTTP session with keep-alive. If a download is interrupted, the
+partially downloaded bytes are kept, and the download is resumed with an HTTP Range
+request the next time the object is requested. Large objects are downloaded in multiple
+segments in parallel, if the server supports Range requests.
+
+CSV objects can also be opened as a stream with open_csv_stream(). If the object must be
+downloaded, the stream returns the bytes as they arrive from the network, while a copy is
+written to the temporary cache. This allows parsing of the CSV to proceed in parallel
+with the download.
+
+CSV objects that are compressed with gzip, xz, bzip2 or zip are recognized by their
+magic bytes, and the stream returns the decompressed bytes. The objects are kept
+compressed in the temporary cache, and are never written out in decompressed form.
 """
+import bz2
+import concurrent.futures
 import contextlib
+import gzip
+import io
 import logging
+import lzma
+import os
 import shutil
+import struct
+import threading
 import time
+import zipfile
+import zlib
 
 import fasteners
 import requests
+import requests.adapters
+import urllib3.exceptions
 from flask import current_app as app
 
+import dex.cache_index
 import dex.db
 import dex.exc
 import dex.filesystem
+import dex.metrics
 import dex.pasta
+import dex.timing
 
 log = logging.getLogger(__name__)
 
+# Paths of the object locks that are currently claimed by threads in this process. File
+# locks are per process, so they do not protect objects from other threads in the same
+# process. A path is claimed before its file lock is acquired, and released after the
+# file lock is released, so that the file lock is only held by one thread at a time.
+held_lock_path_set = set()
+held_lock_path_lock = threading.Lock()
+held_lock_path_cond = threading.Condition(held_lock_path_lock)
+
+tmp_cache_index_dict = {}
+
+# Signatures of the compression formats that are decompressed on the fly. Compressed
+# objects are recognized by their leading bytes, not by their names.
+GZIP_MAGIC = b'\x1f\x8b'
+XZ_MAGIC = b'\xfd7zXZ\x00'
+BZIP2_MAGIC = b'BZh'
+# The block magic (BCD pi) that follows the 'BZh' header and the block size digit.
+BZIP2_BLOCK_MAGIC = b'\x31\x41\x59\x26\x53\x59'
+ZIP_MAGIC = b'PK\x03\x04'
+MAGIC_MAX_BYTES = 10
+
+# pid -> requests.Session. Connection pools must not be shared between processes, so
+# each worker creates its own session after it has been forked.
+session_dict = {}
+session_lock = threading.Lock()
+
+
+class RangeNotSupported(dex.exc.CacheError):
+    """Raised when the server answers a Range request for a segment of an object with
+    the full object."""
+
 
 def open_eml(rid):
     """Given a Row ID, return a pathlib.Path to the EML file.
@@ -77,12 +139,45 @@ def open_csv(rid):
     return _open_obj(dist_url, data_url, is_eml=False)
 
 
+@contextlib.contextmanager
+def open_csv_stream(rid):
+    """Like open_csv(), only yields a binary stream of the CSV bytes instead of a Path.
+
+    If the object is compressed, the stream returns the decompressed bytes.
+
+    If the object must be downloaded, and will be downloaded in a single stream, the
+    download is teed into the parser instead of completing before the stream is
+    returned. When the context exits, any remaining bytes that were not read by the
+    caller are downloaded, so that the object is complete in the temporary cache.
+
+    When the object is teed from the download, the lock for the object is held until
+    the context exits. Otherwise, the lock is only held while the path to the object is
+    resolved, and is released before the stream is returned. The open file remains
+    readable if the object is evicted while it's being read.
+    """
+    dist_url, meta_url, data_url = dex.db.get_entity(rid)
+    with _lock(dist_url, data_url, is_eml=False):
+        obj_path = data_url and _filesystem_cache(dist_url, data_url, is_eml=False)
+        is_tee = not obj_path and data_url and _is_streamable(dist_url, data_url)
+        if is_tee:
+            with _remote_url_stream(dist_url, data_url) as f:
+                yield _get_decompressed_stream(f)
+            return
+        if not obj_path:
+            with dex.timing.span('obj-resolve', 'csv'):
+                obj_path = _open_obj_locked(dist_url, data_url, is_eml=False)
+        f = obj_path.open('rb')
+    with f:
+        yield _get_decompressed_stream(f)
+
+
 def invalidate(rid):
     """Delete locally cached object bytes for the given Row ID."""
     dist_url = dex.db.get_dist_url(rid)
     _log(dist_url, 'Invalidating cache')
     dist_path = _get_cache_dist_path(dist_url)
     _delete_cache_dist_path(dist_path)
+    _get_tmp_cache_index().remove(dist_path.name)
 
 
 def _open_obj(dist_url, obj_url, is_eml):
@@ -94,7 +189,8 @@ def _open_obj(dist_url, obj_url, is_eml):
     log.debug(f'obj_url: "{obj_url}"')
     log.debug(f'is_eml: {is_eml}')
     with _lock(dist_url, obj_url, is_eml):
-        obj_path = _open_obj_locked(dist_url, obj_url, is_eml)
+        with dex.timing.span('obj-resolve', 'eml' if is_eml else 'csv'):
+            obj_path = _open_obj_locked(dist_url, obj_url, is_eml)
     log.debug(f'##### END resolving location for object bytes')
     return obj_path
 
@@ -104,9 +200,24 @@ def _lock(dist_url, obj_url, is_eml):
     start_ts = time.time()
     lock_path = _get_lock_path(dist_url, obj_url, is_eml)
     _log(lock_path.as_posix(), f'Acquiring lock')
-    with fasteners.InterProcessLock(lock_path.as_posix()):
-        _log(lock_path.as_posix(), f'Acquired lock after {time.time() - start_ts : .02f}s')
-        yield
+    with held_lock_path_cond:
+        held_lock_path_cond.wait_for(lambda: lock_path not in held_lock_path_set)
+        held_lock_path_set.add(lock_path)
+    try:
+        with fasteners.InterProcessLock(lock_path.as_posix()):
+            wait_sec = time.time() - start_ts
+            dex.timing.add('obj-lock', wait_sec, 'eml' if is_eml else 'csv')
+            dex.metrics.observe('dex_lock_wait_seconds', wait_sec, lock='obj')
+            _log(lock_path.as_posix(), f'Acquired lock after {wait_sec:.3f}s')
+            yield
+    finally:
+        _release_lock_path(lock_path)
+
+
+def _release_lock_path(lock_path):
+    with held_lock_path_cond:
+        held_lock_path_set.discard(lock_path)
+        held_lock_path_cond.notify_all()
 
 
 def _open_obj_locked(dist_url, obj_url, is_eml):
@@ -124,9 +235,9 @@ def _open_obj_locked(dist_url, obj_url, is_eml):
         # obj_path = _local_package_store(dist_url, obj_url, is_eml)
         # if obj_path:
         #    return obj_path
-        _limit_cache_size()
         obj_path = _remote_url(dist_url, obj_url, is_eml)
         if obj_path:
+            _add_to_tmp_cache(obj_path)
             return obj_path
     raise dex.exc.CacheError(
         f'Cannot find bytes for object. dist_url, obj_url="{dist_url, obj_url}""'
@@ -137,6 +248,7 @@ def _filesystem_cache(dist_url, obj_url, is_eml):
     _log(obj_url, 'Checking filesystem cache')
     obj_path = _get_cache_obj_path(dist_url, obj_url, is_eml)
     if _is_valid(obj_path):
+        _get_tmp_cache_index().touch(obj_path.parent.name, obj_path.name)
         return obj_path
 
 
@@ -165,32 +277,416 @@ def _local_sample_store(dist_url, is_eml):
 def _remote_url(dist_url, obj_url, is_eml):
     _log(obj_url, 'Downloading object bytes')
     obj_tmp_path = _get_cache_tmp_path(dist_url, obj_url, is_eml)
-    with obj_tmp_path.open('wb') as f:
-        with requests.get(obj_url, stream=True) as r:
-            if r.status_code != 200:
+    start_ts = time.time()
+    with dex.timing.span('obj-download'):
+        _download(obj_url, obj_tmp_path)
+    _log_throughput(obj_url, obj_tmp_path.stat().st_size, time.time() - start_ts)
+    obj_path = _get_cache_obj_path(dist_url, obj_url, is_eml)
+    obj_path.unlink(missing_ok=True)
+    obj_tmp_path.rename(obj_path)
+    return obj_path
+
+
+@contextlib.contextmanager
+def _remote_url_stream(dist_url, obj_url):
+    """Yield a binary stream of the object bytes as they are downloaded, while also
+    writing them to the temporary cache.
+
+    If the caller raises, the bytes downloaded so far are left in the tmp file, and the
+    download is resumed by the next request for the object.
+    """
+    _log(obj_url, 'Streaming object bytes')
+    obj_tmp_path = _get_cache_tmp_path(dist_url, obj_url, is_eml=False)
+    start_ts = time.time()
+    try:
+        r = _get_session().get(
+            obj_url,
+            stream=True,
+            headers={'Accept-Encoding': 'identity'},
+            timeout=app.config['DOWNLOAD_TIMEOUT_SEC'],
+        )
+    except requests.RequestException as e:
+        raise dex.exc.CacheError(f'Failed to download object bytes: {e}')
+    with r:
+        if r.status_code != 200:
+            msg_str = f'Failed to download object bytes: {r.status_code} {r.reason}'
+            _log(obj_url, msg_str)
+            raise dex.exc.CacheError(msg_str)
+        with obj_tmp_path.open('wb') as tmp_file:
+            tee_stream = TeeStream(r.raw, tmp_file)
+            yield io.BufferedReader(tee_stream)
+            tee_stream.drain()
+    _log_throughput(obj_url, obj_tmp_path.stat().st_size, time.time() - start_ts)
+    obj_path = _get_cache_obj_path(dist_url, obj_url, is_eml=False)
+    obj_path.unlink(missing_ok=True)
+    obj_tmp_path.rename(obj_path)
+    _add_to_tmp_cache(obj_path)
+
+
+class TeeStream(io.RawIOBase):
+    """Read-only raw stream that copies each chunk that is read from the source stream
+    to the destination stream.
+    """
+
+    def __init__(self, src_stream, dst_stream):
+        self._src_stream = src_stream
+        self._dst_stream = dst_stream
+
+    def readable(self):
+        return True
+
+    def readinto(self, buf):
+        try:
+            chunk_bytes = self._src_stream.read(len(buf))
+        except (IOError, urllib3.exceptions.HTTPError) as e:
+            raise dex.exc.CacheError(f'Failed to download object bytes: {e}')
+        self._dst_stream.write(chunk_bytes)
+        buf[: len(chunk_bytes)] = chunk_bytes
+        return len(chunk_bytes)
+
+    def drain(self):
+        """Copy the remaining bytes of the source stream to the destination stream."""
+        try:
+            shutil.copyfileobj(self._src_stream, self._dst_stream)
+        except (IOError, urllib3.exceptions.HTTPError) as e:
+            raise dex.exc.CacheError(f'Failed to download object bytes: {e}')
+
+
+def _get_decompressed_stream(stream):
+    """If the bytes in a buffered binary stream are compressed, return a stream of the
+    decompressed bytes. Else, return the stream unchanged.
+
+    The compression format is detected by peeking at the leading bytes, so the stream
+    does not have to be seekable. Only zip requires a seekable stream for full support.
+    For non-seekable streams, such as ongoing downloads, the first member of the zip
+    archive is decompressed directly from the stream.
+    """
+    magic_bytes = stream.peek(MAGIC_MAX_BYTES)[:MAGIC_MAX_BYTES]
+    if magic_bytes.startswith(GZIP_MAGIC):
+        _log('gzip', 'Decompressing object bytes')
+        return gzip.GzipFile(fileobj=stream, mode='rb')
+    if magic_bytes.startswith(XZ_MAGIC):
+        _log('xz', 'Decompressing object bytes')
+        return lzma.LZMAFile(stream)
+    if magic_bytes.startswith(BZIP2_MAGIC) and magic_bytes[4:10] == BZIP2_BLOCK_MAGIC:
+        _log('bzip2', 'Decompressing object bytes')
+        return bz2.BZ2File(stream)
+    if magic_bytes.startswith(ZIP_MAGIC):
+        _log('zip', 'Decompressing object bytes')
+        if stream.seekable():
+            zip_file = zipfile.ZipFile(stream)
+            info_list = [i for i in zip_file.infolist() if not i.is_dir()]
+            if not info_list:
+                raise dex.exc.CacheError('Zip archive does not contain any files')
+            return zip_file.open(info_list[0])
+        return io.BufferedReader(ZipMemberStream(stream))
+    return stream
+
+
+class ZipMemberStream(io.RawIOBase):
+    """Read-only raw stream that decompresses the first member of a zip archive from a
+    non-seekable stream, by reading its local file header instead of the central
+    directory at the end of the archive.
+    """
+
+    # signature, version, flags, method, time, date, crc32, comp_size, size, name_len,
+    # extra_len
+    HEADER_STRUCT = struct.Struct('<IHHHHHIIIHH')
+
+    def __init__(self, src_stream):
+        self._src_stream = src_stream
+        # Skip over directory entries
+        while True:
+            header_tup = self.HEADER_STRUCT.unpack(self._read_exact(self.HEADER_STRUCT.size))
+            sig, _ver, flags, method, _time, _date, _crc, comp_size, _size, name_len, extra_len = (
+                header_tup
+            )
+            if sig != struct.unpack('<I', ZIP_MAGIC)[0]:
+                raise dex.exc.CacheError('Zip archive does not contain any files')
+            name_bytes = self._read_exact(name_len)
+            self._read_exact(extra_len)
+            if not name_bytes.endswith(b'/'):
+                break
+            self._read_exact(comp_size)
+        if flags & 0x01:
+            raise dex.exc.CacheError('Encrypted zip archives are not supported')
+        if method == zipfile.ZIP_DEFLATED:
+            self._decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+            self._remaining_count = None
+        elif method == zipfile.ZIP_STORED and not flags & 0x08:
+            self._decompressor = None
+            self._remaining_count = comp_size
+        else:
+            raise dex.exc.CacheError(
+                f'Unsupported zip archive for streaming. method={method} flags={flags}'
+            )
+
+    def readable(self):
+        return True
+
+    def readinto(self, buf):
+        if self._decompressor is None:
+            chunk_bytes = self._src_stream.read(min(len(buf), self._remaining_count))
+            self._remaining_count -= len(chunk_bytes)
+        else:
+            chunk_bytes = b''
+            while not chunk_bytes and not self._decompressor.eof:
+                comp_bytes = self._decompressor.unconsumed_tail or self._src_stream.read(
+                    io.DEFAULT_BUFFER_SIZE
+                )
+                if not comp_bytes:
+                    raise dex.exc.CacheError('Zip archive is truncated')
+                chunk_bytes = self._decompressor.decompress(comp_bytes, len(buf))
+        buf[: len(chunk_bytes)] = chunk_bytes
+        return len(chunk_bytes)
+
+    def _read_exact(self, byte_count):
+        b = self._src_stream.read(byte_count)
+        if len(b) != byte_count:
+            raise dex.exc.CacheError('Zip archive is truncated')
+        return b
+
+
+def _is_streamable(dist_url, obj_url):
+    """Return True if the object will be downloaded in a single stream from the start,
+    which is required for teeing the download into a parser.
+    """
+    obj_tmp_path = _get_cache_tmp_path(dist_url, obj_url, is_eml=False)
+    if obj_tmp_path.exists() and obj_tmp_path.stat().st_size > 0:
+        return False
+    if app.config['DOWNLOAD_SEGMENT_COUNT'] > 1:
+        byte_count = _get_segmented_size(obj_url)
+        if byte_count is not None and byte_count >= app.config['DOWNLOAD_SEGMENT_MIN_BYTES']:
+            return False
+    return True
+
+
+def _download(obj_url, tmp_path):
+    """Download the object bytes to tmp_path.
+
+    If tmp_path holds bytes from an interrupted download, the download is resumed.
+    Objects of at least DOWNLOAD_SEGMENT_MIN_BYTES are downloaded in parallel segments
+    if the server accepts Range requests. If the server announces support for Range
+    requests, but then ignores them, the object is downloaded in a single stream instead.
+    """
+    segment_count = app.config['DOWNLOAD_SEGMENT_COUNT']
+    is_resume = tmp_path.exists() and tmp_path.stat().st_size > 0
+    if segment_count > 1 and not is_resume:
+        byte_count = _get_segmented_size(obj_url)
+        if byte_count is not None and byte_count >= app.config['DOWNLOAD_SEGMENT_MIN_BYTES']:
+            try:
+                _download_segmented(obj_url, tmp_path, byte_count, segment_count)
+                return
+            except RangeNotSupported as e:
+                _log(obj_url, f'{e.description}. Downloading in a single stream')
+    _download_range(
+        _get_session(), obj_url, tmp_path, 0, None, app.config['DOWNLOAD_TIMEOUT_SEC']
+    )
+
+
+def _get_segmented_size(obj_url):
+    """Return the size of the object if the server accepts Range requests for it, else
+    None.
+    """
+    try:
+        r = _get_session().head(
+            obj_url,
+            allow_redirects=True,
+            timeout=app.config['DOWNLOAD_TIMEOUT_SEC'],
+            headers={'Accept-Encoding': 'identity'},
+        )
+    except requests.RequestException as e:
+        _log(obj_url, f'Unable to get object size: {e}')
+        return None
+    if r.status_code != 200 or r.headers.get('Accept-Ranges') != 'bytes':
+        return None
+    try:
+        return int(r.headers['Content-Length'])
+    except (KeyError, ValueError):
+        return None
+
+
+def _download_segmented(obj_url, tmp_path, byte_count, segment_count):
+    """Download segments of the object in parallel, each to a separate part file, then
+    join the parts into tmp_path. Part files from an interrupted download are resumed.
+    """
+    _log(obj_url, f'Downloading {byte_count:,} bytes in {segment_count} parallel segments')
+    session = _get_session()
+    timeout_sec = app.config['DOWNLOAD_TIMEOUT_SEC']
+    segment_bytes = -(-byte_count // segment_count)
+    part_list = [
+        (
+            tmp_path.with_name(f'{tmp_path.name}.{i}'),
+            i * segment_bytes,
+            min((i + 1) * segment_bytes, byte_count) - 1,
+        )
+        for i in range(segment_count)
+        if i * segment_bytes < byte_count
+    ]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(part_list)) as executor:
+        future_list = [
+            executor.submit(_download_range, session, obj_url, *part_tup, timeout_sec)
+            for part_tup in part_list
+        ]
+        try:
+            for future in future_list:
+                future.result()
+        except RangeNotSupported:
+            # The parts cannot be resumed with Range requests either.
+            concurrent.futures.wait(future_list)
+            for part_path, _first_idx, _last_idx in part_list:
+                part_path.unlink(missing_ok=True)
+            raise
+    with tmp_path.open('wb') as f:
+        for part_path, _first_idx, _last_idx in part_list:
+            with part_path.open('rb') as part_file:
+                shutil.copyfileobj(part_file, f)
+    for part_path, _first_idx, _last_idx in part_list:
+        part_path.unlink()
+
+
+def _download_range(session, obj_url, part_path, first_idx, last_idx, timeout_sec):
+    """Download bytes first_idx to last_idx (inclusive) of the object to part_path. If
+    last_idx is None, download to the end of the object.
+
+    If part_path already holds bytes from an interrupted download, only the remaining
+    bytes are requested. If the server does not honor the Range request, and the range
+    is the full object, the full object is downloaded instead. Otherwise, raises
+    RangeNotSupported, as the response does not hold the requested segment.
+
+    This runs without an app context, so that it can be called from worker threads.
+    """
+    done_count = part_path.stat().st_size if part_path.exists() else 0
+    if last_idx is not None and done_count >= last_idx - first_idx + 1:
+        return
+    header_dict = {'Accept-Encoding': 'identity'}
+    if done_count or first_idx or last_idx is not None:
+        last_str = '' if last_idx is None else last_idx
+        header_dict['Range'] = f'bytes={first_idx + done_count}-{last_str}'
+    try:
+        with session.get(obj_url, stream=True, headers=header_dict, timeout=timeout_sec) as r:
+            if r.status_code == 206:
+                mode_str = 'ab'
+                if done_count:
+                    _log(obj_url, f'Resuming download after {done_count:,} bytes')
+            elif r.status_code == 200 and first_idx == 0 and last_idx is None:
+                mode_str = 'wb'
+            elif r.status_code == 200:
+                raise RangeNotSupported('Server ignored the Range request for a segment')
+            elif r.status_code == 416 and done_count and last_idx is None:
+                # The requested range starts at the end of the object, so the previous
+                # download was complete.
+                return
+            else:
                 msg_str = f'Failed to download object bytes: {r.status_code} {r.reason}'
                 _log(obj_url, msg_str)
                 raise dex.exc.CacheError(msg_str)
-            try:
+            with part_path.open(mode_str) as f:
                 # This is a high performance way of copying a stream.
                 shutil.copyfileobj(r.raw, f)
-            except IOError as e:
-                raise dex.exc.CacheError(f'Failed to download object bytes: {e}')
-    obj_path = _get_cache_obj_path(dist_url, obj_url, is_eml)
-    obj_path.unlink(missing_ok=True)
-    obj_tmp_path.rename(obj_path)
-    return obj_path
+    except (IOError, requests.RequestException) as e:
+        raise dex.exc.CacheError(f'Failed to download object bytes: {e}')
+
+
+def _get_session():
+    """Return the HTTP session for this process."""
+    pid = os.getpid()
+    with session_lock:
+        if pid not in session_dict:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(
+                pool_maxsize=max(app.config['DOWNLOAD_SEGMENT_COUNT'], 10)
+            )
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session_dict[pid] = session
+        return session_dict[pid]
+
+
+def _log_throughput(obj_url, byte_count, sec):
+    log.info(
+        f'Downloaded {byte_count:,} bytes in {sec:.2f}s '
+        f'({byte_count / 1024**2 / max(sec, 0.001):.2f} MiB/s): {obj_url}'
+    )
+    dex.metrics.inc('dex_download_bytes_total', byte_count)
+    dex.metrics.inc('dex_download_seconds_total', sec)
+
+
+def _add_to_tmp_cache(obj_path):
+    """Register a downloaded object in the temporary cache index, and make room for it
+    by evicting other objects if the cache is over its size limit.
+    """
+    _get_tmp_cache_index().add(obj_path.parent.name, obj_path.name, obj_path.stat().st_size)
+    _limit_cache_size(exclude_dist_path=obj_path.parent)
+
 
+def _limit_cache_size(exclude_dist_path=None):
+    """Delete the least recently used cached objects until the total size of the
+    temporary cache is below the limit.
 
-def _limit_cache_size():
-    """Delete the oldest cached file(s) if number of cached files has exceeded the
-    limit.
+    Objects are deleted together with the other objects for the same dist_url. A
+    dist_url is skipped if any of its objects are locked by another thread or process,
+    or if it is `exclude_dist_path`.
     """
-    dist_path_list = list(app.config['TMP_CACHE_ROOT'].iterdir())
-    while len(dist_path_list) > app.config['TMP_CACHE_LIMIT']:
-        oldest_dist_path = min(dist_path_list, key=lambda p: p.stat().st_mtime)
-        _delete_cache_dist_path(oldest_dist_path)
-        dist_path_list.remove(oldest_dist_path)
+    cache_index = _get_tmp_cache_index()
+    limit_bytes = app.config['TMP_CACHE_LIMIT_BYTES']
+    total_bytes = cache_index.get_total_bytes()
+    for row in cache_index.get_group_list():
+        if total_bytes <= limit_bytes:
+            break
+        dist_path = app.config['TMP_CACHE_ROOT'] / row.grp
+        if dist_path == exclude_dist_path:
+            continue
+        with _try_lock_dist_path(dist_path) as is_locked:
+            if not is_locked:
+                _log(dist_path.as_posix(), 'Skipped eviction of locked objects')
+                continue
+            _log(dist_path.as_posix(), f'Evicting {row.byte_count:,} bytes')
+            _delete_cache_dist_path(dist_path)
+        cache_index.remove(row.grp)
+        total_bytes -= row.byte_count
+
+
+@contextlib.contextmanager
+def _try_lock_dist_path(dist_path):
+    """Try to acquire the locks for all objects of a dist_url without blocking. Yield
+    True if all the locks were acquired, and hold them until the context exits. Else,
+    yield False.
+    """
+    with contextlib.ExitStack() as es:
+        for lock_path in dist_path.glob('*.lock') if dist_path.is_dir() else []:
+            # Claim the path before acquiring the file lock, so that no other thread in
+            # this process can acquire it in between. The callbacks run in reverse
+            # order, so the file lock is released before the claim.
+            with held_lock_path_lock:
+                is_held = lock_path in held_lock_path_set
+                if not is_held:
+                    held_lock_path_set.add(lock_path)
+            if is_held:
+                yield False
+                return
+            es.callback(_release_lock_path, lock_path)
+            process_lock = fasteners.InterProcessLock(lock_path.as_posix())
+            if not process_lock.acquire(blocking=False):
+                yield False
+                return
+            es.callback(process_lock.release)
+        yield True
+
+
+def _get_tmp_cache_index():
+    """Return the index of sizes and access times for the objects in the temporary
+    cache. If the index does not exist yet, it is created from the objects that are
+    already in the cache.
+    """
+    index_path = app.config['TMP_CACHE_INDEX_PATH']
+    if index_path not in tmp_cache_index_dict:
+        is_new = not index_path.exists()
+        cache_index = dex.cache_index.CacheIndex(index_path)
+        if is_new:
+            cache_index.scan(app.config['TMP_CACHE_ROOT'])
+        tmp_cache_index_dict[index_path] = cache_index
+    return tmp_cache_index_dict[index_path]
 
 
 def _get_lock_path(dist_url, obj_url, is_eml):
@@ -222,10 +718,18 @@ def _get_cache_dist_path(dist_url):
 
 
 def _delete_cache_dist_path(dist_path):
-    """Delete all cached items for a dist_url."""
+    """Delete all cached items for a dist_url, including temporary and partial
+    downloads.
+
+    The lock files and the directory are kept. The locks may be held while the items
+    are deleted, and if a lock file was deleted, a waiter that is blocked on the old
+    file and another worker that creates a new file would both hold the lock.
+    """
+    if not dist_path.is_dir():
+        return
     for file_path in list(dist_path.iterdir()):
-        file_path.unlink()
-    dist_path.rmdir()
+        if file_path.suffix != '.lock':
+            file_path.unlink(missing_ok=True)
 
 
 def _is_valid(obj_path):
@@ -0,0 +1,235 @@
+"""Profiling of single requests, for finding the hot paths in slow views.
+
+A request is profiled when the client sends REQUEST_PROFILE_HEADER with
+REQUEST_PROFILE_TOKEN as the value, or when it has enabled the debug panel and its
+address is in REQUEST_PROFILE_ALLOWED_ADDR_SET. When REQUEST_PROFILE_SLOW_SEC is set,
+all requests are profiled, and the profiles of the requests that took at least that long
+are kept. This allows profiles of slow requests
+in production to be captured without redeploying.
+
+If pyinstrument is installed, it's used for recording a sampling profile, which has low
+overhead and is rendered as an interactive HTML page. Otherwise, cProfile is used, and
+the profile is stored in the pstats format, which can also be opened in tools such as
+snakeviz.
+
+Profiles are stored in REQUEST_PROFILE_DIR, where only the REQUEST_PROFILE_MAX_COUNT
+most recent profiles are kept. They are listed at /dex/debug/profiles, which is linked
+from the debug panel, and are only available to the clients that can request profiles.
+
+Only the thread that handles the request is profiled, and the profile ends when the
+response starts streaming.
+"""
+import contextlib
+import cProfile
+import hmac
+import io
+import logging
+import os
+import pathlib
+import pstats
+import re
+import time
+
+import flask
+
+try:
+    import pyinstrument
+except ImportError:
+    pyinstrument = None
+
+log = logging.getLogger(__name__)
+
+# Profile file names: <time>-<pid>_<msec>ms_<rid>_<endpoint>.<ext>
+PROFILE_NAME_RX = re.compile(
+    r'^(?P<ts>\d{8}-\d{6}\.\d{3}-\d+)_(?P<msec>\d+)ms_(?P<rid>[\w-]+?)_'
+    r'(?P<endpoint>[\w.-]+)\.(?P<ext>prof|html)$'
+)
+
+# Requests for static files and for the debug views are not profiled, as they would
+# crowd out the profiles of interest when the debug panel is enabled.
+SKIP_ENDPOINT_RX = re.compile(r'^(static|debug\.)')
+
+
+class RequestProfile:
+    def __init__(self, is_requested):
+        # True if the profile was requested by the client, in which case it's kept
+        # regardless of how long the request took.
+        self.is_requested = is_requested
+        self.start_ts = time.perf_counter()
+        if pyinstrument is not None:
+            self.profiler = pyinstrument.Profiler(async_mode='disabled')
+        else:
+            self.profiler = cProfile.Profile()
+        self.is_running = False
+
+    def start(self):
+        try:
+            if pyinstrument is not None:
+                self.profiler.start()
+            else:
+                self.profiler.enable()
+        except (RuntimeError, ValueError) as e:
+            # Raised when another profiler is already active in the process.
+            log.debug(f'Unable to start profiler: {e}')
+            return False
+        self.is_running = True
+        return True
+
+    def stop(self):
+        if not self.is_running:
+            return
+        self.is_running = False
+        if pyinstrument is not None:
+            self.profiler.stop()
+        else:
+            self.profiler.disable()
+
+    def write(self, profile_path):
+        if pyinstrument is not None:
+            profile_path.write_text(self.profiler.output_html())
+        else:
+            self.profiler.dump_stats(profile_path.as_posix())
+
+
+def start():
+    """Start profiling the current request, if profiling is enabled for it."""
+    config = flask.current_app.config
+    if not config['REQUEST_PROFILE_ENABLED']:
+        return
+    if SKIP_ENDPOINT_RX.match(flask.request.endpoint or ''):
+        return
+    is_requested = is_allowed()
+    if not is_requested and config['REQUEST_PROFILE_SLOW_SEC'] is None:
+        return
+    profile = RequestProfile(is_requested)
+    if profile.start():
+        flask.g.request_profile = profile
+
+
+def stop(response):
+    """Stop profiling the current request, and store the profile if it was requested or
+    if the request was slow. The URL of the stored profile is returned to the client in
+    the X-Dex-Profile header.
+    """
+    profile = flask.g.pop('request_profile', None)
+    if profile is None:
+        return response
+    profile.stop()
+    sec = time.perf_counter() - profile.start_ts
+    slow_sec = flask.current_app.config['REQUEST_PROFILE_SLOW_SEC']
+    if not profile.is_requested and sec < slow_sec:
+        return response
+    profile_path = get_profile_dir() / get_profile_name(sec)
+    profile.write(profile_path)
+    log.info(
+        f'Stored profile of {flask.request.method} {flask.request.path} '
+        f'({sec:.2f}s): {profile_path.as_posix()}'
+    )
+    prune()
+    response.headers['X-Dex-Profile'] = f'/dex/debug/profiles/{profile_path.name}'
+    return response
+
+
+def discard():
+    """Stop profiling if the request ended without a response, such as when the client
+    disconnected.
+    """
+    profile = flask.g.pop('request_profile', None)
+    if profile is not None:
+        profile.stop()
+
+
+def is_allowed():
+    """Return True if the client can request profiles and has access to the stored
+    profiles.
+
+    The debug panel cookie can be set by any client, so it only gives access from the
+    addresses in REQUEST_PROFILE_ALLOWED_ADDR_SET.
+    """
+    config = flask.current_app.config
+    if not config['REQUEST_PROFILE_ENABLED']:
+        return False
+    if (
+        flask.g.get('debug_panel')
+        and flask.request.remote_addr in config['REQUEST_PROFILE_ALLOWED_ADDR_SET']
+    ):
+        return True
+    token_str = config['REQUEST_PROFILE_TOKEN']
+    header_str = flask.request.headers.get(config['REQUEST_PROFILE_HEADER'])
+    return (
+        token_str is not None
+        and header_str is not None
+        and hmac.compare_digest(header_str.encode(), token_str.encode())
+    )
+
+
+def get_profile_dir():
+    profile_dir = pathlib.Path(flask.current_app.config['REQUEST_PROFILE_DIR'])
+    profile_dir.mkdir(parents=True, exist_ok=True)
+    return profile_dir
+
+
+def get_profile_name(sec):
+    now_ts = time.time()
+    ts_str = time.strftime('%Y%m%d-%H%M%S', time.localtime(now_ts))
+    rid = (flask.request.view_args or {}).get('rid', 'none')
+    return '{}.{:03d}-{}_{}ms_{}_{}.{}'.format(
+        ts_str,
+        int(now_ts * 1000) % 1000,
+        os.getpid(),
+        round(sec * 1000),
+        re.sub(r'[^0-9a-zA-Z-]', '-', str(rid)),
+        re.sub(r'[^\w.-]', '-', flask.request.endpoint or 'none'),
+        'prof' if pyinstrument is None else 'html',
+    )
+
+
+def get_profile_list(rid=None):
+    """Return a list of dicts describing the stored profiles, most recent first,
+    optionally only including the profiles for a rid.
+    """
+    profile_list = []
+    for profile_path in get_profile_dir().iterdir():
+        m = PROFILE_NAME_RX.match(profile_path.name)
+        if not m:
+            continue
+        if rid is not None and m['rid'] != str(rid):
+            continue
+        profile_dict = m.groupdict()
+        profile_dict.update(name=profile_path.name, msec=int(m['msec']))
+        profile_list.append(profile_dict)
+    return sorted(profile_list, key=lambda d: d['ts'], reverse=True)
+
+
+def get_profile_path(name):
+    """Return the path to a stored profile, or None if there is no profile by that
+    name.
+    """
+    if not PROFILE_NAME_RX.match(name):
+        return None
+    profile_path = get_profile_dir() / name
+    return profile_path if profile_path.is_file() else None
+
+
+def render_pstats(profile_path, sort_str='cumulative', line_count=100):
+    """Return a cProfile profile as text, with the functions that took the most time
+    first.
+
+    sort_str is one of the pstats.SortKey values. Other values, which may come from the
+    client, fall back to sorting by cumulative time.
+    """
+    if sort_str not in {k.value for k in pstats.SortKey}:
+        sort_str = pstats.SortKey.CUMULATIVE.value
+    out_file = io.StringIO()
+    stats = pstats.Stats(profile_path.as_posix(), stream=out_file)
+    stats.strip_dirs().sort_stats(sort_str).print_stats(line_count)
+    return out_file.getvalue()
+
+
+def prune():
+    """Delete the oldest profiles, keeping REQUEST_PROFILE_MAX_COUNT."""
+    max_count = flask.current_app.config['REQUEST_PROFILE_MAX_COUNT']
+    for profile_dict in get_profile_list()[max_count:]:
+        # Another worker may have deleted the profile already.
+        with contextlib.suppress(FileNotFoundError):
+            (get_profile_dir() / profile_dict['name']).unlink()
@@ -1,5 +1,10 @@
+import collections
+import concurrent.futures
 import logging
+import os
 import pathlib
+import threading
+import time
 
 import lxml.etree
 from flask import current_app as app
@@ -10,32 +15,111 @@ import dex.pasta
 
 log = logging.getLogger(__name__)
 
+# Max number of EML docs to parse in parallel when building the sample catalog.
+PARSE_WORKER_COUNT = 8
+
+# sample_root_path -> SampleCatalog
+catalog_dict = {}
+catalog_lock = threading.Lock()
+catalog_cond = threading.Condition(catalog_lock)
+# Sample root paths for which a thread is currently checking or rebuilding the catalog
+rebuilding_path_set = set()
+
+SampleCatalog = collections.namedtuple(
+    'SampleCatalog', ['signature_tup', 'data_entity_list', 'check_ts']
+)
+
 
-# @dex.cache.disk("sample_data_entity_list", "list")
 def get_sample_data_entity_list(_rid):
-    data_entity_list = []
+    """Return the list of data entities in the local sample packages.
+
+    Finding the entities requires parsing the EML docs of all the sample packages, so
+    the list is cached in each process, and is rebuilt only when the modified time of a
+    directory in the sample root changes. The directories are checked at most once per
+    SAMPLE_CATALOG_CHECK_SEC.
+
+    The catalog is checked and rebuilt by a single thread, outside of the lock. Other
+    threads are served the previous catalog in the meantime, and only wait if there is
+    no previous catalog.
+    """
     sample_root_path = app.config['LOCAL_SAMPLE_ROOT_DIR']
+    now_ts = time.time()
+    with catalog_cond:
+        while True:
+            catalog = catalog_dict.get(sample_root_path)
+            if catalog and now_ts - catalog.check_ts < app.config['SAMPLE_CATALOG_CHECK_SEC']:
+                return catalog.data_entity_list
+            if sample_root_path not in rebuilding_path_set:
+                break
+            if catalog:
+                return catalog.data_entity_list
+            catalog_cond.wait()
+        rebuilding_path_set.add(sample_root_path)
+
+    new_catalog = None
+    try:
+        signature_tup = _get_signature(sample_root_path)
+        if not catalog or catalog.signature_tup != signature_tup:
+            data_entity_list = _build_sample_data_entity_list(sample_root_path)
+        else:
+            data_entity_list = catalog.data_entity_list
+        new_catalog = SampleCatalog(signature_tup, data_entity_list, now_ts)
+    finally:
+        with catalog_cond:
+            if new_catalog:
+                catalog_dict[sample_root_path] = new_catalog
+            rebuilding_path_set.discard(sample_root_path)
+            catalog_cond.notify_all()
+    return new_catalog.data_entity_list
+
+
+def _build_sample_data_entity_list(sample_root_path):
+    start_ts = time.time()
     log.debug(f'Looking for local sample packages at: {sample_root_path.as_posix()}')
-    for sample_eml_path in sample_root_path.glob('**/*'):
-        if sample_eml_path.is_file() and sample_eml_path.suffix == '.xml':
-            for dist_url in _get_sample_dist_url_list(sample_eml_path):
-                sample_data_path = dex.pasta.get_local_sample_data_path(dist_url)
-                if sample_data_path.exists():
-                    dist_url_dict = dex.pasta.parse_dist_url(dist_url)
-                    data_entity_list.append(
-                        dict(
-                            **dist_url_dict,
-                            **dict(
-                                dist_url=dist_url,
-                                size=sample_data_path.stat().st_size,
-                                abs_path=sample_eml_path,
-                            ),
-                        )
+    sample_eml_path_list = [
+        p for p in sample_root_path.glob('**/*') if p.is_file() and p.suffix == '.xml'
+    ]
+    # Parsing is done in parallel, while the remaining processing requires the app
+    # context, so is done in this thread.
+    with concurrent.futures.ThreadPoolExecutor(max_workers=PARSE_WORKER_COUNT) as executor:
+        dist_url_list_list = list(executor.map(_get_sample_dist_url_list, sample_eml_path_list))
+    data_entity_list = []
+    for sample_eml_path, dist_url_list in zip(sample_eml_path_list, dist_url_list_list):
+        for dist_url in dist_url_list:
+            sample_data_path = dex.pasta.get_local_sample_data_path(dist_url)
+            if sample_data_path.exists():
+                dist_url_dict = dex.pasta.parse_dist_url(dist_url)
+                data_entity_list.append(
+                    dict(
+                        **dist_url_dict,
+                        **dict(
+                            dist_url=dist_url,
+                            size=sample_data_path.stat().st_size,
+                            abs_path=sample_eml_path,
+                        ),
                     )
-
+                )
+    log.info(
+        f'Built sample catalog. eml_docs={len(sample_eml_path_list)} '
+        f'data_entities={len(data_entity_list)} sec={time.time() - start_ts:.2f}'
+    )
     return sorted(data_entity_list, key=lambda d: d['size'])
 
 
+def _get_signature(sample_root_path):
+    """Return a tuple of the paths and modified times of all the directories under the
+    sample root. Adding, removing or replacing a file changes the modified time of its
+    directory.
+    """
+    signature_list = []
+    for dir_path, _dir_list, _file_list in os.walk(sample_root_path):
+        try:
+            signature_list.append((dir_path, os.stat(dir_path).st_mtime_ns))
+        except OSError:
+            pass
+    return tuple(signature_list)
+
+
 def _split_path(sample_path: pathlib.Path):
     """Given a local path to a data object, return the dist_url for that object.
 
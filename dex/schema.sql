@@ -6,6 +6,8 @@
 -- is derived from the dist_url.
 -- When DeX is called from ezEML, dist_url and data_url may or may not be the same,
 -- and meta_url is provided by the caller.
+--
+-- This is the base schema. Later changes are applied by the migrations in db.py.
 CREATE TABLE entity
 (
     id       integer not null primary key,
@@ -0,0 +1,115 @@
+"""Timing of the stages of a request, returned in a Server-Timing header.
+
+Stages such as waiting for a lock, reading from the cache, parsing the CSV and
+serializing the response are timed with span(). When the response is sent, the total
+time for each stage is added to the Server-Timing header, where it's shown by the
+network panel of the browser developer tools. A breakdown of each request, with nested
+stages indented, can also be written to the log.
+
+Timing is enabled for all requests by SERVER_TIMING_ENABLED, or for a single client by
+the debug panel cookie. When it's not enabled, span() only checks for the timing object
+in flask.g, so the stages can be timed anywhere without affecting performance. Stages
+that run outside of a request, such as in background threads, are not timed.
+"""
+import contextlib
+import logging
+import time
+
+import flask
+
+log = logging.getLogger(__name__)
+
+
+class RequestTiming:
+    def __init__(self):
+        self.start_ts = time.perf_counter()
+        self.depth = 0
+        # (name, detail, start_sec, duration_sec, depth)
+        self.span_list = []
+
+    def add(self, name, detail, start_ts, sec, depth):
+        self.span_list.append((name, detail, start_ts - self.start_ts, sec, depth))
+
+
+def start():
+    """Start timing the current request, if timing is enabled for it."""
+    if flask.current_app.config['SERVER_TIMING_ENABLED'] or flask.g.get('debug_panel'):
+        flask.g.timing = RequestTiming()
+
+
+def get_timing():
+    if not flask.has_request_context():
+        return None
+    return flask.g.get('timing')
+
+
+@contextlib.contextmanager
+def span(name, detail=None):
+    """Time the enclosed block as a stage of the current request.
+
+    Args:
+        name: Name of the stage, as shown in the Server-Timing header. Stages with the
+            same name are added together.
+        detail: Optional string that is included in the logged breakdown, such as the
+            cache key.
+    """
+    timing = get_timing()
+    if timing is None:
+        yield
+        return
+    depth = timing.depth
+    timing.depth += 1
+    start_ts = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing.depth = depth
+        timing.add(name, detail, start_ts, time.perf_counter() - start_ts, depth)
+
+
+def add(name, sec, detail=None):
+    """Add a stage that has already been timed, such as a wait for a lock."""
+    timing = get_timing()
+    if timing is not None:
+        timing.add(name, detail, time.perf_counter() - sec, sec, timing.depth)
+
+
+def add_header(response):
+    """Add the Server-Timing header to the response, and log the breakdown if enabled.
+
+    The time for streamed responses only covers the time until the response starts
+    streaming.
+    """
+    timing = get_timing()
+    if timing is None:
+        return response
+    total_sec = time.perf_counter() - timing.start_ts
+
+    stage_dict = {}
+    for name, _detail, _start_sec, sec, _depth in timing.span_list:
+        total_stage_sec, count = stage_dict.get(name, (0.0, 0))
+        stage_dict[name] = total_stage_sec + sec, count + 1
+    metric_list = [
+        f'{name};dur={sec * 1000:.1f}' + (f';desc="x{count}"' if count > 1 else '')
+        for name, (sec, count) in stage_dict.items()
+    ]
+    metric_list.append(f'total;dur={total_sec * 1000:.1f}')
+    response.headers['Server-Timing'] = ', '.join(metric_list)
+
+    if flask.current_app.config['SERVER_TIMING_LOG']:
+        log_breakdown(timing, total_sec, response)
+
+    return response
+
+
+def log_breakdown(timing, total_sec, response):
+    line_list = [
+        f'{flask.request.method} {flask.request.full_path.rstrip("?")} '
+        f'-> {response.status_code} in {total_sec * 1000:.1f} ms'
+    ]
+    for name, detail, start_sec, sec, depth in sorted(timing.span_list, key=lambda s: s[2]):
+        line_list.append(
+            f'{start_sec * 1000:>9.1f} {sec * 1000:>9.1f} ms  {"  " * depth}{name}'
+            + (f' {detail}' if detail else '')
+        )
+    log.info('\n'.join(line_list))
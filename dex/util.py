@@ -5,6 +5,7 @@ import datetime
 import io
 import json
 import logging
+import math
 import os
 import pathlib
 import pprint
@@ -16,14 +17,23 @@ import types
 import dateutil
 import dateutil.parser
 import fasteners
+import flask
 import lxml.etree
-import pandas as pd
-import pygments
-import pygments.formatters
-import pygments.lexers
 from flask import current_app as app
 
+import dex.cache
 import dex.db
+import dex.lazy
+import dex.timing
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+np = dex.lazy.LazyModule('numpy')
+pd = dex.lazy.LazyModule('pandas')
+pygments = dex.lazy.LazyModule('pygments', 'pygments.formatters', 'pygments.lexers')
 
 log = logging.getLogger(__name__)
 
@@ -235,6 +245,81 @@ def get_etree_as_pretty_printed_xml(el):
 # JSON
 
 
+def to_json(obj):
+    """Serialize obj to JSON bytes in a single pass.
+
+    This is used for the JSON endpoints, which return large payloads of table rows and
+    plot data. NumPy arrays and scalars are serialized natively, dates and datetimes as
+    ISO 8601 strings, and any other unsupported types as their str() representation.
+
+    NaN and infinite floats are written as null, as JSON.parse() does not accept NaN
+    and Infinity.
+
+    Uses orjson if it is installed, and falls back to the standard library json module.
+    The json module cannot write NaN and infinite floats as null, so if obj holds any,
+    they are replaced in a second, slower pass. Table rows should be created with
+    get_json_row_list(), which replaces them while converting the DataFrame, so that
+    the second pass is not needed.
+    """
+    if orjson is not None:
+        return orjson.dumps(
+            obj,
+            default=_json_default,
+            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS,
+        )
+    try:
+        return _json_dumps(obj, _json_default)
+    except ValueError:
+        # Raised by allow_nan=False for NaN and infinite floats
+        return _json_dumps(
+            _replace_non_finite(obj), lambda o: _replace_non_finite(_json_default(o))
+        )
+
+
+def get_json_row_list(df):
+    """Return the rows of a DataFrame as a list of lists for to_json(), with missing
+    values and infinite floats replaced by None.
+    """
+    missing_df = df.isna() | df.isin([np.inf, -np.inf])
+    if missing_df.to_numpy().any():
+        df = df.astype(object).mask(missing_df, None)
+    return df.to_numpy().tolist()
+
+
+def json_response(obj):
+    """Return a Flask response with obj serialized by to_json()."""
+    with dex.timing.span('serialize'):
+        json_bytes = to_json(obj)
+    return flask.Response(json_bytes, mimetype='application/json')
+
+
+def _json_dumps(obj, default):
+    return json.dumps(obj, default=default, separators=(',', ':'), allow_nan=False).encode('utf-8')
+
+
+def _json_default(o):
+    """Serialize the types that are not handled natively by the JSON encoder."""
+    if isinstance(o, datetime.date):
+        return o.isoformat()
+    if isinstance(o, np.ndarray):
+        return o.tolist()
+    if isinstance(o, np.generic):
+        return o.item()
+    return str(o)
+
+
+def _replace_non_finite(obj):
+    """Return obj with NaN and infinite floats in nested dicts, lists and tuples replaced
+    by None."""
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, dict):
+        return {k: _replace_non_finite(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_replace_non_finite(v) for v in obj]
+    return obj
+
+
 class DatetimeEncoder(json.JSONEncoder):
     def default(self, o):
         try:
@@ -286,6 +371,9 @@ def wipe_cache():
         log.debug(f'Deleting dir tree: {p.as_posix()}')
         wipe_dir(p.resolve().absolute())
 
+    log.debug(f'Clearing cache index')
+    dex.cache.get_cache_index().clear()
+
     log.debug(f'Deleting entities from database')
     dex.db.clear_entities()
 
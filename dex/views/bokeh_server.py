@@ -1,21 +1,29 @@
+import functools
 import json
 import logging
 
-import bokeh.colors
-import bokeh.core.enums
-import bokeh.embed
-import bokeh.models
-import bokeh.palettes
-import bokeh.plotting
 import flask
 
 import dex.cache
 import dex.csv_cache
 import dex.csv_parser
 import dex.eml_cache
+import dex.http_cache
+import dex.lazy
+import dex.timing
 import dex.util
 import dex.views.util
 
+bokeh = dex.lazy.LazyModule(
+    'bokeh',
+    'bokeh.colors',
+    'bokeh.core.enums',
+    'bokeh.embed',
+    'bokeh.models',
+    'bokeh.palettes',
+    'bokeh.plotting',
+)
+
 log = logging.getLogger(__name__)
 
 bokeh_server = flask.Blueprint("bokeh", "bokeh", url_prefix="/bokeh")
@@ -26,12 +34,17 @@ THEME_DICT = {
     "default": {"fg_color": "white"},
 }
 
-MARKER_TYPE_TUP = tuple(bokeh.core.enums.MarkerType)
+
+@functools.cache
+def get_marker_type_tup():
+    return tuple(bokeh.core.enums.MarkerType)
+
 
 # TODO: Check if these functions can use the regular disk caching now.
 
 
 @bokeh_server.route("/xy-plot/<rid>/<width>/<parm_uri>")
+@dex.http_cache.conditional
 def xy_plot(rid, width, parm_uri):
     # parm_dict = N(**json.loads(parm_uri))
     parm_dict = json.loads(parm_uri)
@@ -42,20 +55,21 @@ def xy_plot(rid, width, parm_uri):
 
     csv_df, raw_df, eml_ctx = dex.csv_parser.get_parsed_csv_with_context(rid)
 
-    # If a subset was included in the query args, only plot the subset
-    subset_json = flask.request.args.get('subset')
-    if subset_json:
-        subset_dict = json.loads(subset_json)
-        if subset_dict is not None:
-            csv_df = dex.views.util.create_subset(rid, csv_df, subset_dict)
+    with dex.timing.span('filter'):
+        # If a subset was included in the query args, only plot the subset
+        subset_json = flask.request.args.get('subset')
+        if subset_json:
+            subset_dict = json.loads(subset_json)
+            if subset_dict is not None:
+                csv_df = dex.views.util.create_subset(rid, csv_df, subset_dict)
 
-    # If there are still too many points to plot (after possible subset), subsample
-    # the plot.
-    csv_df = dex.csv_cache.get_sample(csv_df)
+        # If there are still too many points to plot (after possible subset), subsample
+        # the plot.
+        csv_df = dex.csv_cache.get_sample(csv_df)
 
-    # When the lines function is used, it's important to plot the points in the correct
-    # order (to avoid criss-crossing lines).
-    csv_df = csv_df.sort_index()
+        # When the lines function is used, it's important to plot the points in the
+        # correct order (to avoid criss-crossing lines).
+        csv_df = csv_df.sort_index()
 
     # csv_df.sort_values('TIMESTAMP', inplace=True)
 
@@ -96,7 +110,7 @@ def xy_plot(rid, width, parm_uri):
             y=csv_df.columns[y_col_idx],
             size=7,
             fill_color=color_str,
-            marker=MARKER_TYPE_TUP[y_idx],
+            marker=get_marker_type_tup()[y_idx],
         )
         glyph_renderer = fig.add_glyph(source, glyph)
         legend_list = [glyph_renderer]
@@ -125,10 +139,12 @@ def xy_plot(rid, width, parm_uri):
 
     fig.add_layout(legend)
 
-    plot_json = json.dumps(bokeh.embed.json_item(fig), cls=dex.util.DatetimeEncoder)
+    with dex.timing.span('render'):
+        item_dict = bokeh.embed.json_item(fig)
+    response = dex.util.json_response(item_dict)
 
     # Simulate large obj/slow server
     # import time
     # time.sleep(5)
 
-    return plot_json
+    return response
@@ -0,0 +1,56 @@
+"""View for the debug panel, which is fetched separately from the pages that show it
+"""
+
+import logging
+
+import flask
+
+import dex.debug
+import dex.http_cache
+import dex.request_profile
+
+log = logging.getLogger(__name__)
+
+debug_blueprint = flask.Blueprint("debug", __name__, url_prefix="/dex/debug")
+
+
+@debug_blueprint.route("/<rid>")
+@dex.http_cache.conditional
+def panel(rid):
+    # The panel includes the app config, so is only available when enabled by cookie,
+    # as when it was rendered into the pages.
+    if not flask.g.debug_panel:
+        return 'The debug panel is not enabled', 404
+    return flask.render_template(
+        "debug-panel.html",
+        dbg=dex.debug.get_debug_panel_dict(rid),
+    )
+
+
+@debug_blueprint.route("/profiles")
+def profile_list():
+    if not dex.request_profile.is_allowed():
+        return 'Profiles are not available', 404
+    rid = flask.request.args.get('rid')
+    return flask.render_template(
+        "debug-profiles.html",
+        rid=rid,
+        profile_list=dex.request_profile.get_profile_list(rid),
+    )
+
+
+@debug_blueprint.route("/profiles/<name>")
+def profile(name):
+    if not dex.request_profile.is_allowed():
+        return 'Profiles are not available', 404
+    profile_path = dex.request_profile.get_profile_path(name)
+    if profile_path is None:
+        return 'Profile not found', 404
+    if profile_path.suffix == '.html' or flask.request.args.get('raw') == 'true':
+        return flask.send_file(profile_path, as_attachment=profile_path.suffix != '.html')
+    return flask.Response(
+        dex.request_profile.render_pstats(
+            profile_path, flask.request.args.get('sort', 'cumulative')
+        ),
+        mimetype='text/plain',
+    )
@@ -5,16 +5,26 @@ import logging
 
 import flask
 
+import dex.cache
 import dex.csv_cache
 import dex.db
 import dex.debug
 import dex.eml_cache
+import dex.http_cache
 import dex.pasta
 
 log = logging.getLogger(__name__)
 
 eml_blueprint = flask.Blueprint("eml", __name__, url_prefix="/dex/eml")
 
+# Cache codec -> HTTP Content-Encoding, for the codecs that browsers can decode.
+CONTENT_ENCODING_DICT = {
+    'gzip': 'gzip',
+    'zstd': 'zstd',
+}
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
 """
 {# https://dex.edirepository.org/ #}
 
@@ -37,18 +47,10 @@ none 	none 	curl -i -X GET https://pasta.lternet.edu/package/metadata/eml/knb-lt
 
 
 @eml_blueprint.route("/<rid>")
+@dex.http_cache.conditional
 def view(rid):
-    eml_html, eml_css = dex.eml_cache.get_eml_as_highlighted_html(rid)
-
-    # dbg = dex.eml_cache.get_breakdown(rid)
-    # dbg = ''
-
     return flask.render_template(
         "eml.html",
-        t1=dex.eml_cache.get_datetime_columns(rid),
-        g_dict={eml_html: eml_html, eml_css: eml_css},
-        eml_html=eml_html,
-        eml_css=eml_css,
         # For the base template, should be included in all render_template() calls.
         rid=rid,
         data_url=dex.db.get_data_url(rid),
@@ -59,3 +61,58 @@ def view(rid):
         is_on_pasta=dex.pasta.is_on_pasta(dex.db.get_dist_url(rid)),
         dbg=None,
     )
+
+
+@eml_blueprint.route("/page/<rid>")
+def page(rid):
+    """Serve the syntax highlighted EML page directly from the cache file.
+
+    The file is sent in the encoding it was stored with if the client accepts it, so
+    the page is neither built in memory nor compressed for each request. Clients that
+    don't accept the encoding receive a decompressed stream.
+    """
+    try:
+        return _send_page(rid)
+    except FileNotFoundError:
+        # The cache for the rid was flushed or evicted between resolving the path and
+        # opening the file, so the page is created again.
+        log.debug(f'Cached EML page was deleted while opening it. Recreating: rid={rid}')
+        return _send_page(rid)
+
+
+def _send_page(rid):
+    """Send the cached page, creating it if it is not already in the cache.
+
+    The file is opened before returning, so the response can be streamed even if the
+    file is deleted after that. Raises FileNotFoundError if the file is deleted before it
+    is opened.
+    """
+    page_path, codec = dex.eml_cache.get_eml_page_path(rid)
+    content_encoding = CONTENT_ENCODING_DICT.get(codec)
+    if codec == 'none' or (
+        content_encoding and flask.request.accept_encodings[content_encoding]
+    ):
+        response = flask.send_file(
+            page_path,
+            mimetype='text/html',
+            etag=True,
+            conditional=True,
+            max_age=flask.current_app.config['PAGE_MAX_AGE_SEC'],
+        )
+        if content_encoding:
+            response.headers['Content-Encoding'] = content_encoding
+    else:
+        response = flask.Response(
+            _stream_decoded(dex.cache.open_codec(page_path, codec)),
+            mimetype='text/html',
+        )
+        response.cache_control.public = True
+        response.cache_control.max_age = flask.current_app.config['PAGE_MAX_AGE_SEC']
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def _stream_decoded(f):
+    with f:
+        while chunk_bytes := f.read(STREAM_CHUNK_SIZE):
+            yield chunk_bytes
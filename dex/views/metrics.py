@@ -0,0 +1,23 @@
+"""View for the metrics, which are fetched by Prometheus or a compatible scraper
+"""
+
+import logging
+
+import flask
+
+import dex.metrics
+
+log = logging.getLogger(__name__)
+
+metrics_blueprint = flask.Blueprint("metrics", __name__)
+
+
+@metrics_blueprint.route("/metrics")
+def metrics():
+    config = flask.current_app.config
+    allowed_addr_set = config['METRICS_ALLOWED_ADDR_SET']
+    if not config['METRICS_ENABLED'] or (
+        allowed_addr_set is not None and flask.request.remote_addr not in allowed_addr_set
+    ):
+        return 'Not found', 404
+    return flask.Response(dex.metrics.render(), mimetype='text/plain; version=0.0.4')
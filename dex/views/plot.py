@@ -2,7 +2,6 @@ import json
 import logging
 
 import flask
-from flask import current_app as app
 
 import dex.csv_cache
 import dex.csv_parser
@@ -27,23 +26,26 @@ def plot(rid):
     CAT is not on either axis
     UNSUPPORTED is not on either axis
     """
-    csv_df, raw_df, eml_ctx = dex.csv_parser.get_parsed_csv_with_context(rid)
-    full_row_count = subset_row_count = len(csv_df)
+    summary_dict = dex.csv_cache.get_dataset_summary(rid)
+    full_row_count = subset_row_count = summary_dict['row_count']
+    col_agg_dict = summary_dict['plottable_col_agg_dict']
 
-    # Plot a subset
+    # Plot a subset. The aggregates must then be calculated for the subset, which
+    # requires loading the CSV.
     subset_dict = None
     subset_json = flask.request.form.get('subset')
     if subset_json:
         subset_dict = json.loads(subset_json)
         if subset_dict is not None:
+            csv_df, raw_df, eml_ctx = dex.csv_parser.get_parsed_csv_with_context(rid)
             csv_df = dex.views.util.create_subset(rid, csv_df, subset_dict)
             subset_row_count = len(csv_df)
+            col_agg_dict = dex.csv_cache.get_plottable_col_aggregates(csv_df, eml_ctx)
 
     #
     col_list = []
-    col_agg_dict = dex.csv_cache.get_plottable_col_aggregates(csv_df, eml_ctx)
 
-    for col_idx, col_dict in enumerate(eml_ctx['column_list']):
+    for col_idx, col_dict in enumerate(summary_dict['column_list']):
         if col_idx not in col_agg_dict:
             continue
 
@@ -63,7 +65,7 @@ def plot(rid):
     # dex.util.logpp(g_dict, msg='Plot g_dict', logger=log.debug)
 
     note_list = []
-    if full_row_count == app.config['CSV_MAX_CELLS'] // len(eml_ctx['column_list']):
+    if summary_dict['is_truncated']:
         note_list.append('Due to size, only the first part of this table is available in DeX')
     if full_row_count > subset_row_count:
         note_list.append(
@@ -1,8 +1,6 @@
 import logging
 
 import flask
-import ydata_profiling
-from flask import current_app as app
 
 import dex.cache
 import dex.csv_cache
@@ -10,10 +8,14 @@ import dex.csv_parser
 import dex.db
 import dex.debug
 import dex.eml_cache
+import dex.http_cache
+import dex.lazy
 import dex.obj_bytes
 import dex.pasta
 import dex.util
 
+ydata_profiling = dex.lazy.LazyModule('ydata_profiling')
+
 log = logging.getLogger(__name__)
 
 profile_blueprint = flask.Blueprint("profile", __name__, url_prefix="/dex/profile")
@@ -22,10 +24,8 @@ profile_blueprint = flask.Blueprint("profile", __name__, url_prefix="/dex/profil
 # noinspection PyUnresolvedReferences
 @profile_blueprint.route("/<rid>")
 def profile(rid):
-    csv_df, raw_df, eml_ctx = dex.csv_parser.get_parsed_csv_with_context(rid)
-
     note_list = []
-    if len(csv_df) == app.config['CSV_MAX_CELLS'] // len(eml_ctx['column_list']):
+    if dex.csv_cache.get_dataset_summary(rid)['is_truncated']:
         note_list.append('Due to size, only the first part of this table is available in DeX')
 
     note_list.append('This analysis may not match the EML metadata for all columns')
@@ -56,6 +56,7 @@ def profile(rid):
 
 
 @profile_blueprint.route("/doc/<rid>")
+@dex.http_cache.conditional
 def doc(rid):
     """Return the Pandas Profiling HTML doc for the given rid. If the profile has not
     been generated, this holds the connection until the doc is ready, then returns it."""
@@ -8,7 +8,6 @@ import re
 import zipfile
 
 import flask
-import pandas as pd
 
 import dex.csv_cache
 import dex.csv_parser
@@ -17,10 +16,15 @@ import dex.debug
 import dex.eml_cache
 import dex.eml_extract
 import dex.eml_subset
+import dex.http_cache
+import dex.lazy
 import dex.pasta
+import dex.timing
 import dex.util
 import dex.views.util
 
+pd = dex.lazy.LazyModule('pandas')
+
 log = logging.getLogger(__name__)
 
 subset_blueprint = flask.Blueprint("subset", __name__, url_prefix="/dex/subset")
@@ -30,27 +34,20 @@ DEFAULT_DISPLAY_ROW_COUNT = 10
 
 @subset_blueprint.route("/<rid>", methods=["GET"])
 def subset(rid):
-    csv_df, raw_df, eml_ctx = dex.csv_parser.get_parsed_csv_with_context(rid)
-    datetime_col_dict = dex.csv_cache.get_datetime_col_dict(csv_df, eml_ctx)
+    summary_dict = dex.csv_cache.get_dataset_summary(rid)
+    datetime_col_dict = summary_dict['datetime_col_dict']
     cat_col_map = {d['col_name']: d for d in dex.eml_cache.get_categorical_columns(rid)}
-    # Copy the fields that we need to transfer to the client, excluding fields that
-    # cannot be represented in JSON.
-    column_list = [
-        dict(
-            col_idx=d['col_idx'],
-            col_name=d['col_name'],
-            pandas_type=d['pandas_type'],
-        )
-        for d in eml_ctx['column_list']
-    ]
+    # The fields that we need to transfer to the client, excluding fields that cannot be
+    # represented in JSON.
+    column_list = summary_dict['column_list']
 
     note_list = []
-    if len(csv_df) == flask.current_app.config['CSV_MAX_CELLS'] // len(column_list):
+    if summary_dict['is_truncated']:
         note_list.append('Due to size, only the first part of this table is available in DeX')
 
     # Create an empty HTML table to fill in dynamically.
     empty_df = pd.DataFrame(
-        columns=csv_df.columns,
+        columns=summary_dict['col_name_list'],
     )
     empty_df.columns.name = 'Index'
     csv_html = empty_df.to_html(
@@ -66,7 +63,7 @@ def subset(rid):
         g_dict=dict(
             rid=rid,
             pkg_id=dex.eml_cache.get_pkg_id_dict(rid),
-            row_count=len(csv_df),
+            row_count=summary_dict['row_count'],
             column_list=column_list,
             cat_col_map=cat_col_map,
             filter_not_applied_str='Filter not applied',
@@ -146,55 +143,60 @@ def csv_fetch(rid):
     is_ascending = args.get("order[0][dir]") == "asc"
 
     csv_df, raw_df, eml_ctx = dex.csv_parser.get_parsed_csv_with_context(rid)
-    query_result = get_raw_filtered_by_query(csv_df, query_str)
-    csv_df = query_result.csv_df
+    with dex.timing.span('filter'):
+        query_result = get_raw_filtered_by_query(csv_df, query_str)
+        csv_df = query_result.csv_df
 
-    # For the remainder of this function, we deal only with raw_df, which contains
-    # unparsed strings.
+        # For the remainder of this function, we deal only with raw_df, which contains
+        # unparsed strings.
 
-    raw_df = raw_df.iloc[csv_df.index, :]
+        raw_df = raw_df.iloc[csv_df.index, :]
 
     # Create page of filtered result for display (selected with the [1], [2]... buttons).
     # Sort the rows according to selection
-    if not sort_col_idx:
-        raw_df = raw_df.sort_index(ascending=is_ascending)
-    else:
-        raw_df = raw_df.rename_axis("__Index").sort_values(
-            by=[raw_df.columns[sort_col_idx - 1], "__Index"],
-            ascending=is_ascending,
-        )
-
-    page_df = raw_df[start_int : start_int + row_count]
-
-    # Create table of cells for which to show the parse error notice.
-    bad_list = []
-    # Rows
-    for i in range(page_df.shape[0]):
-        c = []
-        # Columns
-        for j in range(page_df.shape[1]):
-            raw_v = page_df.iat[i, j]
-            parsed_v = csv_df.iat[start_int + i, j]
-            # A cell has failed parsing if the parsed value is NaN while the raw value
-            # is not in the EML Missing Code set or the set of common known NaN codes.
-            if (
-                raw_v in eml_ctx['column_list'][j]['missing_code_list']
-                or raw_v in flask.current_app.config['CSV_NAN_SET']
-            ):
-                is_invalid = False
-            else:
-                is_invalid = parsed_v is None or (
-                    isinstance(parsed_v, float) and math.isnan(parsed_v)
-                )
-            c.append(is_invalid)
-        bad_list.append(c)
-
-    j = json.loads(page_df.to_json(orient="split", index=True))
-    row_list = [(a, *b) for a, b in zip(j["index"], j["data"])]
-
-    for i in range(len(row_list), DEFAULT_DISPLAY_ROW_COUNT):
-        row_list.append(('', *[''] * len(raw_df.columns)))
-        bad_list.append([False] * len(raw_df.columns))
+    with dex.timing.span('sort'):
+        if not sort_col_idx:
+            raw_df = raw_df.sort_index(ascending=is_ascending)
+        else:
+            raw_df = raw_df.rename_axis("__Index").sort_values(
+                by=[raw_df.columns[sort_col_idx - 1], "__Index"],
+                ascending=is_ascending,
+            )
+
+    with dex.timing.span('page'):
+        page_df = raw_df[start_int : start_int + row_count]
+
+        # Create table of cells for which to show the parse error notice.
+        bad_list = []
+        # Rows
+        for i in range(page_df.shape[0]):
+            c = []
+            # Columns
+            for j in range(page_df.shape[1]):
+                raw_v = page_df.iat[i, j]
+                parsed_v = csv_df.iat[start_int + i, j]
+                # A cell has failed parsing if the parsed value is NaN while the raw value
+                # is not in the EML Missing Code set or the set of common known NaN codes.
+                if (
+                    raw_v in eml_ctx['column_list'][j]['missing_code_list']
+                    or raw_v in flask.current_app.config['CSV_NAN_SET']
+                ):
+                    is_invalid = False
+                else:
+                    is_invalid = parsed_v is None or (
+                        isinstance(parsed_v, float) and math.isnan(parsed_v)
+                    )
+                c.append(is_invalid)
+            bad_list.append(c)
+
+        row_list = [
+            (a, *b)
+            for a, b in zip(page_df.index.tolist(), dex.util.get_json_row_list(page_df))
+        ]
+
+        for i in range(len(row_list), DEFAULT_DISPLAY_ROW_COUNT):
+            row_list.append(('', *[''] * len(raw_df.columns)))
+            bad_list.append([False] * len(raw_df.columns))
 
     row_dict_list = [{'val': v} for v in row_list]
 
@@ -213,10 +215,7 @@ def csv_fetch(rid):
 
     # util.logpp(result_dict, 'Returning to client', log.debug)
 
-    return json.dumps(
-        result_dict,
-        cls=dex.util.DatetimeEncoder,
-    )
+    return dex.util.json_response(result_dict)
 
 
 @subset_blueprint.route("/<rid>", methods=["POST"])
@@ -224,16 +223,18 @@ def download(rid):
     filter_dict = json.loads(flask.request.data)
     csv_df, raw_df, eml_ctx = dex.csv_parser.get_parsed_csv_with_context(rid)
     unfiltered_row_count = len(csv_df)
-    csv_df = dex.views.util.create_subset(rid, csv_df, filter_dict)
-    # Return the raw CSV rows that correspond to the rows we have filtered using the parsed CSV.
-    csv_df = raw_df.iloc[csv_df.index, :]
-    # Filter columns from the raw df
-    csv_df = dex.views.util.filter_columns(csv_df, filter_dict)
+    with dex.timing.span('filter'):
+        csv_df = dex.views.util.create_subset(rid, csv_df, filter_dict)
+        # Return the raw CSV rows that correspond to the rows we have filtered using the parsed CSV.
+        csv_df = raw_df.iloc[csv_df.index, :]
+        # Filter columns from the raw df
+        csv_df = dex.views.util.filter_columns(csv_df, filter_dict)
     #
-    csv_bytes = csv_df.to_csv(
-        index=filter_dict["column_filter"]['index'],
-        index_label='Index',
-    ).encode('utf-8')
+    with dex.timing.span('serialize'):
+        csv_bytes = csv_df.to_csv(
+            index=filter_dict["column_filter"]['index'],
+            index_label='Index',
+        ).encode('utf-8')
 
     # Prepare JSON doc containing the subset params
     json_bytes = json.dumps(
@@ -277,7 +278,7 @@ def download(rid):
 
 def send_zip(zip_name, zip_dict):
     zip_bytes = io.BytesIO()
-    with zipfile.ZipFile(zip_bytes, mode='w') as z:
+    with dex.timing.span('zip'), zipfile.ZipFile(zip_bytes, mode='w') as z:
         for f_name, f_bytes in zip_dict.items():
             z.writestr(f_name, f_bytes)
     zip_bytes.seek(0)
@@ -292,6 +293,7 @@ def send_zip(zip_name, zip_dict):
 
 # noinspection PyTypeChecker
 @subset_blueprint.route("/fetch-category/<rid>/<col_idx>")
+@dex.http_cache.conditional
 def fetch_category(rid, col_idx):
     """Return a list of the unique values in a column. This will only be called for
     columns that have already been determined to be categorical.
@@ -304,10 +306,7 @@ def fetch_category(rid, col_idx):
     # import time
     # time.sleep(5)
 
-    json_str = json.dumps(list(res_list))
-    # json_str = json.dumps(list(res_list), cls=util.DatetimeEncoder)
-    log.debug('json_str', json_str)
-    return json_str
+    return dex.util.json_response(list(res_list))
 
 
 def get_package_id(purl: str) -> str:
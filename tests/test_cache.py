@@ -0,0 +1,33 @@
+import pytest
+
+import dex.cache
+import dex.exc
+
+
+@pytest.mark.parametrize('codec', list(dex.cache.CODEC_EXT_DICT))
+def test_1000(tmpdir, codec):
+    """open_codec(): Round trip through each available codec"""
+    if not dex.cache.is_codec_available(codec):
+        pytest.skip(f'Codec not installed: {codec}')
+    p = tmpdir / f'test.df{dex.cache.CODEC_EXT_DICT[codec]}'
+    obj_bytes = b'0123456789' * 10000
+    with dex.cache.open_codec(p, codec, for_write=True) as f:
+        f.write(obj_bytes)
+    with dex.cache.open_codec(p, codec) as f:
+        assert f.read() == obj_bytes
+    if codec != 'none':
+        assert p.stat().st_size < len(obj_bytes)
+
+
+def test_1010(config):
+    """get_write_codec(): Selects codec by object type, with fallback to the default"""
+    config['CACHE_DEFAULT_CODEC'] = 'none'
+    config['CACHE_CODEC_DICT'] = {'html': 'xz'}
+    assert dex.cache.get_write_codec('html') == 'xz'
+    assert dex.cache.get_write_codec('df') == 'none'
+
+
+def test_1020(tmpdir):
+    """open_codec(): Unknown codec raises"""
+    with pytest.raises(dex.exc.CacheError):
+        dex.cache.open_codec(tmpdir / 'test.df', 'unknown')
@@ -0,0 +1,100 @@
+import time
+
+import dex.cache
+import dex.cache_index
+
+
+def mk_index(tmpdir):
+    return dex.cache_index.CacheIndex(tmpdir / 'index.sqlite')
+
+
+def mk_group(root_path, cache_index, grp, byte_count, access_ts):
+    grp_path = root_path / grp
+    grp_path.mkdir(parents=True)
+    (grp_path / 'head.df').write_bytes(b'x' * byte_count)
+    cache_index.add(grp, 'head.df', byte_count, obj_type='df', access_ts=access_ts)
+
+
+def test_1000(tmpdir):
+    """Size accounting per group and per object type"""
+    cache_index = mk_index(tmpdir)
+    cache_index.add('a', 'head.df', 10, obj_type='df', rid=1)
+    cache_index.add('a', 'profile.html', 100, obj_type='html', rid=1)
+    cache_index.add('b', 'head.df', 20, obj_type='df', rid=2)
+    assert cache_index.get_total_bytes() == 130
+    assert {r.grp: r.byte_count for r in cache_index.get_group_list()} == {'a': 110, 'b': 20}
+    assert [(r.obj_type, r.byte_count) for r in cache_index.get_type_list()] == [
+        ('html', 100),
+        ('df', 30),
+    ]
+    cache_index.remove('a', 'profile.html')
+    assert cache_index.get_total_bytes() == 30
+    cache_index.remove('b')
+    assert cache_index.get_total_bytes() == 10
+
+
+def test_1010(tmpdir):
+    """Groups are listed least recently used first"""
+    cache_index = mk_index(tmpdir)
+    now_ts = time.time()
+    cache_index.add('a', 'head.df', 10, access_ts=now_ts - 300)
+    cache_index.add('b', 'head.df', 10, access_ts=now_ts - 200)
+    cache_index.add('c', 'head.df', 10, access_ts=now_ts - 100)
+    cache_index.touch('a', 'head.df')
+    assert [r.grp for r in cache_index.get_group_list()] == ['b', 'c', 'a']
+
+
+def test_1015(tmpdir):
+    """touch_group(): Records an access to all objects in the group"""
+    cache_index = mk_index(tmpdir)
+    now_ts = time.time()
+    cache_index.add('a', 'head.df', 10, access_ts=now_ts - 300)
+    cache_index.add('a', 'eml-page.page', 10, access_ts=now_ts - 300)
+    cache_index.add('b', 'head.df', 10, access_ts=now_ts - 200)
+    cache_index.touch_group('a')
+    assert [r.grp for r in cache_index.get_group_list()] == ['b', 'a']
+    assert all(r.access_ts >= now_ts for r in cache_index.get_group_obj_list('a'))
+
+
+def test_1020(tmpdir):
+    """evict(): Deletes least recently used datasets until below the limit, and leaves
+    recently used datasets alone"""
+    cache_index = mk_index(tmpdir)
+    root_path = tmpdir / 'cache'
+    now_ts = time.time()
+    mk_group(root_path, cache_index, 'a', 100, now_ts - 3000)
+    mk_group(root_path, cache_index, 'b', 100, now_ts - 2000)
+    mk_group(root_path, cache_index, 'c', 100, now_ts - 1000)
+    mk_group(root_path, cache_index, 'd', 100, now_ts)
+    assert dex.cache.evict(cache_index, root_path, 250, min_age_sec=500) == 2
+    assert sorted(p.name for p in root_path.iterdir()) == ['c', 'd']
+    assert cache_index.get_total_bytes() == 200
+    # The remaining datasets are too recently used to be evicted
+    assert dex.cache.evict(cache_index, root_path, 50, min_age_sec=5000) == 0
+    assert sorted(p.name for p in root_path.iterdir()) == ['c', 'd']
+
+
+def test_1025(tmpdir):
+    """evict(): Keeps the generation token of evicted datasets"""
+    cache_index = mk_index(tmpdir)
+    root_path = tmpdir / 'cache'
+    mk_group(root_path, cache_index, 'a', 100, time.time() - 3000)
+    (root_path / 'a' / dex.cache.GENERATION_FILE_NAME).write_text('gen')
+    assert dex.cache.evict(cache_index, root_path, 50, min_age_sec=500) == 1
+    assert [p.name for p in (root_path / 'a').iterdir()] == [dex.cache.GENERATION_FILE_NAME]
+    assert cache_index.get_total_bytes() == 0
+
+
+def test_1030(tmpdir):
+    """scan(): Rebuilds the index from a cache directory"""
+    cache_index = mk_index(tmpdir)
+    root_path = tmpdir / 'cache'
+    (root_path / 'a').mkdir(parents=True)
+    (root_path / 'a' / 'head.df.zst').write_bytes(b'x' * 10)
+    (root_path / 'a' / 'csv_name.text').write_bytes(b'x' * 5)
+    cache_index.scan(root_path, dex.cache._get_obj_type_from_path)
+    assert cache_index.get_total_bytes() == 15
+    assert sorted((r.name, r.obj_type) for r in cache_index.get_group_obj_list('a')) == [
+        ('csv_name.text', 'text'),
+        ('head.df.zst', 'df'),
+    ]
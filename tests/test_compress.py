@@ -0,0 +1,101 @@
+import gzip
+
+import flask
+import pytest
+
+import dex.compress
+
+BODY_STR = 'compressible text ' * 1000
+
+
+@pytest.fixture
+def client(app, app_context):
+    app.add_url_rule('/test/small', 'small', lambda: 'small')
+    app.add_url_rule('/test/large', 'large', lambda: BODY_STR)
+    app.add_url_rule(
+        '/test/json', 'json', lambda: flask.Response(BODY_STR, mimetype='application/json')
+    )
+    app.add_url_rule(
+        '/test/stream',
+        'stream',
+        lambda: flask.Response(
+            flask.stream_with_context(iter(BODY_STR.split(' '))), mimetype='text/html'
+        ),
+    )
+    app.add_url_rule(
+        '/test/encoded',
+        'encoded',
+        lambda: flask.Response(
+            gzip.compress(b'x'), mimetype='text/html', headers={'Content-Encoding': 'gzip'}
+        ),
+    )
+    app.add_url_rule(
+        '/test/binary',
+        'binary',
+        lambda: flask.Response(BODY_STR, mimetype='application/octet-stream'),
+    )
+    return app.test_client()
+
+
+def get(client, path, encoding_str='gzip'):
+    return client.get(path, headers={'Accept-Encoding': encoding_str})
+
+
+def test_1000(client):
+    """compress_response(): Large text responses are gzip compressed"""
+    response = get(client, '/test/large')
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert int(response.headers['Content-Length']) < len(BODY_STR) // 10
+    assert gzip.decompress(response.data).decode('utf-8') == BODY_STR
+
+
+def test_1010(client):
+    """compress_response(): Small responses, unaccepted encodings, non-text types and
+    pre-encoded responses are sent as they are"""
+    assert 'Content-Encoding' not in get(client, '/test/small').headers
+    assert 'Content-Encoding' not in get(client, '/test/large', 'identity').headers
+    assert 'Content-Encoding' not in get(client, '/test/binary').headers
+    response = get(client, '/test/encoded')
+    assert gzip.decompress(response.data) == b'x'
+
+
+def test_1020(client):
+    """compress_response(): Streamed responses are compressed while streaming"""
+    response = get(client, '/test/stream')
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Content-Length' not in response.headers
+    assert gzip.decompress(response.data).decode('utf-8') == BODY_STR.replace(' ', '')
+
+
+def test_1030(client):
+    """compress_response(): JSON is compressed"""
+    response = get(client, '/test/json')
+    assert response.headers['Content-Encoding'] == 'gzip'
+
+
+def test_1040(client, config):
+    """compress_response(): Can be disabled"""
+    config['RESPONSE_COMPRESSION_ENABLED'] = False
+    assert 'Content-Encoding' not in get(client, '/test/large').headers
+
+
+@pytest.mark.skipif(dex.compress.brotli is None, reason='brotli is not installed')
+def test_1050(client):
+    """compress_response(): brotli is preferred when accepted"""
+    response = get(client, '/test/large', 'gzip, br')
+    assert response.headers['Content-Encoding'] == 'br'
+    assert dex.compress.brotli.decompress(response.data).decode('utf-8') == BODY_STR
+
+
+def test_1060(client, app):
+    """compress_response(): Strong ETags are weakened when the response is compressed"""
+
+    def view():
+        response = flask.make_response(BODY_STR)
+        response.set_etag('abc')
+        return response
+
+    app.add_url_rule('/test/etag', 'etag', view)
+    assert get(client, '/test/etag').headers['ETag'] == 'W/"abc"'
+    assert get(client, '/test/etag', 'identity').headers['ETag'] == '"abc"'
@@ -1,20 +1,73 @@
-import pathlib
-
+import bz2
+import gzip
+import io
 import lzma
+import zipfile
+
+import pytest
+
+import dex.exc
+import dex.obj_bytes
+
+CSV_BYTES = b'a,b,c\n' + b''.join(f'{i},{i * 2},x{i}\n'.encode() for i in range(50000))
+
+
+class NonSeekableStream(io.RawIOBase):
+    """Raw stream that returns bytes in small chunks and cannot seek, like an ongoing
+    download"""
+
+    def __init__(self, b):
+        self._stream = io.BytesIO(b)
+
+    def readable(self):
+        return True
 
+    def readinto(self, buf):
+        chunk_bytes = self._stream.read(min(len(buf), 1000))
+        buf[: len(chunk_bytes)] = chunk_bytes
+        return len(chunk_bytes)
 
-def test_1000():
-    with pathlib.Path('~/dex-data/tst.html.xz').expanduser().open('rb') as f:
-        with lzma.LZMAFile(f) as z:
-            for line in z:
-                print(line)
-            for line in z:
-                print(line)
+
+def mk_zip(compress_type):
+    zip_stream = io.BytesIO()
+    with zipfile.ZipFile(zip_stream, 'w', compression=compress_type) as z:
+        z.writestr('data/', b'')
+        z.writestr('data/obj.csv', CSV_BYTES)
+    return zip_stream.getvalue()
+
+
+COMPRESSED_DICT = {
+    'none': CSV_BYTES,
+    'gzip': gzip.compress(CSV_BYTES),
+    'xz': lzma.compress(CSV_BYTES),
+    'bzip2': bz2.compress(CSV_BYTES),
+    'zip-deflate': mk_zip(zipfile.ZIP_DEFLATED),
+    'zip-stored': mk_zip(zipfile.ZIP_STORED),
+}
+
+
+@pytest.mark.parametrize('name', COMPRESSED_DICT)
+@pytest.mark.parametrize('is_seekable', [True, False])
+def test_1000(name, is_seekable):
+    """_get_decompressed_stream(): Detects the format and returns decompressed bytes,
+    for both local files and non-seekable download streams"""
+    b = COMPRESSED_DICT[name]
+    raw_stream = io.BytesIO(b) if is_seekable else NonSeekableStream(b)
+    stream = io.BufferedReader(raw_stream)
+    assert dex.obj_bytes._get_decompressed_stream(stream).read() == CSV_BYTES
 
 
 def test_1010():
-    with pathlib.Path('~/dex-data/tst.html.xz').expanduser().open('rb') as f:
-        with lzma.LZMAFile(f) as z:
-            z.seek(100)
-            print(z.read(100))
-            print(z.tell())
+    """_get_decompressed_stream(): Plain CSV that happens to start with 'BZh' is not
+    detected as bzip2"""
+    b = b'BZh9,x,y\n1,2,3\n'
+    stream = io.BufferedReader(NonSeekableStream(b))
+    assert dex.obj_bytes._get_decompressed_stream(stream).read() == b
+
+
+def test_1020():
+    """_get_decompressed_stream(): Truncated zip download raises CacheError"""
+    b = COMPRESSED_DICT['zip-deflate'][:1000]
+    stream = io.BufferedReader(NonSeekableStream(b))
+    with pytest.raises(dex.exc.CacheError):
+        dex.obj_bytes._get_decompressed_stream(stream).read()
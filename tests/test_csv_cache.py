@@ -1,7 +1,10 @@
 import lxml.etree
+import pandas as pd
 
 import dex.cache
+import dex.csv_cache
 import dex.csv_parser
+import dex.db
 import dex.obj_bytes
 import dex.eml_cache
 
@@ -45,3 +48,33 @@ def test_1020(rid):
 # def test_1020():
 #     rid = dex.db.add_entity(data_url)
 #     rid, key, obj_type
+
+
+def test_2000(app_context, tmp_cache, config, monkeypatch):
+    """get_dataset_summary(): Row count, columns, datetime ranges and plot aggregates"""
+    config['DISK_CACHE_ENABLED'] = False
+    config['CSV_MAX_CELLS'] = 6
+    csv_df = pd.DataFrame(
+        {
+            'dt': pd.to_datetime(['2001-02-03', '2004-05-06', '2002-01-01']),
+            'num': [3, 1, 2],
+        }
+    )
+    eml_ctx = {
+        'column_list': [
+            dict(col_idx=0, col_name='dt', pandas_type='DATETIME', missing_code_list=[]),
+            dict(col_idx=1, col_name='num', pandas_type='INT', missing_code_list=[]),
+        ],
+        'formatter_dict': {0: lambda dt: dt.strftime('%Y'), 1: None},
+    }
+    monkeypatch.setattr(dex.csv_parser, 'get_eml_ctx', lambda rid: eml_ctx)
+    monkeypatch.setattr(dex.csv_parser, 'get_parsed_csv', lambda rid, ctx: csv_df)
+    monkeypatch.setattr(dex.db, 'get_dist_url', lambda rid: 'dist_1')
+    summary_dict = dex.csv_cache.get_dataset_summary(1)
+    assert summary_dict['row_count'] == 3
+    assert summary_dict['is_truncated']
+    assert summary_dict['col_name_list'] == ['dt', 'num']
+    assert summary_dict['column_list'][1] == dict(col_idx=1, col_name='num', pandas_type='INT')
+    assert summary_dict['datetime_col_dict']['dt']['begin_yyyy_mm_dd_str'] == '2001-02-03'
+    assert summary_dict['datetime_col_dict']['dt']['end_eml_date_str'] == '2004'
+    assert summary_dict['plottable_col_agg_dict'][1] == dict(col_name='num', v_max=3, v_min=1)
@@ -1,10 +1,19 @@
+import contextlib
 import csv
+import io
+import pickle
 import pprint
+
+import lxml.etree
+import pytest
+
+import dex.eml_extract
 import dex.util
 
 from flask import current_app as app
 
 import dex.csv_parser
+import dex.obj_bytes
 
 import logging
 
@@ -83,3 +92,93 @@ def test_1000(rid, tmp_cache):
     p(parser_dict, 'parser_dict')
     df = dex.csv_parser.get_parsed_csv(rid, header_line_count, parser_dict, Dialect1)
     df.info()
+
+
+EML_DATA_TABLE = """
+<dataTable>
+  <physical>
+    <dataFormat>
+      <textFormat>
+        <numHeaderLines>1</numHeaderLines>
+        <recordDelimiter>\\r\\n</recordDelimiter>
+        <simpleDelimited><fieldDelimiter>;</fieldDelimiter></simpleDelimited>
+      </textFormat>
+    </dataFormat>
+  </physical>
+  <attributeList>
+    <attribute>
+      <attributeName>depth</attributeName>
+      <measurementScale><ratio><numericDomain><numberType>real</numberType>
+      </numericDomain></ratio></measurementScale>
+    </attribute>
+    <attribute>
+      <attributeName>count</attributeName>
+      <measurementScale><ratio><numericDomain><numberType>integer</numberType>
+      </numericDomain></ratio></measurementScale>
+    </attribute>
+    <attribute>
+      <attributeName>date</attributeName>
+      <measurementScale><dateTime><formatString>YYYY-MM-DD</formatString>
+      </dateTime></measurementScale>
+    </attribute>
+  </attributeList>
+</dataTable>
+"""
+
+
+def test_2000():
+    """The EML context can be pickled, and parsers, formatters and the dialect can be
+    rebuilt from it"""
+    dt_el = lxml.etree.fromstring(EML_DATA_TABLE)
+    column_list = dex.eml_extract.get_col_attr_list(dt_el)
+    dialect_dict = dex.eml_extract.get_dialect_dict(dt_el)
+    column_list, dialect_dict = pickle.loads(pickle.dumps((column_list, dialect_dict)))
+
+    assert [d['pandas_type'] for d in column_list] == ['FLOAT', 'INT', 'DATETIME']
+    parser_dict = dex.csv_parser.get_parser_dict(column_list)
+    formatter_dict = dex.csv_parser.get_formatter_dict(column_list)
+    assert parser_dict[0]('1.5') == 1.5
+    assert parser_dict[1]('x') is None
+    dt = parser_dict[2]('2020-01-31')
+    assert dt.year == 2020 and dt.day == 31
+    assert formatter_dict[2](dt) == '2020-01-31'
+
+    dialect = dex.eml_extract.mk_dialect(dialect_dict)
+    assert dialect.delimiter == ';'
+    assert dialect.lineterminator == '\r\n'
+    assert list(csv.reader(['a;"b;c"'], dialect=dialect)) == [['a', 'b;c']]
+
+
+@pytest.mark.parametrize(
+    'row_count,expected_list',
+    [
+        # Whole table is read, and the footer lines are removed
+        (3, ['0', '1', '2']),
+        # Table is longer than the limit, and is truncated before the footer lines
+        (100, ['0', '1', '2', '3', '4']),
+    ],
+)
+def test_2010(app_context, config, monkeypatch, row_count, expected_list):
+    """_get_csv(): CSV_MAX_CELLS limits the rows of tables with footer lines"""
+    config['CSV_MAX_CELLS'] = 10
+    csv_bytes = (
+        'header\n'
+        + ''.join(f'{i},x\n' for i in range(row_count))
+        + 'footer 1,\nfooter 2,\n'
+    ).encode()
+
+    @contextlib.contextmanager
+    def open_csv_stream(_rid):
+        yield io.BytesIO(csv_bytes)
+
+    monkeypatch.setattr(dex.obj_bytes, 'open_csv_stream', open_csv_stream)
+    eml_ctx = dict(
+        pandas_type_dict={'a': 'INT', 'b': 'STRING'},
+        column_list=[dict(col_name='a'), dict(col_name='b')],
+        header_line_count=1,
+        footer_line_count=2,
+        dialect=csv.excel,
+        dialect_dict={},
+    )
+    csv_df = dex.csv_parser._get_csv(None, eml_ctx, do_parse=False)
+    assert list(csv_df['a']) == expected_list
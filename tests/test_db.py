@@ -0,0 +1,139 @@
+import gc
+import sqlite3
+import threading
+
+import dex.db
+
+
+def test_1000(app_context):
+    """get_entity(): Lookups are cached, and the cache is invalidated when the entity
+    is dropped"""
+    rid = dex.db.add_entity('dist_1', 'meta_1', 'data_1')
+    assert dex.db.get_entity(rid) == ('dist_1', 'meta_1', 'data_1')
+    dex.db.get_db().execute("""update entity set dist_url = 'changed' where id = ?""", (rid,))
+    assert dex.db.get_dist_url(rid) == 'dist_1'
+    dex.db.drop_entity(rid)
+    rid_2 = dex.db.add_entity('dist_2', 'meta_2', 'data_2')
+    assert dex.db.get_entity(rid_2) == ('dist_2', 'meta_2', 'data_2')
+
+
+def test_1010(app_context):
+    """get_entity(): Clearing entities clears the cache"""
+    rid = dex.db.add_entity('dist_1', 'meta_1', 'data_1')
+    assert dex.db.get_data_url(rid) == 'data_1'
+    dex.db.clear_entities()
+    assert not dex.db.entity_cache_dict
+
+
+def test_1020(app_context):
+    """namedtuple_factory(): Rows with the same fields share a class"""
+    dex.db.add_entity('dist_1', 'meta_1', 'data_1')
+    dex.db.add_entity('dist_2', 'meta_2', 'data_2')
+    row_list = dex.db.query_db("""select id, dist_url from entity""")
+    assert len(row_list) == 2
+    assert type(row_list[0]) is type(row_list[1])
+    assert row_list[1].dist_url == 'dist_2'
+
+
+def test_1030(app_context):
+    """get_db(): The connection is kept open, and uses WAL journaling"""
+    assert dex.db.get_db() is dex.db.get_db()
+    assert dex.db.get_db().execute("pragma journal_mode").fetchone()[0] == 'wal'
+
+
+def test_1040(app_context):
+    """add_entity(): Returns the existing row_id for a known dist_url"""
+    rid = dex.db.add_entity('dist_1', 'meta_1', 'data_1')
+    assert dex.db.add_entity('dist_1', 'meta_2', 'data_2') == rid
+    assert dex.db.get_entity(rid) == ('dist_1', 'meta_1', 'data_1')
+
+
+def test_1050(app_context):
+    """migrate_db(): Removes duplicate dist_urls and adds the unique index"""
+    db = dex.db.get_db()
+    db.execute("""drop index entity_dist_url_uindex""")
+    db.execute("""pragma user_version = 0""")
+    for dist_url in ('dist_1', 'dist_2', 'dist_1'):
+        db.execute("""insert into entity (dist_url) values (?)""", (dist_url,))
+    db.commit()
+    dex.db.migrate_db(db)
+    assert db.execute("""pragma user_version""").fetchone()[0] == len(dex.db.MIGRATION_LIST)
+    assert [r.dist_url for r in dex.db.query_db("""select dist_url from entity""")] == [
+        'dist_1',
+        'dist_2',
+    ]
+    plan_str = str(
+        dex.db.query_db("""explain query plan select id from entity where dist_url = 'x'""")
+    )
+    assert 'entity_dist_url_uindex' in plan_str
+
+
+def test_1055(app_context, config, monkeypatch):
+    """migrate_db(): Does not apply a migration that another process applied while
+    waiting for the write lock"""
+    migration_str = """alter table entity add column test_col text;"""
+    monkeypatch.setattr(dex.db, 'MIGRATION_LIST', dex.db.MIGRATION_LIST + [migration_str])
+
+    class OtherProcessFirst:
+        """Connection that lets another connection apply the migration just before the
+        write lock is acquired"""
+
+        def __init__(self, db):
+            self.db = db
+
+        def execute(self, sql_str, *args):
+            if sql_str.startswith('begin immediate'):
+                self.apply_in_other_db()
+            return self.db.execute(sql_str, *args)
+
+        def executescript(self, sql_str):
+            if sql_str.startswith('begin immediate'):
+                self.apply_in_other_db()
+            return self.db.executescript(sql_str)
+
+        def apply_in_other_db(self):
+            other_db = sqlite3.connect(config['SQLITE_PATH'])
+            other_db.executescript(
+                f'{migration_str} pragma user_version = {len(dex.db.MIGRATION_LIST)};'
+            )
+            other_db.close()
+
+        def __getattr__(self, name):
+            return getattr(self.db, name)
+
+    db = dex.db.get_db()
+    dex.db.migrate_db(OtherProcessFirst(db))
+    assert db.execute("""pragma user_version""").fetchone()[0] == len(dex.db.MIGRATION_LIST)
+
+
+def test_1060(app_context):
+    """get_rid_list_by_package_id(): Matches only entities in the package"""
+    base_url = 'https://pasta.lternet.edu/package/data/eml/knb-lter-test'
+    rid_1 = dex.db.add_entity(f'{base_url}/1/1/entity-a', None, None)
+    rid_2 = dex.db.add_entity(f'{base_url}/1/1/entity-b', None, None)
+    dex.db.add_entity(f'{base_url}/1/10/entity-a', None, None)
+    dex.db.add_entity(f'{base_url}/2/1/entity-a', None, None)
+    assert sorted(dex.db.get_rid_list_by_package_id(f'{base_url}/1/1')) == [rid_1, rid_2]
+    assert sorted(dex.db.get_rid_list_by_package_id(f'{base_url}/1/1/')) == [rid_1, rid_2]
+
+
+def test_1070(app, app_context):
+    """get_db(): The connections of a thread are released, which closes them, when the
+    thread exits"""
+
+    def get_connection_count():
+        gc.collect()
+        return sum(1 for o in gc.get_objects() if isinstance(o, sqlite3.Connection))
+
+    def use_db():
+        with app.app_context():
+            dex.db.get_db().execute("""select count(*) from entity""")
+            connection_count_list.append(get_connection_count())
+
+    connection_count = get_connection_count()
+    connection_count_list = []
+    thread = threading.Thread(target=use_db)
+    thread.start()
+    thread.join()
+    assert connection_count_list == [connection_count + 1]
+    assert get_connection_count() == connection_count
@@ -0,0 +1,67 @@
+import csv
+
+import pandas as pd
+import pytest
+
+import dex.csv_parser
+import dex.db
+import dex.debug
+import dex.eml_cache
+
+
+@pytest.fixture
+def debug_rid(app_context, enable_cache, tmp_cache, monkeypatch):
+    """rid for a small CSV, with counts of the calls that load the CSV and EML"""
+    call_list = []
+    raw_df = pd.DataFrame({'a': ['1', '2'], 'b': ['x', 'y']})
+    ctx = dict(
+        column_list=[
+            dict(col_idx=0, col_name='a', pandas_type='INT', date_fmt_str=None,
+                 missing_code_list=[]),
+            dict(col_idx=1, col_name='b', pandas_type='STRING', date_fmt_str=None,
+                 missing_code_list=[]),
+        ],
+        col_name_list=['a', 'b'],
+        header_line_count=1,
+        footer_line_count=0,
+        dialect=csv.excel,
+    )
+
+    def get_parsed_csv_with_context(rid):
+        call_list.append('csv')
+        return raw_df, raw_df, ctx
+
+    def get_attributes_as_highlighted_html(rid):
+        call_list.append('eml')
+        return {0: ('<b>a</b>', '.css {}')}
+
+    monkeypatch.setattr(
+        dex.csv_parser, 'get_parsed_csv_with_context', get_parsed_csv_with_context
+    )
+    monkeypatch.setattr(
+        dex.eml_cache, 'get_attributes_as_highlighted_html', get_attributes_as_highlighted_html
+    )
+    rid = dex.db.add_entity('https://test/data/1', 'https://test/meta', 'https://test/data/1')
+    return rid, call_list
+
+
+def test_1000(debug_rid):
+    """get_debug_dict(): Payload is generated once, then read from the cache"""
+    rid, call_list = debug_rid
+    dbg = dex.debug.get_debug_dict(rid)
+    assert dbg['total_row_count'] == 2
+    assert dbg['attr_list'] == [('a', '.css {}', '<b>a</b>')]
+    assert dex.debug.get_debug_dict(rid) == dbg
+    assert call_list == ['csv', 'eml']
+
+
+def test_1010(debug_rid, app):
+    """/dex/debug/: Panel is only available when enabled by cookie"""
+    rid, call_list = debug_rid
+    client = app.test_client()
+    assert client.get(f'/dex/debug/{rid}').status_code == 404
+    client.set_cookie('debug-panel', 'true')
+    response = client.get(f'/dex/debug/{rid}')
+    assert response.status_code == 200
+    assert 'Debug Panel' in response.text
+    assert '<b>a</b>' in response.text
@@ -0,0 +1,152 @@
+import gzip
+
+import lxml.etree
+import pytest
+
+import dex.cache
+import dex.db
+import dex.eml_cache
+import dex.eml_subset
+import dex.obj_bytes
+
+EML_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<eml:eml xmlns:eml="https://eml.ecoinformatics.org/eml-2.2.0" packageId="knb-lter-tst.1.2">
+  <dataset>
+    <dataTable>
+      <physical>
+        <objectName>first.csv</objectName>
+        <distribution><online><url>https://test/data/1</url></online></distribution>
+      </physical>
+    </dataTable>
+    <dataTable>
+      <physical>
+        <objectName>second.csv</objectName>
+        <distribution><online><url>https://test/data/2</url></online></distribution>
+      </physical>
+      <attributeList><attribute><attributeName>col_1</attributeName></attribute></attributeList>
+    </dataTable>
+  </dataset>
+</eml:eml>
+"""
+
+
+@pytest.fixture
+def eml_rid(app_context, enable_cache, tmp_cache, tmpdir, monkeypatch):
+    eml_path = tmpdir / 'eml.xml'
+    eml_path.write_text(EML_XML)
+    open_count_list = []
+
+    def open_eml(rid):
+        open_count_list.append(rid)
+        return eml_path
+
+    monkeypatch.setattr(dex.obj_bytes, 'open_eml', open_eml)
+    rid = dex.db.add_entity('https://test/data/2', 'https://test/meta', 'https://test/data/2')
+    yield rid, open_count_list
+    dex.eml_cache.eml_tree_dict.clear()
+
+
+def test_1000(eml_rid):
+    """get_eml_etree(): Parsed tree is reused until the cached file changes"""
+    rid, open_count_list = eml_rid
+    eml_tree = dex.eml_cache.get_eml_etree(rid)
+    assert isinstance(eml_tree, lxml.etree._ElementTree)
+    assert dex.eml_cache.get_eml_etree(rid) is eml_tree
+    assert len(open_count_list) == 1
+    dex.cache.flush_cache(rid)
+    assert dex.eml_cache.get_eml_etree(rid) is not eml_tree
+    assert len(open_count_list) == 2
+
+
+def test_1010(eml_rid):
+    """get_eml_summary(): Values for the selected dataTable"""
+    rid, open_count_list = eml_rid
+    assert dex.eml_cache.get_pkg_id_str(rid) == 'knb-lter-tst.1.2'
+    assert dex.eml_cache.get_csv_name(rid) == 'second.csv'
+    dt_el = dex.eml_cache.get_data_table_el(rid)
+    assert dt_el.xpath('.//attributeName/text()') == ['col_1']
+
+
+def test_1020(eml_rid):
+    """get_data_table_el(): Summary is read from the disk cache without parsing the
+    full EML"""
+    rid, open_count_list = eml_rid
+    dex.eml_cache.get_csv_name(rid)
+    dex.eml_cache.eml_tree_dict.clear()
+    dex.cache.delete_cache_file(rid, 'eml', 'etree')
+    assert dex.eml_cache.get_data_table_el(rid) is not None
+    assert dex.eml_cache.get_pkg_id_str(rid) == 'knb-lter-tst.1.2'
+    assert len(open_count_list) == 1
+
+
+def test_1030(eml_rid):
+    """create_subset_eml(): The shared tree is not modified"""
+    rid, open_count_list = eml_rid
+    eml_tree = dex.eml_cache.get_eml_etree(rid)
+    dex.eml_subset.create_subset_eml(rid, 10, 100, 'md5', [0])
+    assert len(eml_tree.xpath('.//dataTable')) == 2
+
+
+def test_1040(eml_rid, app, config):
+    """/dex/eml/page/: Page is sent in the stored encoding, and is cacheable"""
+    rid, open_count_list = eml_rid
+    config['CACHE_CODEC_DICT'] = {'page': 'gzip'}
+    client = app.test_client()
+    response = client.get(f'/dex/eml/page/{rid}', headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.headers['Cache-Control'] == f'public, max-age={config["PAGE_MAX_AGE_SEC"]}'
+    assert b'knb-lter-tst.1.2' in gzip.decompress(response.data)
+    response.close()
+    response = client.get(
+        f'/dex/eml/page/{rid}',
+        headers={'Accept-Encoding': 'gzip', 'If-None-Match': response.headers['ETag']},
+    )
+    assert response.status_code == 304
+    response.close()
+
+
+def test_1050(eml_rid, app, config):
+    """/dex/eml/page/: Page is decompressed for clients that don't accept the encoding"""
+    rid, open_count_list = eml_rid
+    config['CACHE_CODEC_DICT'] = {'page': 'gzip'}
+    response = app.test_client().get(f'/dex/eml/page/{rid}', headers={'Accept-Encoding': ''})
+    assert response.status_code == 200
+    assert 'Content-Encoding' not in response.headers
+    assert b'knb-lter-tst.1.2' in response.data
+
+
+@pytest.mark.parametrize('encoding_str', ['gzip', ''])
+def test_1060(eml_rid, app, config, monkeypatch, encoding_str):
+    """/dex/eml/page/: Page is created again if the cache is flushed after the path to
+    the page has been resolved"""
+    rid, open_count_list = eml_rid
+    config['CACHE_CODEC_DICT'] = {'page': 'gzip'}
+    get_eml_page_path = dex.eml_cache.get_eml_page_path
+    call_list = []
+
+    def get_eml_page_path_and_flush(rid):
+        page_tup = get_eml_page_path(rid)
+        if not call_list:
+            dex.cache.flush_cache(rid)
+        call_list.append(rid)
+        return page_tup
+
+    monkeypatch.setattr(dex.eml_cache, 'get_eml_page_path', get_eml_page_path_and_flush)
+    response = app.test_client().get(
+        f'/dex/eml/page/{rid}', headers={'Accept-Encoding': encoding_str}
+    )
+    assert response.status_code == 200
+    page_bytes = gzip.decompress(response.data) if encoding_str else response.data
+    assert b'knb-lter-tst.1.2' in page_bytes
+    assert len(call_list) == 2
+    response.close()
+
+
+def test_1070(eml_rid):
+    """get_attributes_as_etree(): Returns the attributes of the data table by column
+    index"""
+    rid, open_count_list = eml_rid
+    attr_dict = dex.eml_cache.get_attributes_as_etree(rid)
+    assert list(attr_dict) == [0]
+    assert attr_dict[0].findtext('attributeName') == 'col_1'
@@ -0,0 +1,76 @@
+import lxml.etree
+import pytest
+
+import dex.eml_extract
+
+ATTRIBUTE_LIST = [
+    """
+    <attribute>
+      <attributeName> depth </attributeName>
+      <measurementScale><ratio><numericDomain><numberType>real</numberType>
+      </numericDomain></ratio></measurementScale>
+      <missingValueCode><code>-999</code></missingValueCode>
+      <missingValueCode><code>NA</code><codeExplanation>Not available</codeExplanation>
+      </missingValueCode>
+    </attribute>
+    """,
+    """
+    <attribute>
+      <!-- Comment -->
+      <attributeName>date</attributeName>
+      <measurementScale><dateTime><formatString> YYYY-MM-DD </formatString>
+      </dateTime></measurementScale>
+    </attribute>
+    """,
+    """
+    <attribute>
+      <attributeName>site</attributeName>
+      <measurementScale><nominal><nonNumericDomain><enumeratedDomain>
+      <codeDefinition><code>A</code><definition>Site A</definition></codeDefinition>
+      </enumeratedDomain></nonNumericDomain></nominal></measurementScale>
+    </attribute>
+    """,
+    """
+    <attribute>
+      <attributeName>count</attributeName>
+      <measurementScale><ratio><numericDomain><numberType>whole</numberType>
+      </numericDomain></ratio></measurementScale>
+    </attribute>
+    """,
+    """
+    <attribute>
+      <measurementScale><ratio><numericDomain/></ratio></measurementScale>
+    </attribute>
+    """,
+]
+
+
+@pytest.mark.parametrize('attr_xml', ATTRIBUTE_LIST)
+def test_1000(attr_xml):
+    """get_attr_field_dict(): Single pass extraction matches the XPath based
+    extraction"""
+    attr_el = lxml.etree.fromstring(attr_xml)
+    field_dict = dex.eml_extract.get_attr_field_dict(attr_el)
+    assert field_dict['col_name'] == dex.eml_extract.first_str_orig(
+        attr_el, './/attributeName/text()'
+    )
+    for el_name in ('enumeratedDomain', 'dateTime', 'numericDomain'):
+        assert (el_name in field_dict['el_name_set']) == dex.eml_extract.has_el(
+            attr_el, el_name
+        )
+    assert field_dict['number_type'] == dex.eml_extract.first_str(
+        attr_el, './/numberType/text()'
+    )
+    assert field_dict['date_fmt_str'] == dex.eml_extract.get_date_fmt_str(attr_el, None)
+    assert field_dict['missing_code_list'] == dex.eml_extract.multiple_str(
+        attr_el, './/missingValueCode/code/text()'
+    )
+
+
+def test_1010():
+    """get_xpath(): Compiled XPaths are reused, and namespaces are part of the key"""
+    xpath = dex.eml_extract.get_xpath('.//a')
+    assert dex.eml_extract.get_xpath('.//a') is xpath
+    ns_xpath = dex.eml_extract.get_xpath('.//a', {'eml': 'https://eml', None: 'x'})
+    assert ns_xpath is not xpath
+    assert dex.eml_extract.get_xpath('.//a', {'eml': 'https://eml'}) is ns_xpath
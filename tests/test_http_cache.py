@@ -0,0 +1,95 @@
+import time
+
+import pytest
+
+import dex.cache
+import dex.db
+import dex.http_cache
+
+
+@pytest.fixture
+def cached_rid(app_context, enable_cache, tmp_cache):
+    return dex.db.add_entity('https://test/data/1', 'https://test/meta', 'https://test/data/1')
+
+
+@pytest.fixture
+def client(app, app_context):
+    app.add_url_rule(
+        '/test/<rid>', 'test_view', dex.http_cache.conditional(lambda rid: f'rid={rid}')
+    )
+    return app.test_client()
+
+
+def test_1000(cached_rid):
+    """get_generation(): Token is stable until the cache for the rid is flushed"""
+    generation_str = dex.cache.get_generation(cached_rid)
+    assert generation_str
+    assert dex.cache.get_generation(cached_rid) == generation_str
+    dex.cache.flush_cache(cached_rid)
+    assert dex.cache.get_generation(cached_rid) != generation_str
+
+
+def test_1005(cached_rid, config, tmpdir):
+    """get_generation(): Records an access to the cached objects for the rid"""
+    config['CACHE_INDEX_PATH'] = tmpdir / 'index.sqlite'
+    cache_index = dex.cache.get_cache_index()
+    grp = dex.cache._get_cache_entity_root_path(cached_rid).name
+    cache_index.add(grp, 'head.df', 10, access_ts=time.time() - 3000)
+    now_ts = time.time()
+    dex.cache.get_generation(cached_rid)
+    assert cache_index.get_group_list()[0].access_ts >= now_ts
+
+
+def test_1010(cached_rid, config):
+    """get_generation(): No token when the disk cache is disabled"""
+    config['DISK_CACHE_ENABLED'] = False
+    assert dex.cache.get_generation(cached_rid) is None
+
+
+def test_1020(cached_rid, client):
+    """conditional(): Returns 304 when revalidating, and 200 after the cache is flushed"""
+    response = client.get(f'/test/{cached_rid}')
+    assert response.status_code == 200
+    assert response.text == f'rid={cached_rid}'
+    assert response.headers['Cache-Control'] == 'no-cache'
+    etag = response.headers['ETag']
+    assert etag.startswith('W/')
+    response = client.get(f'/test/{cached_rid}', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.headers['ETag'] == etag
+    dex.cache.flush_cache(cached_rid)
+    response = client.get(f'/test/{cached_rid}', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+
+def test_1025(cached_rid, client, config):
+    """conditional(): The ETag is the same for compressed and uncompressed responses,
+    and for the 304 responses that revalidate them"""
+    config['RESPONSE_COMPRESSION_MIN_BYTES'] = 0
+    etag = client.get(f'/test/{cached_rid}', headers={'Accept-Encoding': ''}).headers['ETag']
+    response = client.get(f'/test/{cached_rid}', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.headers['ETag'] == etag
+    response = client.get(
+        f'/test/{cached_rid}', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag}
+    )
+    assert response.status_code == 304
+    assert response.headers['ETag'] == etag
+
+
+def test_1030(cached_rid, client):
+    """conditional(): ETag depends on the full path, including the query string"""
+    etag_1 = client.get(f'/test/{cached_rid}?a=1').headers['ETag']
+    etag_2 = client.get(f'/test/{cached_rid}?a=2').headers['ETag']
+    assert etag_1 != etag_2
+
+
+def test_1040(client):
+    """Static files are revalidated with ETags"""
+    response = client.get('/static/css/dex.css')
+    etag = response.headers['ETag']
+    response.close()
+    response = client.get('/static/css/dex.css', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    response.close()
@@ -0,0 +1,26 @@
+import subprocess
+import sys
+
+import dex.lazy
+
+
+def test_1000():
+    """Importing the app does not import the heavy libraries"""
+    code_str = (
+        'import sys, dex.main; '
+        'print("loaded:" + ",".join(m for m in ("bokeh", "pandas", "pygments", "ydata_profiling") '
+        'if m in sys.modules))'
+    )
+    p = subprocess.run(
+        [sys.executable, '-c', code_str], capture_output=True, text=True, check=True
+    )
+    assert p.stdout.strip().splitlines()[-1] == 'loaded:'
+
+
+def test_1010():
+    """LazyModule imports the module and submodules on first attribute access"""
+    m = dex.lazy.LazyModule('json', 'json.decoder')
+    assert not m.is_loaded()
+    assert m.dumps([1]) == '[1]'
+    assert m.is_loaded()
+    assert m.decoder.JSONDecoder
@@ -0,0 +1,128 @@
+import json
+import logging
+import tracemalloc
+
+import flask
+import pytest
+
+import dex.cache
+import dex.db
+import dex.memory
+
+
+def allocating_view():
+    buf = bytearray(8 * 1024**2)
+    return f'ok {len(buf)}'
+
+
+def retaining_view():
+    flask.g.retained_buf = bytearray(8 * 1024**2)
+    return 'ok'
+
+
+@dex.cache.disk('test-memory', 'pickle')
+def allocating_table(rid):
+    table_buf = bytearray(4 * 1024**2)
+    return TableLike(table_buf, (len(table_buf) // 1024, 4))
+
+
+class TableLike:
+    def __init__(self, buf, shape):
+        self.buf = buf
+        self.shape = shape
+
+
+@pytest.fixture
+def memory_log_path(config, tmpdir):
+    config['MEMORY_TRACKING_ENABLED'] = True
+    config['MEMORY_TRACKING_LOG_PATH'] = tmpdir / 'memory.jsonl'
+    dex.memory.worst_dict.clear()
+    yield config['MEMORY_TRACKING_LOG_PATH']
+    tracemalloc.stop()
+    dex.memory.worst_dict.clear()
+
+
+@pytest.fixture
+def client(app, app_context, memory_log_path):
+    app.add_url_rule('/test/allocating', 'allocating', allocating_view)
+    app.add_url_rule('/test/retaining', 'retaining', retaining_view)
+    return app.test_client()
+
+
+def read_records(log_path):
+    return [json.loads(line) for line in log_path.read_text().splitlines()]
+
+
+def test_1000(app, app_context, config, tmpdir):
+    """Memory is not tracked by default"""
+    config['MEMORY_TRACKING_LOG_PATH'] = tmpdir / 'memory.jsonl'
+    app.add_url_rule('/test/allocating', 'allocating', allocating_view)
+    app.test_client().get('/test/allocating')
+    assert not tracemalloc.is_tracing()
+    assert not config['MEMORY_TRACKING_LOG_PATH'].exists()
+
+
+def test_1010(client, memory_log_path):
+    """Peak allocation is recorded for requests"""
+    client.get('/test/allocating?a=1')
+    (record_dict,) = read_records(memory_log_path)
+    assert record_dict['kind'] == 'request'
+    assert record_dict['name'] == 'allocating'
+    assert record_dict['path'] == '/test/allocating?a=1'
+    assert record_dict['status'] == 200
+    assert record_dict['peak_bytes'] >= 8 * 1024**2
+
+
+def test_1020(app, app_context, memory_log_path, enable_cache, tmp_cache):
+    """Memory used by cache generation is recorded, and included in the request peak"""
+    rid = dex.db.add_entity('https://test/data/1', 'https://test/meta', 'https://test/data/1')
+    with app.test_request_context():
+        dex.memory.start_request()
+        allocating_table(rid)
+        dex.memory.end_request(app.response_class())
+    cache_dict, request_dict = read_records(memory_log_path)
+    assert cache_dict['kind'] == 'cache'
+    assert cache_dict['name'] == 'test-memory.pickle'
+    assert cache_dict['rid'] == str(rid)
+    assert cache_dict['cell_count'] == 4096 * 4
+    assert cache_dict['peak_bytes'] >= 4 * 1024**2
+    assert request_dict['peak_bytes'] >= cache_dict['peak_bytes']
+
+
+def test_1030(client, config, caplog):
+    """Top allocation sites of retained memory are logged for the worst requests"""
+    config['MEMORY_TRACKING_SNAPSHOT_MIN_BYTES'] = 1024**2
+    with caplog.at_level(logging.WARNING, logger='dex.memory'):
+        client.get('/test/retaining')
+    (record,) = caplog.records
+    msg_str = record.getMessage()
+    assert msg_str.startswith('Highest memory use so far for request retaining')
+    assert 'flask.g.retained_buf = bytearray(8 * 1024**2)' in msg_str
+    caplog.clear()
+    with caplog.at_level(logging.WARNING, logger='dex.memory'):
+        client.get('/test/retaining')
+    assert not caplog.records
+
+
+def test_1035(client, config, caplog):
+    """Freed temporary memory is counted in the peak, but is not in the retained sites"""
+    config['MEMORY_TRACKING_SNAPSHOT_MIN_BYTES'] = 1024**2
+    with caplog.at_level(logging.WARNING, logger='dex.memory'):
+        client.get('/test/allocating')
+    (record,) = caplog.records
+    assert 'peak 8.0 MiB' in record.getMessage()
+    assert 'buf = bytearray(8 * 1024**2)' not in record.getMessage()
+
+
+def test_1040(app, app_context, memory_log_path, config, enable_cache, tmp_cache, caplog):
+    """Top allocation sites include the object created for the cache"""
+    config['MEMORY_TRACKING_SNAPSHOT_MIN_BYTES'] = 1024**2
+    rid = dex.db.add_entity('https://test/data/1', 'https://test/meta', 'https://test/data/1')
+    with app.test_request_context():
+        dex.memory.start_request()
+        with caplog.at_level(logging.WARNING, logger='dex.memory'):
+            allocating_table(rid)
+        dex.memory.end_request(app.response_class())
+    record = caplog.records[0]
+    assert record.getMessage().startswith('Highest memory use so far for cache test-memory')
+    assert 'table_buf = bytearray(4 * 1024**2)' in record.getMessage()
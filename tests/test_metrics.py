@@ -0,0 +1,85 @@
+import pytest
+
+import dex.cache
+import dex.db
+import dex.metrics
+
+
+@pytest.fixture
+def metrics_db(app_context, config, tmpdir):
+    config['METRICS_DB_PATH'] = tmpdir / 'metrics.sqlite'
+    dex.metrics.clear()
+    yield
+    dex.metrics.clear()
+
+
+@pytest.fixture
+def client(app, metrics_db):
+    app.add_url_rule('/test/ok', 'ok', lambda: 'ok')
+    return app.test_client()
+
+
+@dex.cache.disk('test-metrics', 'text')
+def cached_text(rid):
+    return f'text for {rid}'
+
+
+def get_line_set(text):
+    return {line for line in text.splitlines() if not line.startswith('#')}
+
+
+def test_1000(metrics_db):
+    """render(): Counts are aggregated across flushes"""
+    dex.metrics.inc('dex_download_bytes_total', 100)
+    dex.metrics.flush()
+    dex.metrics.inc('dex_download_bytes_total', 50)
+    assert 'dex_download_bytes_total 150' in get_line_set(dex.metrics.render())
+
+
+def test_1010(metrics_db):
+    """render(): Histogram buckets are cumulative and in order of their upper bounds"""
+    for sec in (0.001, 0.2, 0.2, 100):
+        dex.metrics.observe('dex_lock_wait_seconds', sec, lock='cache')
+    line_list = [
+        line
+        for line in dex.metrics.render().splitlines()
+        if line.startswith('dex_lock_wait_seconds')
+    ]
+    assert line_list[0] == 'dex_lock_wait_seconds_bucket{lock="cache",le="0.005"} 1'
+    assert line_list[5] == 'dex_lock_wait_seconds_bucket{lock="cache",le="0.25"} 3'
+    assert line_list[13] == 'dex_lock_wait_seconds_bucket{lock="cache",le="300"} 4'
+    assert line_list[14] == 'dex_lock_wait_seconds_bucket{lock="cache",le="+Inf"} 4'
+    assert line_list[15] == 'dex_lock_wait_seconds_sum{lock="cache"} 100.401'
+    assert line_list[16] == 'dex_lock_wait_seconds_count{lock="cache"} 4'
+
+
+def test_1020(client):
+    """/metrics: Request durations are counted by endpoint"""
+    client.get('/test/ok')
+    response = client.get('/metrics')
+    assert response.mimetype == 'text/plain'
+    assert (
+        'dex_request_duration_seconds_count{endpoint="ok",method="GET",status="200"} 1'
+        in get_line_set(response.text)
+    )
+
+
+def test_1030(client, config):
+    """/metrics: Not available to other addresses, or when disabled"""
+    response = client.get('/metrics', environ_base={'REMOTE_ADDR': '192.0.2.1'})
+    assert response.status_code == 404
+    config['METRICS_ALLOWED_ADDR_SET'] = None
+    response = client.get('/metrics', environ_base={'REMOTE_ADDR': '192.0.2.1'})
+    assert response.status_code == 200
+    config['METRICS_ENABLED'] = False
+    assert client.get('/metrics').status_code == 404
+
+
+def test_1040(metrics_db, enable_cache, tmp_cache):
+    """disk(): Cache hits and misses are counted"""
+    rid = dex.db.add_entity('https://test/data/1', 'https://test/meta', 'https://test/data/1')
+    assert cached_text(rid) == cached_text(rid)
+    line_set = get_line_set(dex.metrics.render())
+    assert 'dex_cache_lookups_total{obj_type="text",result="miss"} 1' in line_set
+    assert 'dex_cache_lookups_total{obj_type="text",result="hit"} 1' in line_set
+    assert 'dex_cache_generate_seconds_count{key="test-metrics"} 1' in line_set
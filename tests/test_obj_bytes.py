@@ -1,9 +1,71 @@
+import http.server
 import pathlib
+import re
+import threading
 import time
 
+import pytest
+
+import dex.db
 import dex.obj_bytes
 import dex.pasta
 
+OBJ_BYTES = bytes(range(256)) * 1000
+
+
+class RangeRequestHandler(http.server.BaseHTTPRequestHandler):
+    """Serve OBJ_BYTES, with support for single range Range requests"""
+
+    accept_ranges = True
+    # Announce support for Range requests, but return the full object for ranged GETs,
+    # like some proxies do.
+    ignore_get_range = False
+    range_header_list = []
+
+    def do_HEAD(self):
+        self._send(is_head=True)
+
+    def do_GET(self):
+        self._send(is_head=False)
+
+    def _send(self, is_head):
+        range_str = self.headers.get('Range')
+        self.range_header_list.append(range_str)
+        m = re.match(r'bytes=(\d+)-(\d*)$', range_str or '')
+        if m and self.accept_ranges and not (self.ignore_get_range and not is_head):
+            first_idx = int(m.group(1))
+            last_idx = int(m.group(2)) if m.group(2) else len(OBJ_BYTES) - 1
+            body = OBJ_BYTES[first_idx : last_idx + 1]
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {first_idx}-{last_idx}/{len(OBJ_BYTES)}')
+        else:
+            body = OBJ_BYTES
+            self.send_response(200)
+        if self.accept_ranges:
+            self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if not is_head:
+            self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def obj_server():
+    """Local stand-in for the PASTA web service"""
+    RangeRequestHandler.accept_ranges = True
+    RangeRequestHandler.ignore_get_range = False
+    RangeRequestHandler.range_header_list = []
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), RangeRequestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        yield f'http://127.0.0.1:{server.server_port}/obj'
+    finally:
+        server.shutdown()
+        server.server_close()
+
 
 def mk_data_url(scope_str, id_int, ver_int, entity_str):
     return (
@@ -12,27 +74,77 @@ def mk_data_url(scope_str, id_int, ver_int, entity_str):
     )
 
 
+def mk_dist_path(root_path, name, byte_count):
+    dist_path = root_path / name
+    dist_path.mkdir(parents=True)
+    (dist_path / 'obj.csv').write_bytes(b'x' * byte_count)
+    (dist_path / 'obj.csv.lock').touch()
+    return dist_path
+
+
 def test_1000(config, tmpdir):
     """_limit_cache_size()
-    - Limits to configured size
-    - Removes oldest files
+    - Limits to configured size in bytes
+    - Removes least recently used objects
+    - Keeps the lock files, which may be held during the eviction
     """
-    p = config['TMP_CACHE_ROOT'] = pathlib.Path(tmpdir)
-    limit = config['TMP_CACHE_LIMIT'] = 3
-    p.mkdir(exist_ok=True)
+    p = config['TMP_CACHE_ROOT'] = pathlib.Path(tmpdir) / 'tmp-cache'
+    config['TMP_CACHE_INDEX_PATH'] = pathlib.Path(tmpdir) / 'index.sqlite'
+    config['TMP_CACHE_LIMIT_BYTES'] = 300
 
-    for i in range(limit * 2):
-        (p / f'test_{i}.txt').write_text(f'{i}')
-        # Ensure that each file gets a separate timestamp
-        time.sleep(0.1)
+    for i in range(6):
+        mk_dist_path(p, f'dist_{i}', 100)
 
-    assert len(list(p.iterdir())) == limit * 2
+    cache_index = dex.obj_bytes._get_tmp_cache_index()
+    for i in range(6):
+        cache_index.add(f'dist_{i}', 'obj.csv', 100, access_ts=time.time() - 100 + i)
+    assert len(list(p.iterdir())) == 6
 
     dex.obj_bytes._limit_cache_size()
-    assert len(list(p.iterdir())) == limit
+    assert sorted(p2.parent.name for p2 in p.glob('*/obj.csv')) == [
+        'dist_3',
+        'dist_4',
+        'dist_5',
+    ]
+    assert cache_index.get_total_bytes() == 300
+    # The lock files of the evicted objects are kept
+    assert len(list(p.glob('*/obj.csv.lock'))) == 6
+
+
+def test_1005(config, tmpdir):
+    """_limit_cache_size()
+    - Does not remove objects that are locked
+    """
+    p = config['TMP_CACHE_ROOT'] = pathlib.Path(tmpdir) / 'tmp-cache'
+    config['TMP_CACHE_INDEX_PATH'] = pathlib.Path(tmpdir) / 'index.sqlite'
+    config['TMP_CACHE_LIMIT_BYTES'] = 100
+
+    for i in range(3):
+        mk_dist_path(p, f'dist_{i}', 100)
+    cache_index = dex.obj_bytes._get_tmp_cache_index()
+    assert cache_index.get_total_bytes() == 300
 
-    idx_list = sorted([int(p2.read_text()) for p2 in p.iterdir()])
-    assert idx_list == [3, 4, 5]
+    held_lock_path = p / 'dist_0' / 'obj.csv.lock'
+    dex.obj_bytes.held_lock_path_set.add(held_lock_path)
+    try:
+        dex.obj_bytes._limit_cache_size(exclude_dist_path=p / 'dist_2')
+    finally:
+        dex.obj_bytes.held_lock_path_set.discard(held_lock_path)
+    assert sorted(p2.parent.name for p2 in p.glob('*/obj.csv')) == ['dist_0', 'dist_2']
+
+
+def test_1006(config, tmpdir):
+    """_try_lock_dist_path()
+    - Locks are claimed within the process, as file locks are per process
+    """
+    p = config['TMP_CACHE_ROOT'] = pathlib.Path(tmpdir) / 'tmp-cache'
+    dist_path = mk_dist_path(p, 'dist_0', 100)
+    with dex.obj_bytes._try_lock_dist_path(dist_path) as is_locked:
+        assert is_locked
+        assert dist_path / 'obj.csv.lock' in dex.obj_bytes.held_lock_path_set
+        with dex.obj_bytes._try_lock_dist_path(dist_path) as is_locked_2:
+            assert not is_locked_2
+    assert dist_path / 'obj.csv.lock' not in dex.obj_bytes.held_lock_path_set
 
 
 def test_1010():
@@ -40,3 +152,109 @@ def test_1010():
     entity_tup = dex.pasta.get_entity_by_data_url(data_url)
     obj_stream = dex.obj_bytes._open_obj(entity_tup, is_eml=False)
     print(obj_stream)
+
+
+def test_1100(config, tmpdir, obj_server):
+    """_download(): Single stream download"""
+    config['DOWNLOAD_SEGMENT_COUNT'] = 1
+    tmp_path = pathlib.Path(tmpdir) / 'obj.csv.tmp'
+    dex.obj_bytes._download(obj_server, tmp_path)
+    assert tmp_path.read_bytes() == OBJ_BYTES
+
+
+def test_1110(config, tmpdir, obj_server):
+    """_download(): Resumes an interrupted download with a Range request"""
+    config['DOWNLOAD_SEGMENT_COUNT'] = 4
+    tmp_path = pathlib.Path(tmpdir) / 'obj.csv.tmp'
+    tmp_path.write_bytes(OBJ_BYTES[:1000])
+    dex.obj_bytes._download(obj_server, tmp_path)
+    assert tmp_path.read_bytes() == OBJ_BYTES
+    assert RangeRequestHandler.range_header_list == ['bytes=1000-']
+
+
+def test_1120(config, tmpdir, obj_server):
+    """_download(): Downloads large objects in parallel segments, and resumes segments
+    from an interrupted download"""
+    config['DOWNLOAD_SEGMENT_COUNT'] = 3
+    config['DOWNLOAD_SEGMENT_MIN_BYTES'] = 1000
+    tmp_path = pathlib.Path(tmpdir) / 'obj.csv.tmp'
+    segment_bytes = -(-len(OBJ_BYTES) // 3)
+    (tmp_path.parent / 'obj.csv.tmp.1').write_bytes(
+        OBJ_BYTES[segment_bytes : segment_bytes + 10]
+    )
+    dex.obj_bytes._download(obj_server, tmp_path)
+    assert tmp_path.read_bytes() == OBJ_BYTES
+    assert sorted(p.name for p in tmp_path.parent.iterdir()) == ['obj.csv.tmp']
+    assert f'bytes={segment_bytes + 10}-{segment_bytes * 2 - 1}' in (
+        RangeRequestHandler.range_header_list
+    )
+
+
+def test_1130(config, tmpdir, obj_server):
+    """_download(): Falls back to a full download if the server does not support Range
+    requests"""
+    RangeRequestHandler.accept_ranges = False
+    config['DOWNLOAD_SEGMENT_COUNT'] = 3
+    config['DOWNLOAD_SEGMENT_MIN_BYTES'] = 1000
+    tmp_path = pathlib.Path(tmpdir) / 'obj.csv.tmp'
+    tmp_path.write_bytes(b'stale bytes')
+    dex.obj_bytes._download(obj_server, tmp_path)
+    assert tmp_path.read_bytes() == OBJ_BYTES
+
+
+def test_1140(config, tmpdir, obj_server):
+    """_download(): Falls back to a single stream download if the server announces
+    support for Range requests, but returns the full object for the segments"""
+    RangeRequestHandler.ignore_get_range = True
+    config['DOWNLOAD_SEGMENT_COUNT'] = 3
+    config['DOWNLOAD_SEGMENT_MIN_BYTES'] = 1000
+    tmp_path = pathlib.Path(tmpdir) / 'obj.csv.tmp'
+    dex.obj_bytes._download(obj_server, tmp_path)
+    assert tmp_path.read_bytes() == OBJ_BYTES
+    assert sorted(p.name for p in tmp_path.parent.iterdir()) == ['obj.csv.tmp']
+
+
+def test_1200(config, tmpdir, obj_server):
+    """_remote_url_stream(): Returns bytes while they are downloaded, and completes the
+    cached object when the caller stops reading early"""
+    config['TMP_CACHE_ROOT'] = pathlib.Path(tmpdir) / 'tmp-cache'
+    config['TMP_CACHE_INDEX_PATH'] = pathlib.Path(tmpdir) / 'index.sqlite'
+    dist_url = 'https://pasta.lternet.edu/package/data/eml/knb-lter-test/1/1/stream'
+    with dex.obj_bytes._remote_url_stream(dist_url, obj_server) as f:
+        assert f.read(1000) == OBJ_BYTES[:1000]
+    obj_path = dex.obj_bytes._get_cache_obj_path(dist_url, obj_server, is_eml=False)
+    assert obj_path.read_bytes() == OBJ_BYTES
+    assert not dex.obj_bytes._get_cache_tmp_path(dist_url, obj_server, is_eml=False).exists()
+    assert dex.obj_bytes._get_tmp_cache_index().get_total_bytes() == len(OBJ_BYTES)
+
+
+def test_1210(config, tmpdir, obj_server):
+    """_remote_url_stream(): If the caller raises, the partial download is kept for
+    resuming, and the object is not added to the cache"""
+    config['TMP_CACHE_ROOT'] = pathlib.Path(tmpdir) / 'tmp-cache'
+    config['TMP_CACHE_INDEX_PATH'] = pathlib.Path(tmpdir) / 'index.sqlite'
+    dist_url = 'https://pasta.lternet.edu/package/data/eml/knb-lter-test/1/1/stream'
+    with pytest.raises(ValueError):
+        with dex.obj_bytes._remote_url_stream(dist_url, obj_server) as f:
+            f.read(1000)
+            raise ValueError('Parse error')
+    obj_path = dex.obj_bytes._get_cache_obj_path(dist_url, obj_server, is_eml=False)
+    assert not obj_path.exists()
+    tmp_path = dex.obj_bytes._get_cache_tmp_path(dist_url, obj_server, is_eml=False)
+    assert 1000 <= tmp_path.stat().st_size <= len(OBJ_BYTES)
+    assert not dex.obj_bytes._is_streamable(dist_url, obj_server)
+
+
+def test_1300(app_context, config, tmpdir, obj_server):
+    """open_csv_stream(): The lock is not held while a cached object is read"""
+    config['TMP_CACHE_ROOT'] = pathlib.Path(tmpdir) / 'tmp-cache'
+    config['TMP_CACHE_INDEX_PATH'] = pathlib.Path(tmpdir) / 'index.sqlite'
+    dist_url = 'https://pasta.lternet.edu/package/data/eml/knb-lter-test/1/1/cached'
+    rid = dex.db.add_entity(dist_url, 'https://test/meta', obj_server)
+    obj_path = dex.obj_bytes._get_cache_obj_path(dist_url, obj_server, is_eml=False)
+    obj_path.parent.mkdir(parents=True, exist_ok=True)
+    obj_path.write_bytes(OBJ_BYTES)
+    lock_path = dex.obj_bytes._get_lock_path(dist_url, obj_server, is_eml=False)
+    with dex.obj_bytes.open_csv_stream(rid) as f:
+        assert lock_path not in dex.obj_bytes.held_lock_path_set
+        assert f.read() == OBJ_BYTES
@@ -0,0 +1,118 @@
+import time
+
+import pytest
+
+import dex.request_profile
+
+
+def profiled_view():
+    time.sleep(0.01)
+    return 'ok'
+
+
+@pytest.fixture
+def client(app, app_context, config):
+    config['REQUEST_PROFILE_ENABLED'] = True
+    config['REQUEST_PROFILE_TOKEN'] = 'secret'
+    app.add_url_rule('/test/profiled', 'profiled', profiled_view)
+    return app.test_client()
+
+
+def get_profile_list(app):
+    with app.test_request_context():
+        return dex.request_profile.get_profile_list()
+
+
+def test_1000(app, client):
+    """Requests are not profiled by default"""
+    response = client.get('/test/profiled')
+    assert 'X-Dex-Profile' not in response.headers
+    assert get_profile_list(app) == []
+    assert client.get('/dex/debug/profiles').status_code == 404
+
+
+def test_1010(app, client):
+    """Profile is stored when the debug panel is enabled, and can be viewed"""
+    client.set_cookie('debug-panel', 'true')
+    profile_url = client.get('/test/profiled').headers['X-Dex-Profile']
+    profile_dict = get_profile_list(app)[0]
+    assert profile_url.endswith(profile_dict['name'])
+    assert profile_dict['endpoint'] == 'profiled'
+    assert profile_dict['rid'] == 'none'
+    assert profile_dict['msec'] >= 10
+    assert profile_dict['name'] in client.get('/dex/debug/profiles').text
+    assert 'profiled_view' in client.get(profile_url).text
+
+
+def test_1015(app, client):
+    """The debug panel cookie only enables profiles for clients in the allowed
+    addresses"""
+    client.set_cookie('debug-panel', 'true')
+    environ_dict = {'REMOTE_ADDR': '192.0.2.1'}
+    response = client.get('/test/profiled', environ_base=environ_dict)
+    assert 'X-Dex-Profile' not in response.headers
+    assert get_profile_list(app) == []
+    assert client.get('/dex/debug/profiles', environ_base=environ_dict).status_code == 404
+    response = client.get(
+        '/dex/debug/profiles',
+        environ_base=environ_dict,
+        headers={'X-Dex-Profile-Token': 'secret'},
+    )
+    assert response.status_code == 200
+
+
+def test_1016(app, client, config):
+    """Nothing is profiled or listed when profiling is disabled"""
+    config['REQUEST_PROFILE_ENABLED'] = False
+    client.set_cookie('debug-panel', 'true')
+    response = client.get('/test/profiled', headers={'X-Dex-Profile-Token': 'secret'})
+    assert 'X-Dex-Profile' not in response.headers
+    assert get_profile_list(app) == []
+    assert client.get('/dex/debug/profiles').status_code == 404
+
+
+def test_1020(app, client):
+    """Profile is stored when requested with the token header"""
+    response = client.get('/test/profiled', headers={'X-Dex-Profile-Token': 'wrong'})
+    assert 'X-Dex-Profile' not in response.headers
+    response = client.get('/test/profiled', headers={'X-Dex-Profile-Token': 'secret'})
+    assert 'X-Dex-Profile' in response.headers
+    assert len(get_profile_list(app)) == 1
+
+
+def test_1030(app, client, config):
+    """Profiles are only kept for slow requests when auto-capture is enabled"""
+    config['REQUEST_PROFILE_SLOW_SEC'] = 60
+    assert 'X-Dex-Profile' not in client.get('/test/profiled').headers
+    config['REQUEST_PROFILE_SLOW_SEC'] = 0.005
+    assert 'X-Dex-Profile' in client.get('/test/profiled').headers
+    assert len(get_profile_list(app)) == 1
+
+
+def test_1040(app, client, config):
+    """Only the most recent profiles are kept"""
+    config['REQUEST_PROFILE_MAX_COUNT'] = 2
+    client.set_cookie('debug-panel', 'true')
+    name_list = [
+        client.get('/test/profiled').headers['X-Dex-Profile'].rsplit('/', 1)[1]
+        for _ in range(3)
+    ]
+    assert [p['name'] for p in get_profile_list(app)] == name_list[:0:-1]
+
+
+def test_1050(client):
+    """Profile view does not serve other files"""
+    client.set_cookie('debug-panel', 'true')
+    assert client.get('/dex/debug/profiles/config.py').status_code == 404
+    name = '20260101-000000.000-1_10ms_none_profiled.prof'
+    assert client.get(f'/dex/debug/profiles/{name}').status_code == 404
+
+
+def test_1060(client):
+    """Profile view falls back to sorting by cumulative time for unknown sort keys"""
+    client.set_cookie('debug-panel', 'true')
+    profile_url = client.get('/test/profiled').headers['X-Dex-Profile']
+    response = client.get(f'{profile_url}?sort=bogus')
+    assert response.status_code == 200
+    assert 'Ordered by: cumulative time' in response.text
+    assert 'Ordered by: internal time' in client.get(f'{profile_url}?sort=time').text
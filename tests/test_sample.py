@@ -0,0 +1,106 @@
+import pathlib
+import threading
+
+import dex.sample
+
+EML_TEMPLATE = """<?xml version="1.0" encoding="UTF-8"?>
+<eml:eml xmlns:eml="https://eml.ecoinformatics.org/eml-2.2.0">
+  <dataset>
+    <dataTable>
+      <physical>
+        <distribution>
+          <online>
+            <url>https://pasta.lternet.edu/package/data/eml/{scope}/{id}/{ver}/{entity}</url>
+          </online>
+        </distribution>
+      </physical>
+    </dataTable>
+  </dataset>
+</eml:eml>
+"""
+
+
+def mk_sample(root_path, id_int, byte_count):
+    pkg_path = root_path / f'knb-lter-test.{id_int}.1'
+    pkg_path.mkdir(parents=True)
+    (pkg_path / 'Level-1-EML.xml').write_text(
+        EML_TEMPLATE.format(scope='knb-lter-test', id=id_int, ver=1, entity='entity')
+    )
+    (pkg_path / 'entity').write_bytes(b'x' * byte_count)
+
+
+def test_1000(config, tmpdir, monkeypatch):
+    """get_sample_data_entity_list(): Lists entities ordered by size, and only parses
+    the EML docs again when the sample dirs change"""
+    root_path = config['LOCAL_SAMPLE_ROOT_DIR'] = pathlib.Path(tmpdir) / 'samples'
+    config['SAMPLE_CATALOG_CHECK_SEC'] = 0
+    mk_sample(root_path, 1, 200)
+    mk_sample(root_path, 2, 100)
+
+    parse_count = 0
+    get_sample_dist_url_list = dex.sample._get_sample_dist_url_list
+
+    def count_parse(eml_path):
+        nonlocal parse_count
+        parse_count += 1
+        return get_sample_dist_url_list(eml_path)
+
+    monkeypatch.setattr(dex.sample, '_get_sample_dist_url_list', count_parse)
+
+    entity_list = dex.sample.get_sample_data_entity_list(None)
+    assert [(d['id_str'], d['size']) for d in entity_list] == [('2', 100), ('1', 200)]
+    assert parse_count == 2
+
+    dex.sample.get_sample_data_entity_list(None)
+    assert parse_count == 2
+
+    mk_sample(root_path, 3, 50)
+    entity_list = dex.sample.get_sample_data_entity_list(None)
+    assert [d['id_str'] for d in entity_list] == ['3', '2', '1']
+    assert parse_count == 5
+
+
+def test_1010(config, tmpdir):
+    """get_sample_data_entity_list(): Changes are not checked for within the check
+    interval"""
+    root_path = config['LOCAL_SAMPLE_ROOT_DIR'] = pathlib.Path(tmpdir) / 'samples'
+    config['SAMPLE_CATALOG_CHECK_SEC'] = 3600
+    mk_sample(root_path, 1, 200)
+    assert len(dex.sample.get_sample_data_entity_list(None)) == 1
+    mk_sample(root_path, 2, 100)
+    assert len(dex.sample.get_sample_data_entity_list(None)) == 1
+
+
+def test_1020(app, config, tmpdir, monkeypatch):
+    """get_sample_data_entity_list(): The previous catalog is returned while another
+    thread rebuilds it"""
+    root_path = config['LOCAL_SAMPLE_ROOT_DIR'] = pathlib.Path(tmpdir) / 'samples'
+    config['SAMPLE_CATALOG_CHECK_SEC'] = 0
+    mk_sample(root_path, 1, 200)
+    assert len(dex.sample.get_sample_data_entity_list(None)) == 1
+
+    is_building = threading.Event()
+    is_released = threading.Event()
+    build_sample_data_entity_list = dex.sample._build_sample_data_entity_list
+
+    def slow_build(sample_root_path):
+        is_building.set()
+        is_released.wait(10)
+        return build_sample_data_entity_list(sample_root_path)
+
+    monkeypatch.setattr(dex.sample, '_build_sample_data_entity_list', slow_build)
+    mk_sample(root_path, 2, 100)
+
+    def rebuild():
+        with app.app_context():
+            dex.sample.get_sample_data_entity_list(None)
+
+    thread = threading.Thread(target=rebuild)
+    thread.start()
+    try:
+        assert is_building.wait(10)
+        assert len(dex.sample.get_sample_data_entity_list(None)) == 1
+    finally:
+        is_released.set()
+        thread.join()
+    assert len(dex.sample.get_sample_data_entity_list(None)) == 2
@@ -0,0 +1,77 @@
+import logging
+import time
+
+import pytest
+
+import dex.timing
+
+
+def timed_view():
+    with dex.timing.span('outer', 'detail'):
+        with dex.timing.span('inner'):
+            time.sleep(0.01)
+        with dex.timing.span('inner'):
+            pass
+    dex.timing.add('wait', 0.005)
+    return 'ok'
+
+
+@pytest.fixture
+def client(app, app_context):
+    app.add_url_rule('/test/timed', 'timed', timed_view)
+    return app.test_client()
+
+
+def get_metric_dict(response):
+    metric_dict = {}
+    for metric_str in response.headers['Server-Timing'].split(', '):
+        name, *param_list = metric_str.split(';')
+        metric_dict[name] = dict(p.split('=', 1) for p in param_list)
+    return metric_dict
+
+
+def test_1000(client, config):
+    """Server-Timing: Not added when timing is disabled"""
+    config['SERVER_TIMING_ENABLED'] = False
+    response = client.get('/test/timed')
+    assert response.text == 'ok'
+    assert 'Server-Timing' not in response.headers
+
+
+def test_1010(client, config):
+    """Server-Timing: Stages with the same name are added together"""
+    config['SERVER_TIMING_ENABLED'] = True
+    metric_dict = get_metric_dict(client.get('/test/timed'))
+    assert list(metric_dict) == ['inner', 'outer', 'wait', 'compress', 'total']
+    assert metric_dict['inner']['desc'] == '"x2"'
+    assert float(metric_dict['inner']['dur']) >= 10
+    assert float(metric_dict['outer']['dur']) >= float(metric_dict['inner']['dur'])
+    assert float(metric_dict['wait']['dur']) == 5
+    assert float(metric_dict['total']['dur']) >= float(metric_dict['outer']['dur'])
+
+
+def test_1020(client, config):
+    """Server-Timing: Enabled by the debug panel cookie"""
+    config['SERVER_TIMING_ENABLED'] = False
+    client.set_cookie('debug-panel', 'true')
+    assert 'total' in get_metric_dict(client.get('/test/timed'))
+
+
+def test_1030(client, config, caplog):
+    """Server-Timing: Breakdown with nested stages is logged"""
+    config['SERVER_TIMING_ENABLED'] = True
+    config['SERVER_TIMING_LOG'] = True
+    with caplog.at_level(logging.INFO, logger='dex.timing'):
+        client.get('/test/timed?a=1')
+    line_list = caplog.records[-1].getMessage().splitlines()
+    assert line_list[0].startswith('GET /test/timed?a=1 -> 200 in ')
+    assert line_list[1].endswith('ms  outer detail')
+    assert line_list[2].endswith('ms    inner')
+
+
+def test_1040(app):
+    """span(): No-op outside of a request"""
+    with app.app_context():
+        with dex.timing.span('outside'):
+            pass
+        dex.timing.add('outside', 1)
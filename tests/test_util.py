@@ -1,7 +1,10 @@
+import datetime
+import json
 import logging
 import multiprocessing
 import multiprocessing.pool
 import os
+import pathlib
 import random
 import threading
 
@@ -9,6 +12,9 @@ import threading
 import time
 
 import fasteners
+import numpy as np
+import pandas as pd
+import pytest
 
 import dex.util
 
@@ -82,3 +88,83 @@ def proc():
         with lock(123, 'test_key', 'test_obj'):
             with lock(123, 'test_key', 'test_obj'):
                 time.sleep(100)
+
+
+@pytest.fixture(params=['orjson', 'json'])
+def json_lib(request, monkeypatch):
+    if request.param == 'json':
+        monkeypatch.setattr(dex.util, 'orjson', None)
+    elif dex.util.orjson is None:
+        pytest.skip('orjson is not installed')
+    return request.param
+
+
+def test_2000(json_lib):
+    """to_json(): Serializes dates, NumPy types and unsupported types"""
+    obj = {
+        'dt': datetime.datetime(2020, 1, 2, 3, 4, 5),
+        'ts': pd.Timestamp('2020-01-02'),
+        'date': datetime.date(2020, 1, 2),
+        'int': np.int64(3),
+        'arr': np.array([1.5, 2.5]),
+        'path': pathlib.PurePosixPath('/a/b'),
+        'tup': ('a', 1),
+    }
+    assert json.loads(dex.util.to_json(obj)) == {
+        'dt': '2020-01-02T03:04:05',
+        'ts': '2020-01-02T00:00:00',
+        'date': '2020-01-02',
+        'int': 3,
+        'arr': [1.5, 2.5],
+        'path': '/a/b',
+        'tup': ['a', 1],
+    }
+
+
+def test_2005(json_lib):
+    """to_json(): NaN and infinite floats are serialized as null"""
+    obj = {
+        'nan': float('nan'),
+        'inf': float('-inf'),
+        'np_nan': np.float64('nan'),
+        'arr': np.array([1.5, np.nan]),
+        'list': [np.nan, 1],
+    }
+
+    def reject_constant(name):
+        raise ValueError(f'Invalid JSON constant: {name}')
+
+    assert json.loads(dex.util.to_json(obj), parse_constant=reject_constant) == {
+        'nan': None,
+        'inf': None,
+        'np_nan': None,
+        'arr': [1.5, None],
+        'list': [None, 1],
+    }
+
+
+def test_2010(app_context):
+    """json_response(): Response has the JSON mimetype"""
+    response = dex.util.json_response([1, 2])
+    assert response.mimetype == 'application/json'
+    assert response.get_json() == [1, 2]
+
+
+def test_2010(json_lib, monkeypatch):
+    """get_json_row_list(): Missing values and infinite floats are replaced by None, so
+    the rows are serialized in a single pass"""
+    df = pd.DataFrame(
+        {
+            'str': ['a', np.nan, None],
+            'float': [1.5, np.inf, np.nan],
+            'int': [1, 2, 3],
+        }
+    )
+
+    def fail(obj):
+        raise AssertionError('Second pass for non-finite floats')
+
+    monkeypatch.setattr(dex.util, '_replace_non_finite', fail)
+    row_list = dex.util.get_json_row_list(df)
+    assert row_list == [['a', 1.5, 1], [None, None, 2], [None, None, 3]]
+    assert json.loads(dex.util.to_json({'data': row_list})) == {'data': row_list}
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+
+"""Compare size and throughput of the compression codecs supported by the DeX disk
+cache, using real objects from an existing cache.
+
+Each cached object is decoded with the codec it was written with, then written and read
+back with each of the available codecs. Results are summarized per object type.
+"""
+import argparse
+import collections
+import logging
+import pathlib
+import sys
+import tempfile
+import time
+
+import dex.cache
+
+log = logging.getLogger(__name__)
+
+# Run each benchmark multiple times for better accuracy
+REPEAT_COUNT = 3
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        'cache_root',
+        type=pathlib.Path,
+        help='Root of the DeX disk cache (CACHE_ROOT_DIR)',
+    )
+    parser.add_argument(
+        '--max-count',
+        type=int,
+        default=100,
+        help='Max number of cached objects to include',
+    )
+    parser.add_argument(
+        '--obj-type',
+        action='append',
+        help='Only include objects of this type. Can be repeated',
+    )
+    parser.add_argument(
+        '--debug',
+        action='store_true',
+        help='Debug level logging',
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        format='%(levelname)-8s %(message)s',
+        level=logging.DEBUG if args.debug else logging.INFO,
+        stream=sys.stdout,
+    )
+
+    codec_list = [c for c in dex.cache.CODEC_EXT_DICT if dex.cache.is_codec_available(c)]
+    log.info(f'Available codecs: {", ".join(codec_list)}')
+
+    # obj_type -> codec -> [raw_bytes, compressed_bytes, write_sec, read_sec]
+    result_dict = collections.defaultdict(lambda: collections.defaultdict(lambda: [0, 0, 0, 0]))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp_root_path = pathlib.Path(tmp_dir)
+        for obj_path, obj_type, src_codec in iter_cache_obj(args.cache_root, args.max_count):
+            if args.obj_type and obj_type not in args.obj_type:
+                continue
+            with dex.cache.open_codec(obj_path, src_codec) as f:
+                obj_bytes = f.read()
+            log.debug(f'{obj_path.as_posix()}: {len(obj_bytes):,} bytes')
+            for codec in codec_list:
+                tmp_path = tmp_root_path / f'obj{dex.cache.CODEC_EXT_DICT[codec]}'
+                write_sec, read_sec = bench_codec(tmp_path, codec, obj_bytes)
+                r = result_dict[obj_type][codec]
+                r[0] += len(obj_bytes)
+                r[1] += tmp_path.stat().st_size
+                r[2] += write_sec
+                r[3] += read_sec
+                tmp_path.unlink()
+
+    print_results(result_dict)
+
+
+def iter_cache_obj(cache_root, max_count):
+    """Yield (path, obj_type, codec) for up to max_count objects in the cache."""
+    ext_to_codec_dict = {v: k for k, v in dex.cache.CODEC_EXT_DICT.items() if v}
+    count = 0
+    for obj_path in sorted(cache_root.glob('*/*')):
+        if count >= max_count:
+            break
+        if not obj_path.is_file():
+            continue
+        codec = ext_to_codec_dict.get(obj_path.suffix, 'none')
+        base_path = obj_path.with_suffix('') if codec != 'none' else obj_path
+        obj_type = base_path.suffix.lstrip('.')
+        if not dex.cache.is_codec_available(codec):
+            log.warning(f'Skipped object with unavailable codec: {obj_path.as_posix()}')
+            continue
+        count += 1
+        yield obj_path, obj_type, codec
+
+
+def bench_codec(tmp_path, codec, obj_bytes):
+    """Return the average (write_sec, read_sec) for writing and reading obj_bytes with
+    the codec.
+    """
+    write_sec = read_sec = 0
+    for _ in range(REPEAT_COUNT):
+        start_ts = time.perf_counter()
+        with dex.cache.open_codec(tmp_path, codec, for_write=True) as f:
+            f.write(obj_bytes)
+        write_sec += time.perf_counter() - start_ts
+        start_ts = time.perf_counter()
+        with dex.cache.open_codec(tmp_path, codec) as f:
+            assert f.read() == obj_bytes
+        read_sec += time.perf_counter() - start_ts
+    return write_sec / REPEAT_COUNT, read_sec / REPEAT_COUNT
+
+
+def print_results(result_dict):
+    print('#' * 100)
+    print(
+        f'{"obj_type":<10} {"codec":<6} {"raw":>14} {"compressed":>14} {"ratio":>7} '
+        f'{"write MB/s":>11} {"read MB/s":>11}'
+    )
+    for obj_type, codec_dict in sorted(result_dict.items()):
+        for codec, (raw_count, comp_count, write_sec, read_sec) in codec_dict.items():
+            print(
+                f'{obj_type:<10} {codec:<6} {raw_count:>14,} {comp_count:>14,} '
+                f'{raw_count / max(comp_count, 1):>7.2f} '
+                f'{mb_per_sec(raw_count, write_sec):>11.1f} '
+                f'{mb_per_sec(raw_count, read_sec):>11.1f}'
+            )
+
+
+def mb_per_sec(byte_count, sec):
+    return byte_count / 1024**2 / sec if sec else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
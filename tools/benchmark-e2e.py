@@ -0,0 +1,294 @@
+#!/usr/bin/env python
+
+"""End-to-end benchmark of DeX, using a corpus of synthetic packages.
+
+Packages of several sizes and CSV dialects are created with synthetic_corpus.py, then
+each package is opened through the Flask test client, the same way a user would open it
+from the sample list. For each package, we time:
+
+    ingest    Adding the entity and opening the subset page, which parses the EML and
+              the CSV, and creates the dataset summary
+    browse    Paging through the table, and a page with a search and a sort
+    category  Fetching the list of unique values in a categorical column
+    subset    Downloading a subset filtered by category, date range and columns
+    plot      Opening the plot page, and fetching an XY plot of a time series
+    profile   Creating the profile report (skip with --no-profile, as it's slow)
+
+The first request for each step runs against an empty cache (cold). The step is then
+repeated against the populated cache (warm). The caches and DB are created in a temp
+dir, so the benchmark does not touch the caches of a running DeX instance.
+
+Results are written as JSON, so that runs can be compared between commits:
+
+    PYTHONPATH=. tools/benchmark-e2e.py --output before.json
+    git checkout <commit>
+    PYTHONPATH=. tools/benchmark-e2e.py --output after.json --compare before.json
+"""
+import argparse
+import datetime
+import json
+import logging
+import pathlib
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import synthetic_corpus
+
+import dex.db
+import dex.main
+
+log = logging.getLogger(__name__)
+
+ROOT_PATH = pathlib.Path(__file__).resolve().parent.parent
+
+BROWSE_PAGE_COUNT = 5
+BROWSE_PAGE_ROWS = 100
+PLOT_WIDTH = 1200
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        '--size',
+        action='append',
+        choices=synthetic_corpus.SIZE_DICT.keys(),
+        help='Benchmark packages of this size. Can be repeated. Default: small and medium',
+    )
+    parser.add_argument(
+        '--corpus-dir',
+        type=pathlib.Path,
+        help='Dir in which to create or reuse the corpus. Default: A temp dir',
+    )
+    parser.add_argument('--seed', type=int, default=1, help='Random seed for the corpus')
+    parser.add_argument(
+        '--repeat', type=int, default=3, help='Number of warm runs of each step (default: 3)'
+    )
+    parser.add_argument('--no-profile', action='store_true', help='Skip the profile step')
+    parser.add_argument('--output', type=pathlib.Path, help='Write results to this JSON file')
+    parser.add_argument('--compare', type=pathlib.Path, help='Compare with earlier JSON results')
+    parser.add_argument(
+        '--debug',
+        action='store_true',
+        help='Debug level logging',
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        format='%(levelname)-8s %(message)s',
+        level=logging.DEBUG if args.debug else logging.INFO,
+        stream=sys.stdout,
+    )
+    # Skip the per-request debug logging in DeX, which would dominate the output.
+    logging.getLogger('dex').setLevel(logging.DEBUG if args.debug else logging.WARNING)
+
+    size_list = args.size or ['small', 'medium']
+
+    with tempfile.TemporaryDirectory(prefix='dex-bench-') as tmp_dir:
+        tmp_path = pathlib.Path(tmp_dir)
+        corpus_path = args.corpus_dir or tmp_path / 'corpus'
+        start_ts = time.time()
+        package_list = synthetic_corpus.create_corpus(corpus_path, size_list, args.seed)
+        log.info(f'Corpus ready in {time.time() - start_ts:.2f}s: {corpus_path.as_posix()}')
+
+        app = create_bench_app(tmp_path, corpus_path)
+        result_dict = {}
+        with app.app_context():
+            dex.db.init_db()
+            client = app.test_client()
+            for package in package_list:
+                key = f'{package.size_name}/{package.dialect_name}'
+                log.info(f'{key}: {package.row_count:,} rows')
+                result_dict[key] = bench_package(client, package, args)
+            dex.db.close_db()
+
+    doc = {
+        'meta': get_meta_dict(args),
+        'result': result_dict,
+    }
+    print_results(result_dict)
+    if args.output:
+        args.output.write_text(json.dumps(doc, indent=2))
+        log.info(f'Wrote results to {args.output.as_posix()}')
+    if args.compare:
+        print_comparison(json.loads(args.compare.read_text()), doc)
+
+
+def create_bench_app(tmp_path, corpus_path):
+    app = dex.main.create_app()
+    app.config.update(
+        DISK_CACHE_ENABLED=True,
+        LOCAL_SAMPLE_ROOT_DIR=corpus_path.resolve(),
+        LOCAL_PACKAGE_ROOT_DIR=pathlib.Path('/var/empty'),
+        CACHE_ROOT_DIR=tmp_path / 'cache',
+        CACHE_INDEX_PATH=tmp_path / 'cache-index.sqlite',
+        TMP_CACHE_ROOT=tmp_path / 'tmp-cache',
+        TMP_CACHE_INDEX_PATH=tmp_path / 'tmp-cache-index.sqlite',
+        SQLITE_PATH=tmp_path / 'sqlite.db',
+        # DexError is an HTTPException without a status code, which is returned as an
+        # error page with status 200. Trap it, so that it reaches the handler below.
+        TRAP_HTTP_EXCEPTIONS=True,
+    )
+
+    # The app logs exceptions and returns an empty error page, which would be timed as
+    # a successful request.
+    def reraise(e):
+        raise e
+
+    app.register_error_handler(Exception, reraise)
+    return app
+
+
+def bench_package(client, package, args):
+    step_dict = {}
+
+    # The entity is added by the sample view, which redirects to the profile page.
+    response = client.get(f'/sample/{package.dist_url}')
+    rid = response.headers['Location'].rsplit('/', 1)[-1]
+    step_dict['ingest'] = bench_step(client, args, 'GET', f'/dex/subset/{rid}')
+
+    step_dict['browse'] = bench_step(
+        client,
+        args,
+        *[
+            ('GET', f'/dex/subset/fetch-browse/{rid}?{get_browse_query(page_idx)}')
+            for page_idx in range(BROWSE_PAGE_COUNT)
+        ],
+        ('GET', f'/dex/subset/fetch-browse/{rid}?{get_browse_query(0, "site-C", 2, "desc")}'),
+    )
+
+    step_dict['category'] = bench_step(
+        client, args, 'GET', f'/dex/subset/fetch-category/{rid}/{synthetic_corpus.SITE_COL_IDX}'
+    )
+
+    step_dict['subset'] = bench_step(
+        client,
+        args,
+        'POST',
+        f'/dex/subset/{rid}',
+        json.dumps(synthetic_corpus.get_filter_dict(package)),
+    )
+
+    parm_uri = synthetic_corpus.get_plot_parm_uri()
+    step_dict['plot'] = bench_step(
+        client,
+        args,
+        ('GET', f'/dex/plot/{rid}'),
+        ('GET', f'/bokeh/xy-plot/{rid}/{PLOT_WIDTH}/{parm_uri}'),
+    )
+
+    if not args.no_profile:
+        step_dict['profile'] = bench_step(client, args, 'GET', f'/dex/profile/doc/{rid}')
+
+    return step_dict
+
+
+def bench_step(client, args, *request_tup):
+    """Time a step, which is a single request given as (method, url, [data]), or a
+    series of requests given as tuples.
+
+    Returns a dict with the cold and warm times, and the total size of the responses.
+    """
+    request_list = request_tup if isinstance(request_tup[0], tuple) else [request_tup]
+
+    def run():
+        byte_count = 0
+        start_ts = time.perf_counter()
+        for method, url, *data in request_list:
+            response = client.open(url, method=method, data=data[0] if data else None)
+            try:
+                if response.status_code != 200:
+                    raise AssertionError(f'{method} {url} returned {response.status}')
+                byte_count += len(response.get_data())
+            finally:
+                response.close()
+        return time.perf_counter() - start_ts, byte_count
+
+    cold_sec, byte_count = run()
+    warm_sec_list = [run()[0] for _ in range(args.repeat)]
+    return {
+        'request_count': len(request_list),
+        'byte_count': byte_count,
+        'cold_ms': cold_sec * 1000,
+        'warm_ms': statistics.median(warm_sec_list) * 1000 if warm_sec_list else None,
+    }
+
+
+def get_browse_query(page_idx, *args):
+    return synthetic_corpus.get_browse_query(page_idx * BROWSE_PAGE_ROWS, BROWSE_PAGE_ROWS, *args)
+
+
+def get_meta_dict(args):
+    try:
+        commit_str = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=ROOT_PATH,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit_str = None
+    return {
+        'commit': commit_str,
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'args': {k: str(v) if isinstance(v, pathlib.Path) else v for k, v in vars(args).items()},
+    }
+
+
+def print_results(result_dict):
+    print()
+    print(
+        f'{"package":<20} {"step":<10} {"requests":>8} {"bytes":>12} '
+        f'{"cold ms":>10} {"warm ms":>10}'
+    )
+    for key, step_dict in result_dict.items():
+        for step_name, d in step_dict.items():
+            warm_str = f'{d["warm_ms"]:>10.1f}' if d['warm_ms'] is not None else f'{"-":>10}'
+            print(
+                f'{key:<20} {step_name:<10} {d["request_count"]:>8} {d["byte_count"]:>12,} '
+                f'{d["cold_ms"]:>10.1f} {warm_str}'
+            )
+
+
+def print_comparison(old_doc, new_doc):
+    """Print the ratio of new to old times for the steps that are in both results. A
+    ratio below 1 means that the new version is faster.
+    """
+    print()
+    print(f'Comparing with commit {old_doc["meta"]["commit"]} ({old_doc["meta"]["timestamp"]})')
+    print(
+        f'{"package":<20} {"step":<10} {"cold old":>10} {"cold new":>10} {"ratio":>7} '
+        f'{"warm old":>10} {"warm new":>10} {"ratio":>7}'
+    )
+
+    def ratio_str(old, new):
+        return f'{new / old:>7.2f}' if old and new is not None else f'{"-":>7}'
+
+    def ms_str(ms):
+        return f'{ms:>10.1f}' if ms is not None else f'{"-":>10}'
+
+    for key, step_dict in new_doc['result'].items():
+        for step_name, new in step_dict.items():
+            old = old_doc['result'].get(key, {}).get(step_name)
+            if old is None:
+                continue
+            print(
+                f'{key:<20} {step_name:<10} '
+                f'{ms_str(old["cold_ms"])} {ms_str(new["cold_ms"])} '
+                f'{ratio_str(old["cold_ms"], new["cold_ms"])} '
+                f'{ms_str(old["warm_ms"])} {ms_str(new["warm_ms"])} '
+                f'{ratio_str(old["warm_ms"], new["warm_ms"])}'
+            )
+
+
+if __name__ == '__main__':
+    sys.exit(main())
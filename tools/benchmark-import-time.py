@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+
+"""Measure the time required for importing DeX and creating the app, using
+`python -X importtime`.
+
+Each measurement runs in a new interpreter, so that no modules are already imported.
+Reports the total time, the slowest imports, and which of the heavy libraries
+that DeX imports lazily were imported anyway.
+"""
+import argparse
+import logging
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+log = logging.getLogger(__name__)
+
+# Libraries that should only be imported on first use. See dex.lazy.
+LAZY_MODULE_LIST = [
+    'bokeh',
+    'matplotlib',
+    'numpy',
+    'pandas',
+    'pygments',
+    'ydata_profiling',
+]
+
+IMPORT_TIME_RX = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        '--repeat',
+        type=int,
+        default=3,
+        help='Number of measurements. The median is reported',
+    )
+    parser.add_argument(
+        '--top',
+        type=int,
+        default=20,
+        help='Number of slowest imports to list',
+    )
+    parser.add_argument(
+        '--preload',
+        action='store_true',
+        help='Also call dex.lazy.preload(), as wsgi.py does with PRELOAD_LAZY_MODULES',
+    )
+    parser.add_argument(
+        '--debug',
+        action='store_true',
+        help='Debug level logging',
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        format='%(levelname)-8s %(message)s',
+        level=logging.DEBUG if args.debug else logging.INFO,
+        stream=sys.stdout,
+    )
+
+    code_str = 'import dex.main'
+    if args.preload:
+        code_str += '; import dex.lazy; dex.lazy.preload()'
+
+    wall_list = []
+    import_list = None
+    for _ in range(args.repeat):
+        wall_sec, import_list = measure(code_str)
+        wall_list.append(wall_sec)
+
+    print_results(statistics.median(wall_list), import_list, args.top)
+
+
+def measure(code_str):
+    """Run code_str in a new interpreter. Return the wall time, and a list of
+    (module_name, self_us, cumulative_us, depth) for each imported module.
+    """
+    start_ts = time.perf_counter()
+    p = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code_str],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+        check=True,
+    )
+    wall_sec = time.perf_counter() - start_ts
+    import_list = []
+    for line in p.stderr.splitlines():
+        m = IMPORT_TIME_RX.match(line)
+        if m:
+            self_us, cumulative_us, indent_str, module_name = m.groups()
+            import_list.append(
+                (module_name, int(self_us), int(cumulative_us), len(indent_str) // 2)
+            )
+    return wall_sec, import_list
+
+
+def print_results(wall_sec, import_list, top_count):
+    imported_set = {module_name for module_name, *_ in import_list}
+    print('#' * 100)
+    print(f'Wall time, including interpreter startup: {wall_sec:.2f}s')
+    print(f'Total import time: {sum(r[1] for r in import_list) / 1e6:.2f}s')
+    print(f'Imported modules: {len(import_list)}')
+    print()
+    print(f'Slowest imports (self / cumulative):')
+    top_list = sorted(import_list, key=lambda r: -r[1])
+    for module_name, self_us, cumulative_us, _depth in top_list[:top_count]:
+        print(f'  {self_us / 1e6:>8.3f}s {cumulative_us / 1e6:>8.3f}s  {module_name}')
+    print()
+    print('Lazy libraries:')
+    for module_name in LAZY_MODULE_LIST:
+        state_str = 'imported' if module_name in imported_set else 'not imported'
+        print(f'  {module_name:<20} {state_str}')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+
+"""Compare the per-response cost of the JSON serialization used by the fetch-browse
+and xy-plot endpoints, before and after switching to dex.util.to_json().
+
+The browse payload is a page of raw CSV strings with some missing values, as returned to
+DataTables. The plot payload is a dict with large lists of floats and datetimes, similar
+to the data in a Bokeh JSON item.
+
+The new serialization is measured both with orjson, if it is installed, and with the
+fallback to the standard library json module.
+"""
+import argparse
+import datetime
+import json
+import logging
+import random
+import string
+import sys
+import timeit
+
+import numpy as np
+import pandas as pd
+
+import dex.util
+
+log = logging.getLogger(__name__)
+
+# Run each benchmark multiple times for better accuracy
+REPEAT_COUNT = 5
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument('--rows', type=int, default=1000, help='Rows in browse page')
+    parser.add_argument('--cols', type=int, default=20, help='Columns in browse page')
+    parser.add_argument('--points', type=int, default=100_000, help='Points in plot')
+    parser.add_argument(
+        '--missing', type=float, default=0.05, help='Fraction of missing cells in browse page'
+    )
+    parser.add_argument(
+        '--debug',
+        action='store_true',
+        help='Debug level logging',
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        format='%(levelname)-8s %(message)s',
+        level=logging.DEBUG if args.debug else logging.INFO,
+        stream=sys.stdout,
+    )
+
+    log.info(f'orjson is {"installed" if dex.util.orjson else "not installed"}')
+
+    page_df = create_page_df(args.rows, args.cols, args.missing)
+    plot_dict = create_plot_dict(args.points)
+    bench('browse, old', lambda: browse_old(page_df))
+    bench('plot, old', lambda: json.dumps(plot_dict, cls=dex.util.DatetimeEncoder))
+
+    orjson = dex.util.orjson
+    lib_list = ([('orjson', orjson)] if orjson else []) + [('json', None)]
+    for lib_str, lib_module in lib_list:
+        dex.util.orjson = lib_module
+        bench(f'browse, {lib_str}', lambda: browse_new(page_df))
+        bench(f'plot, {lib_str}', lambda: dex.util.to_json(plot_dict))
+    dex.util.orjson = orjson
+
+
+def browse_old(page_df):
+    j = json.loads(page_df.to_json(orient="split", index=True))
+    row_list = [(a, *b) for a, b in zip(j["index"], j["data"])]
+    return json.dumps({'data': row_list}, cls=dex.util.DatetimeEncoder)
+
+
+def browse_new(page_df):
+    row_list = [
+        (a, *b) for a, b in zip(page_df.index.tolist(), dex.util.get_json_row_list(page_df))
+    ]
+    return dex.util.to_json({'data': row_list})
+
+
+def create_page_df(row_count, col_count, missing_fraction):
+    return pd.DataFrame(
+        [
+            [
+                np.nan
+                if random.random() < missing_fraction
+                else ''.join(random.choices(string.ascii_letters, k=random.randint(1, 20)))
+                for _ in range(col_count)
+            ]
+            for _ in range(row_count)
+        ],
+        columns=[f'col_{i}' for i in range(col_count)],
+    )
+
+
+def create_plot_dict(point_count):
+    start_dt = datetime.datetime(2000, 1, 1)
+    return {
+        'x': [start_dt + datetime.timedelta(hours=i) for i in range(point_count)],
+        'y': np.random.random(point_count).tolist(),
+    }
+
+
+def bench(name_str, fn):
+    sec = min(timeit.repeat(fn, number=1, repeat=REPEAT_COUNT))
+    log.info(f'{name_str:<14} {sec * 1000:>10.2f} ms')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
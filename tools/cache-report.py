@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+
+"""Report the biggest and least recently used datasets in the DeX permanent cache
+"""
+
+import argparse
+import datetime
+import logging
+import pathlib
+import sys
+
+import flask
+
+import dex.cache
+
+log = logging.getLogger(__name__)
+
+
+def flask_main(_ctx):
+    parser = argparse.ArgumentParser(
+        __doc__,
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        '--count',
+        type=int,
+        default=20,
+        help='Number of datasets to list in each section of the report',
+    )
+    parser.add_argument(
+        '--rebuild',
+        action='store_true',
+        help='Rebuild the index from the files in the cache before reporting',
+    )
+    parser.add_argument(
+        '--evict',
+        action='store_true',
+        help='Evict least recently used datasets if the cache is above its size limit',
+    )
+    parser.add_argument(
+        '--debug',
+        action='store_true',
+        help='Debug level logging',
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        format='%(name)s %(levelname)-8s %(message)s',
+        level=logging.DEBUG if args.debug else logging.INFO,
+        stream=sys.stderr,
+    )
+
+    config = flask.current_app.config
+    cache_index = dex.cache.get_cache_index()
+
+    if args.rebuild:
+        dex.cache.rebuild_cache_index()
+
+    if args.evict:
+        if config['CACHE_LIMIT_BYTES'] is None:
+            log.error('Cache size is unlimited (CACHE_LIMIT_BYTES is None)')
+            return 1
+        evict_count = dex.cache.evict(
+            cache_index,
+            pathlib.Path(config['CACHE_ROOT_DIR']).resolve(),
+            config['CACHE_LIMIT_BYTES'],
+            config['CACHE_EVICT_MIN_AGE_SEC'],
+        )
+        log.info(f'Evicted {evict_count} datasets')
+
+    group_list = cache_index.get_group_list()
+    total_bytes = sum(row.byte_count for row in group_list)
+    limit_bytes = config['CACHE_LIMIT_BYTES']
+
+    print(f'Cache root: {pathlib.Path(config["CACHE_ROOT_DIR"]).resolve().as_posix()}')
+    print(f'Datasets: {len(group_list):,}')
+    print(f'Total size: {fmt_bytes(total_bytes)}')
+    print(f'Size limit: {fmt_bytes(limit_bytes) if limit_bytes is not None else "None"}')
+
+    print_section('Size by object type')
+    for row in cache_index.get_type_list():
+        print(f'{fmt_bytes(row.byte_count):>12} {row.obj_count:>8,}  {row.obj_type}')
+
+    print_section(f'Biggest {args.count} datasets')
+    for row in sorted(group_list, key=lambda r: r.byte_count, reverse=True)[: args.count]:
+        print_group(row)
+
+    print_section(f'Least recently used {args.count} datasets')
+    for row in group_list[: args.count]:
+        print_group(row)
+
+    return 0
+
+
+def print_section(title_str):
+    print()
+    print(title_str)
+    print('-' * 100)
+
+
+def print_group(row):
+    access_str = datetime.datetime.fromtimestamp(row.access_ts).strftime('%Y-%m-%d %H:%M:%S')
+    rid_str = '' if row.rid is None else row.rid
+    print(f'{fmt_bytes(row.byte_count):>12}  {access_str}  {rid_str:>6}  {row.grp}')
+
+
+def fmt_bytes(byte_count):
+    for unit_str in ('B', 'KiB', 'MiB', 'GiB'):
+        if byte_count < 1024:
+            return f'{byte_count:,.1f} {unit_str}'
+        byte_count /= 1024
+    return f'{byte_count:,.1f} TiB'
+
+
+if __name__ == '__main__':
+    app = flask.Flask(__name__)
+    app.config.from_object("dex.config")
+    with app.app_context() as ctx:
+        sys.exit(flask_main(ctx))
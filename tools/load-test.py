@@ -0,0 +1,661 @@
+#!/usr/bin/env python
+
+"""Load test DeX with a mixed workload over many rids.
+
+A corpus of synthetic packages is created with synthetic_corpus.py, and a local DeX
+instance is started against the corpus, with caches and DB in a temp dir. The instance
+is started under uWSGI if it's installed, else under gunicorn or the Flask development
+server. No network access is required.
+
+A number of simulated users then send requests for random rids, with the type of each
+request drawn from a weighted mix of page loads, DataTables paging, category fetches,
+subset downloads and plots. At the end, we report:
+
+    - Throughput, and p50, p95 and p99 latency per endpoint
+    - Time spent waiting for the cache and object locks, from the DeX debug log
+    - Resident memory of each server process, sampled while the test runs
+
+Examples:
+
+    PYTHONPATH=. tools/load-test.py --users 20 --duration 60
+    PYTHONPATH=. tools/load-test.py --mix browse=1,download=1 --size medium --copies 4
+    PYTHONPATH=. tools/load-test.py --url http://127.0.0.1:5000 --corpus-dir ../dex-samples
+
+When --url is given, requests are sent to an instance that is already running, and which
+must have --corpus-dir as its LOCAL_SAMPLE_ROOT_DIR. Lock wait and memory are then not
+reported.
+"""
+import argparse
+import collections
+import concurrent.futures
+import json
+import logging
+import os
+import pathlib
+import random
+import re
+import shutil
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+import synthetic_corpus
+
+log = logging.getLogger(__name__)
+
+ROOT_PATH = pathlib.Path(__file__).resolve().parent.parent
+
+# Relative weights of the request types in the default workload
+DEFAULT_MIX_DICT = {
+    'subset-page': 10,
+    'plot-page': 5,
+    'profile': 5,
+    'eml-page': 5,
+    'browse': 40,
+    'category': 15,
+    'download': 10,
+    'plot': 10,
+}
+
+BROWSE_PAGE_ROWS = 100
+PLOT_WIDTH = 1200
+
+# Interval between samples of the memory of the server processes
+MEMORY_SAMPLE_SEC = 0.5
+
+SERVER_START_TIMEOUT_SEC = 120
+REQUEST_TIMEOUT_SEC = 300
+
+INIT_DB_SCRIPT = '''
+import dex.db
+import dex.main
+with dex.main.app.app_context():
+    dex.db.init_db()
+    dex.db.close_db()
+'''
+
+# Matches lock waits logged by dex.cache.lock() and dex.obj_bytes._lock()
+LOCK_WAIT_RX = re.compile(r'Acquired lock after\s*(?P<sec>[\d.]+)s: (?P<name>.*)$')
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('--users', type=int, default=10, help='Number of concurrent users')
+    parser.add_argument('--duration', type=float, default=30, help='Length of test in seconds')
+    parser.add_argument(
+        '--mix',
+        help=(
+            'Workload mix as comma separated type=weight pairs. '
+            f'Types: {", ".join(DEFAULT_MIX_DICT)}. '
+            f'Default: {",".join(f"{k}={v}" for k, v in DEFAULT_MIX_DICT.items())}'
+        ),
+    )
+    parser.add_argument(
+        '--size',
+        action='append',
+        choices=synthetic_corpus.SIZE_DICT.keys(),
+        help='Include packages of this size. Can be repeated. Default: small',
+    )
+    parser.add_argument(
+        '--copies',
+        type=int,
+        default=4,
+        help='Number of packages per size and dialect. Each package is a separate rid',
+    )
+    parser.add_argument(
+        '--corpus-dir',
+        type=pathlib.Path,
+        help='Dir in which to create or reuse the corpus. Default: A temp dir',
+    )
+    parser.add_argument('--seed', type=int, default=1, help='Random seed')
+    parser.add_argument(
+        '--warmup',
+        action='store_true',
+        help='Open each rid before starting the test, so that caches are populated',
+    )
+    parser.add_argument(
+        '--server',
+        choices=['uwsgi', 'gunicorn', 'flask'],
+        help='Server to start. Default: The first one that is installed',
+    )
+    parser.add_argument('--processes', type=int, default=4, help='Number of server processes')
+    parser.add_argument('--threads', type=int, default=2, help='Number of threads per process')
+    parser.add_argument('--url', help='Base URL of an already running instance')
+    parser.add_argument('--output', type=pathlib.Path, help='Write results to this JSON file')
+    parser.add_argument('--server-log', type=pathlib.Path, help='Write server output to this file')
+    parser.add_argument(
+        '--debug',
+        action='store_true',
+        help='Debug level logging',
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        format='%(levelname)-8s %(message)s',
+        level=logging.DEBUG if args.debug else logging.INFO,
+        stream=sys.stdout,
+    )
+
+    mix_dict = parse_mix(args.mix) if args.mix else DEFAULT_MIX_DICT
+
+    with tempfile.TemporaryDirectory(prefix='dex-load-') as tmp_dir:
+        tmp_path = pathlib.Path(tmp_dir)
+        corpus_path = args.corpus_dir or tmp_path / 'corpus'
+        package_list = synthetic_corpus.create_corpus(
+            corpus_path, args.size or ['small'], args.seed, args.copies
+        )
+        log.info(f'Corpus: {len(package_list)} packages at {corpus_path.as_posix()}')
+
+        if args.url:
+            server = None
+            base_url = args.url.rstrip('/')
+        else:
+            server = Server(args, tmp_path, corpus_path)
+            base_url = server.start()
+
+        try:
+            rid_list = add_entities(base_url, package_list)
+            if args.warmup:
+                warm_up(base_url, rid_list, args.users)
+            if server:
+                server.reset_stats()
+            sample_list, elapsed_sec = run_load(base_url, rid_list, mix_dict, args)
+        finally:
+            if server:
+                server.stop()
+
+    result_dict = get_result_dict(sample_list, elapsed_sec, server)
+    result_dict['args'] = {
+        k: str(v) if isinstance(v, pathlib.Path) else v for k, v in vars(args).items()
+    }
+    result_dict['mix'] = mix_dict
+    print_results(result_dict)
+    if args.output:
+        args.output.write_text(json.dumps(result_dict, indent=2))
+        log.info(f'Wrote results to {args.output.as_posix()}')
+
+
+def parse_mix(mix_str):
+    mix_dict = {}
+    for pair_str in mix_str.split(','):
+        name, _, weight_str = pair_str.partition('=')
+        if name not in DEFAULT_MIX_DICT:
+            raise SystemExit(f'Unknown request type in --mix: "{name}"')
+        mix_dict[name] = float(weight_str or 1)
+    return mix_dict
+
+
+#
+# Server
+#
+
+
+class Server:
+    """A DeX instance running in a subprocess, against the synthetic corpus.
+
+    The instance is configured through a settings file passed in DEX_SETTINGS. The
+    output of the server is scanned for lock waits, and the memory of the server
+    processes is sampled in a background thread.
+    """
+
+    def __init__(self, args, tmp_path, corpus_path):
+        self.args = args
+        self.tmp_path = tmp_path
+        self.corpus_path = corpus_path
+        self.port = get_free_port()
+        self.proc = None
+        self.stats_lock = threading.Lock()
+        self.lock_wait_list = []
+        self.rss_dict = {}
+        self.is_stopping = threading.Event()
+        self.thread_list = []
+
+    def start(self):
+        settings_path = self.tmp_path / 'settings.py'
+        settings_path.write_text(self.get_settings_str())
+        env_dict = dict(
+            os.environ,
+            DEX_SETTINGS=settings_path.as_posix(),
+            PYTHONPATH=ROOT_PATH.as_posix(),
+            PYTHONUNBUFFERED='1',
+        )
+        # Create the DB in a separate process, as importing DeX configures logging.
+        subprocess.run(
+            [sys.executable, '-c', INIT_DB_SCRIPT],
+            cwd=ROOT_PATH,
+            env=env_dict,
+            capture_output=True,
+            check=True,
+        )
+        cmd_list = self.get_cmd_list()
+        log.info(f'Starting server: {" ".join(cmd_list)}')
+        self.log_file = self.args.server_log.open('w') if self.args.server_log else None
+        self.proc = subprocess.Popen(
+            cmd_list,
+            cwd=ROOT_PATH,
+            env=env_dict,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            errors='replace',
+            # Start in a new process group, so that all workers can be stopped together.
+            start_new_session=True,
+        )
+        for fn in (self.read_output, self.sample_memory):
+            thread = threading.Thread(target=fn, daemon=True)
+            thread.start()
+            self.thread_list.append(thread)
+        base_url = f'http://127.0.0.1:{self.port}'
+        wait_for_server(base_url, self.proc)
+        return base_url
+
+    def stop(self):
+        self.is_stopping.set()
+        if self.proc is None or self.proc.poll() is not None:
+            return
+        os.killpg(self.proc.pid, signal.SIGTERM)
+        try:
+            self.proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            os.killpg(self.proc.pid, signal.SIGKILL)
+            self.proc.wait()
+        for thread in self.thread_list:
+            thread.join(timeout=5)
+        if self.log_file:
+            self.log_file.close()
+
+    def get_settings_str(self):
+        tmp_path = self.tmp_path
+        return '\n'.join(
+            [
+                'import logging',
+                'import pathlib',
+                'DEBUG = FLASK_DEBUG = DEBUG_PANEL = False',
+                'DISK_CACHE_ENABLED = True',
+                *[
+                    f'{k} = pathlib.Path({p.as_posix()!r})'
+                    for k, p in {
+                        'LOCAL_SAMPLE_ROOT_DIR': self.corpus_path.resolve(),
+                        'CACHE_ROOT_DIR': tmp_path / 'cache',
+                        'CACHE_INDEX_PATH': tmp_path / 'cache-index.sqlite',
+                        'TMP_CACHE_ROOT': tmp_path / 'tmp-cache',
+                        'TMP_CACHE_INDEX_PATH': tmp_path / 'tmp-cache-index.sqlite',
+                        'SQLITE_PATH': tmp_path / 'sqlite.db',
+                    }.items()
+                ],
+                # Lock waits are logged at debug level. Enable debug logging only for the
+                # modules that hold the locks, to keep the log volume down.
+                'logging.getLogger().setLevel(logging.INFO)',
+                'logging.getLogger("dex.cache").setLevel(logging.DEBUG)',
+                'logging.getLogger("dex.obj_bytes").setLevel(logging.DEBUG)',
+                '',
+            ]
+        )
+
+    def get_cmd_list(self):
+        server_name = self.args.server or next(
+            (s for s in ('uwsgi', 'gunicorn') if shutil.which(s)), 'flask'
+        )
+        addr_str = f'127.0.0.1:{self.port}'
+        if server_name == 'uwsgi':
+            return [
+                'uwsgi',
+                '--http',
+                addr_str,
+                '--module',
+                'wsgi:app',
+                '--master',
+                '--processes',
+                str(self.args.processes),
+                '--threads',
+                str(self.args.threads),
+                '--buffer-size',
+                '65535',
+                '--die-on-term',
+                '--disable-logging',
+            ]
+        if server_name == 'gunicorn':
+            return [
+                'gunicorn',
+                '--bind',
+                addr_str,
+                '--workers',
+                str(self.args.processes),
+                '--threads',
+                str(self.args.threads),
+                '--timeout',
+                str(REQUEST_TIMEOUT_SEC),
+                'wsgi:app',
+            ]
+        log.warning('uWSGI and gunicorn not found. Using the Flask server, in a single process')
+        return [
+            sys.executable,
+            '-m',
+            'flask',
+            '--app',
+            'wsgi:app',
+            'run',
+            '--host',
+            '127.0.0.1',
+            '--port',
+            str(self.port),
+            '--with-threads',
+            '--no-reload',
+        ]
+
+    def read_output(self):
+        for line in self.proc.stdout:
+            if self.log_file:
+                self.log_file.write(line)
+            m = LOCK_WAIT_RX.search(line)
+            if m:
+                with self.stats_lock:
+                    self.lock_wait_list.append((m.group('name').strip(), float(m.group('sec'))))
+
+    def sample_memory(self):
+        while not self.is_stopping.wait(MEMORY_SAMPLE_SEC):
+            for pid in get_process_tree_pid_list(self.proc.pid):
+                rss_bytes = get_rss_bytes(pid)
+                if rss_bytes is None:
+                    continue
+                with self.stats_lock:
+                    d = self.rss_dict.setdefault(pid, {'peak_bytes': 0, 'last_bytes': 0})
+                    d['peak_bytes'] = max(d['peak_bytes'], rss_bytes)
+                    d['last_bytes'] = rss_bytes
+
+    def reset_stats(self):
+        """Drop the stats collected during setup and warmup."""
+        with self.stats_lock:
+            self.lock_wait_list.clear()
+            for d in self.rss_dict.values():
+                d['peak_bytes'] = d['last_bytes']
+
+    def get_stats(self):
+        with self.stats_lock:
+            return list(self.lock_wait_list), {k: dict(v) for k, v in self.rss_dict.items()}
+
+
+def get_free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for_server(base_url, proc):
+    start_ts = time.time()
+    while time.time() - start_ts < SERVER_START_TIMEOUT_SEC:
+        if proc.poll() is not None:
+            raise SystemExit(f'Server exited with code {proc.returncode}')
+        try:
+            requests.get(f'{base_url}/robots.txt', timeout=5).raise_for_status()
+        except requests.RequestException:
+            time.sleep(0.5)
+        else:
+            log.info(f'Server ready in {time.time() - start_ts:.2f}s at {base_url}')
+            return
+    raise SystemExit('Timed out waiting for the server to start')
+
+
+def get_process_tree_pid_list(root_pid):
+    """Return the PIDs of a process and all its descendants. Linux only."""
+    child_dict = collections.defaultdict(list)
+    for stat_path in pathlib.Path('/proc').glob('[0-9]*/stat'):
+        try:
+            # The process name is in parens, and may contain spaces.
+            field_list = stat_path.read_text().rsplit(')', 1)[1].split()
+        except (OSError, IndexError):
+            continue
+        child_dict[int(field_list[1])].append(int(stat_path.parent.name))
+    pid_list = [root_pid]
+    for pid in pid_list:
+        pid_list.extend(child_dict[pid])
+    return pid_list
+
+
+def get_rss_bytes(pid):
+    try:
+        for line in pathlib.Path(f'/proc/{pid}/status').read_text().splitlines():
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+#
+# Load
+#
+
+
+def add_entities(base_url, package_list):
+    """Add the packages to DeX, and return a list of (rid, package) tuples."""
+    rid_list = []
+    with requests.Session() as session:
+        for package in package_list:
+            response = session.get(
+                f'{base_url}/sample/{package.dist_url}',
+                allow_redirects=False,
+                timeout=REQUEST_TIMEOUT_SEC,
+            )
+            response.raise_for_status()
+            rid_list.append((response.headers['Location'].rsplit('/', 1)[-1], package))
+    return rid_list
+
+
+def warm_up(base_url, rid_list, user_count):
+    log.info(f'Warming up {len(rid_list)} rids')
+    start_ts = time.time()
+
+    def warm(rid_tup):
+        with requests.Session() as session:
+            for name in DEFAULT_MIX_DICT:
+                send_request(session, base_url, name, rid_tup, random.Random(0))
+
+    with concurrent.futures.ThreadPoolExecutor(user_count) as executor:
+        list(executor.map(warm, rid_list))
+    log.info(f'Warmup completed in {time.time() - start_ts:.2f}s')
+
+
+def run_load(base_url, rid_list, mix_dict, args):
+    """Run the simulated users until the duration has passed, and return the list of
+    samples, and the elapsed time.
+
+    Each sample is a tuple: (request type, status code or exception name, seconds).
+    """
+    log.info(f'Running {args.users} users for {args.duration:.0f}s')
+    name_list, weight_list = zip(*mix_dict.items())
+    end_ts = time.time() + args.duration
+    sample_list = []
+    sample_lock = threading.Lock()
+
+    def user(user_idx):
+        rnd = random.Random(f'{args.seed}-{user_idx}')
+        with requests.Session() as session:
+            while time.time() < end_ts:
+                name = rnd.choices(name_list, weight_list)[0]
+                sample_tup = send_request(session, base_url, name, rnd.choice(rid_list), rnd)
+                with sample_lock:
+                    sample_list.append(sample_tup)
+
+    start_ts = time.time()
+    with concurrent.futures.ThreadPoolExecutor(args.users) as executor:
+        list(executor.map(user, range(args.users)))
+    return sample_list, time.time() - start_ts
+
+
+def send_request(session, base_url, name, rid_tup, rnd):
+    rid, package = rid_tup
+    method, path_str, data = get_request(name, rid, package, rnd)
+    start_ts = time.perf_counter()
+    try:
+        response = session.request(
+            method, base_url + path_str, data=data, timeout=REQUEST_TIMEOUT_SEC
+        )
+        # Include the time to receive the full body.
+        _ = response.content
+        status = response.status_code
+    except requests.RequestException as e:
+        status = e.__class__.__name__
+    return name, status, time.perf_counter() - start_ts
+
+
+def get_request(name, rid, package, rnd):
+    """Return (method, path, data) for a request of the given type."""
+    if name == 'subset-page':
+        return 'GET', f'/dex/subset/{rid}', None
+    if name == 'plot-page':
+        return 'GET', f'/dex/plot/{rid}', None
+    if name == 'profile':
+        return 'GET', f'/dex/profile/doc/{rid}', None
+    if name == 'eml-page':
+        return 'GET', f'/dex/eml/page/{rid}', None
+    if name == 'browse':
+        start_idx = rnd.randrange(0, package.row_count, BROWSE_PAGE_ROWS)
+        # Some of the pages are searched and sorted, as when the user types in the search
+        # field, or clicks a column header.
+        if rnd.random() < 0.2:
+            query_str = synthetic_corpus.get_browse_query(
+                start_idx, BROWSE_PAGE_ROWS, 'site-C', rnd.randrange(6), 'desc'
+            )
+        else:
+            query_str = synthetic_corpus.get_browse_query(start_idx, BROWSE_PAGE_ROWS)
+        return 'GET', f'/dex/subset/fetch-browse/{rid}?{query_str}', None
+    if name == 'category':
+        return 'GET', f'/dex/subset/fetch-category/{rid}/{synthetic_corpus.SITE_COL_IDX}', None
+    if name == 'download':
+        return 'POST', f'/dex/subset/{rid}', json.dumps(synthetic_corpus.get_filter_dict(package))
+    if name == 'plot':
+        parm_uri = synthetic_corpus.get_plot_parm_uri()
+        return 'GET', f'/bokeh/xy-plot/{rid}/{PLOT_WIDTH}/{parm_uri}', None
+    assert False, f'Unknown request type: {name}'
+
+
+#
+# Results
+#
+
+
+def get_result_dict(sample_list, elapsed_sec, server):
+    sample_dict = collections.defaultdict(list)
+    for name, status, sec in sample_list:
+        sample_dict[name].append((status, sec))
+    endpoint_dict = {
+        name: get_latency_dict([sec for _, sec in v], [s for s, _ in v if s != 200], elapsed_sec)
+        for name, v in sorted(sample_dict.items())
+    }
+    result_dict = {
+        'elapsed_sec': elapsed_sec,
+        'total': get_latency_dict(
+            [sec for _, _, sec in sample_list],
+            [s for _, s, _ in sample_list if s != 200],
+            elapsed_sec,
+        ),
+        'endpoint': endpoint_dict,
+        'lock_wait': None,
+        'memory': None,
+    }
+    if server:
+        lock_wait_list, rss_dict = server.get_stats()
+        wait_list = [sec for _, sec in lock_wait_list]
+        result_dict['lock_wait'] = {
+            'acquire_count': len(wait_list),
+            'total_sec': sum(wait_list),
+            'p95_sec': get_percentile(wait_list, 95),
+            'max_sec': max(wait_list, default=None),
+            'top': [
+                {'name': name, 'total_sec': sec}
+                for name, sec in get_wait_by_name(lock_wait_list).most_common(5)
+                if sec > 0
+            ],
+        }
+        result_dict['memory'] = {str(pid): d for pid, d in sorted(rss_dict.items())}
+    return result_dict
+
+
+def get_wait_by_name(lock_wait_list):
+    wait_counter = collections.Counter()
+    for name, sec in lock_wait_list:
+        wait_counter[name] += sec
+    return wait_counter
+
+
+def get_latency_dict(sec_list, error_list, elapsed_sec):
+    return {
+        'count': len(sec_list),
+        'error_count': len(error_list),
+        'errors': dict(collections.Counter(map(str, error_list))),
+        'per_sec': len(sec_list) / elapsed_sec if elapsed_sec else None,
+        'mean_ms': statistics.fmean(sec_list) * 1000 if sec_list else None,
+        'p50_ms': ms(get_percentile(sec_list, 50)),
+        'p95_ms': ms(get_percentile(sec_list, 95)),
+        'p99_ms': ms(get_percentile(sec_list, 99)),
+        'max_ms': ms(max(sec_list, default=None)),
+    }
+
+
+def get_percentile(value_list, percentile):
+    if not value_list:
+        return None
+    if len(value_list) == 1:
+        return value_list[0]
+    return statistics.quantiles(value_list, n=100, method='inclusive')[percentile - 1]
+
+
+def ms(sec):
+    return None if sec is None else sec * 1000
+
+
+def print_results(result_dict):
+    def f(v, fmt_str='>9.1f'):
+        return f'{"-":>9}' if v is None else format(v, fmt_str)
+
+    print()
+    print(f'Elapsed: {result_dict["elapsed_sec"]:.1f}s')
+    print(
+        f'{"endpoint":<14} {"count":>7} {"errors":>7} {"req/s":>9} '
+        f'{"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9} {"max ms":>9}'
+    )
+    row_list = list(result_dict['endpoint'].items()) + [('TOTAL', result_dict['total'])]
+    for name, d in row_list:
+        print(
+            f'{name:<14} {d["count"]:>7} {d["error_count"]:>7} {f(d["per_sec"])} '
+            f'{f(d["p50_ms"])} {f(d["p95_ms"])} {f(d["p99_ms"])} {f(d["max_ms"])}'
+        )
+        if d['errors']:
+            print(f'{"":<14} errors: {d["errors"]}')
+
+    lock_dict = result_dict['lock_wait']
+    if lock_dict is not None:
+        print()
+        print(
+            f'Lock waits: acquired={lock_dict["acquire_count"]} '
+            f'total={lock_dict["total_sec"]:.3f}s '
+            f'p95={f(lock_dict["p95_sec"], ".3f").strip()}s '
+            f'max={f(lock_dict["max_sec"], ".3f").strip()}s'
+        )
+        for d in lock_dict['top']:
+            print(f'  {d["total_sec"]:>8.3f}s {d["name"]}')
+
+    memory_dict = result_dict['memory']
+    if memory_dict:
+        print()
+        print(f'{"pid":<10} {"peak MiB":>10} {"last MiB":>10}')
+        for pid, d in memory_dict.items():
+            print(
+                f'{pid:<10} {d["peak_bytes"] / 1024**2:>10.1f} '
+                f'{d["last_bytes"] / 1024**2:>10.1f}'
+            )
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+
+"""Report the memory used by requests and by the creation of cached objects, from the
+records written by DeX while MEMORY_TRACKING_ENABLED is set
+
+Peak is the highest amount of memory allocated by Python during the request or
+function. RSS is the change in the resident set size of the process. For objects that
+are tables, the peak is also shown per cell, which gives the memory that would be needed
+for parsing a CSV file of CSV_MAX_CELLS cells. With --budget-mib, the largest
+CSV_MAX_CELLS that keeps the peak within the budget is estimated from the worst case.
+"""
+
+import argparse
+import collections
+import datetime
+import json
+import logging
+import math
+import pathlib
+import sys
+
+import flask
+
+log = logging.getLogger(__name__)
+
+
+def flask_main(_ctx):
+    config = flask.current_app.config
+    parser = argparse.ArgumentParser(
+        __doc__,
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        '--path',
+        type=pathlib.Path,
+        default=pathlib.Path(config['MEMORY_TRACKING_LOG_PATH']),
+        help='Path to the memory tracking records',
+    )
+    parser.add_argument(
+        '--count',
+        type=int,
+        default=20,
+        help='Number of requests and objects to list in each section of the report',
+    )
+    parser.add_argument(
+        '--budget-mib',
+        type=float,
+        help='Memory available for creating a single object, for estimating CSV_MAX_CELLS',
+    )
+    parser.add_argument(
+        '--debug',
+        action='store_true',
+        help='Debug level logging',
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        format='%(name)s %(levelname)-8s %(message)s',
+        level=logging.DEBUG if args.debug else logging.INFO,
+        stream=sys.stderr,
+    )
+
+    if not args.path.exists():
+        log.error(f'No memory tracking records at: {args.path.as_posix()}')
+        return 1
+
+    record_list = read_records(args.path)
+    request_list = [r for r in record_list if r['kind'] == 'request']
+    cache_list = [r for r in record_list if r['kind'] == 'cache']
+    table_list = [r for r in cache_list if r.get('cell_count')]
+
+    print(f'Records: {args.path.as_posix()}')
+    if record_list:
+        print(f'Period: {fmt_ts(record_list[0]["ts"])} - {fmt_ts(record_list[-1]["ts"])}')
+    print(f'Requests: {len(request_list):,}')
+    print(f'Created objects: {len(cache_list):,}')
+
+    print_section('Requests by endpoint')
+    print_summary(request_list)
+
+    print_section('Created objects by key')
+    print_summary(cache_list)
+
+    print_section(f'Worst {args.count} requests')
+    for r in sorted(request_list, key=lambda r: r['peak_bytes'], reverse=True)[: args.count]:
+        print_record(r, f'{r["status"]} {r["method"]} {r["path"]}')
+
+    print_section(f'Worst {args.count} created objects')
+    for r in sorted(cache_list, key=lambda r: r['peak_bytes'], reverse=True)[: args.count]:
+        cell_str = '' if not r.get('cell_count') else f'{r["cell_count"]:,} cells'
+        print_record(r, f'{r["name"]} {cell_str}'.rstrip())
+
+    print_section('Peak per cell, for objects that are tables')
+    if not table_list:
+        print('No records for tables')
+        return 0
+    max_cells = config['CSV_MAX_CELLS']
+    print(f'{"Key":<24} {"Count":>7} {"p50":>10} {"p95":>10} {"Max":>10}  At CSV_MAX_CELLS')
+    max_per_cell = 0
+    for name, group_list in group_records(table_list).items():
+        per_cell_list = sorted(r['peak_bytes'] / r['cell_count'] for r in group_list)
+        max_per_cell = max(max_per_cell, per_cell_list[-1])
+        print(
+            f'{name:<24} {len(per_cell_list):>7,} '
+            f'{get_percentile(per_cell_list, 50):>8.1f} B '
+            f'{get_percentile(per_cell_list, 95):>8.1f} B '
+            f'{per_cell_list[-1]:>8.1f} B  '
+            f'{fmt_mib(per_cell_list[-1] * max_cells)}'
+        )
+    print()
+    print(f'CSV_MAX_CELLS: {max_cells:,}')
+    if args.budget_mib is not None:
+        suggested_cells = int(args.budget_mib * 1024**2 / max_per_cell)
+        print(
+            f'Largest CSV_MAX_CELLS within {args.budget_mib:,.0f} MiB, at the worst '
+            f'{max_per_cell:,.1f} bytes per cell: {suggested_cells:,}'
+        )
+
+    return 0
+
+
+def read_records(path):
+    record_list = []
+    with path.open() as f:
+        for line_idx, line in enumerate(f):
+            try:
+                record_list.append(json.loads(line))
+            except ValueError:
+                # The last line may be incomplete if a worker is writing to it.
+                log.debug(f'Skipped invalid record on line {line_idx + 1}')
+    return sorted(record_list, key=lambda r: r['ts'])
+
+
+def group_records(record_list):
+    group_dict = collections.defaultdict(list)
+    for r in record_list:
+        group_dict[r['name']].append(r)
+    return group_dict
+
+
+def print_summary(record_list):
+    print(
+        f'{"Name":<32} {"Count":>7} {"Peak p50":>12} {"Peak p95":>12} {"Peak max":>12} '
+        f'{"RSS max":>12}'
+    )
+    group_dict = group_records(record_list)
+    for name, group_list in sorted(
+        group_dict.items(), key=lambda t: max(r['peak_bytes'] for r in t[1]), reverse=True
+    ):
+        peak_list = sorted(r['peak_bytes'] for r in group_list)
+        rss_list = [r['rss_delta_bytes'] for r in group_list if r['rss_delta_bytes'] is not None]
+        print(
+            f'{name:<32} {len(group_list):>7,} '
+            f'{fmt_mib(get_percentile(peak_list, 50)):>12} '
+            f'{fmt_mib(get_percentile(peak_list, 95)):>12} '
+            f'{fmt_mib(peak_list[-1]):>12} '
+            f'{fmt_mib(max(rss_list)) if rss_list else "n/a":>12}'
+        )
+
+
+def print_record(r, desc_str):
+    rss_str = 'n/a' if r['rss_delta_bytes'] is None else fmt_mib(r['rss_delta_bytes'])
+    rid_str = '' if r['rid'] is None else r['rid']
+    print(
+        f'{fmt_mib(r["peak_bytes"]):>12} {rss_str:>12} {r["sec"]:>8.2f}s  {rid_str:>6}  '
+        f'{desc_str}'
+    )
+
+
+def print_section(title_str):
+    print()
+    print(title_str)
+    print('-' * 100)
+
+
+def get_percentile(sorted_list, pct):
+    """Return the value at the percentile, using the nearest rank method."""
+    return sorted_list[max(0, math.ceil(pct / 100 * len(sorted_list)) - 1)]
+
+
+def fmt_ts(ts):
+    return datetime.datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def fmt_mib(byte_count):
+    return f'{byte_count / 1024**2:,.1f} MiB'
+
+
+if __name__ == '__main__':
+    app = flask.Flask(__name__)
+    app.config.from_object("dex.config")
+    with app.app_context() as ctx:
+        sys.exit(flask_main(ctx))
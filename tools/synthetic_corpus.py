@@ -0,0 +1,348 @@
+#!/usr/bin/env python
+
+"""Generate a corpus of synthetic PASTA style packages, for benchmarks and load tests.
+
+Each package has an EML doc describing a single CSV data table, with numeric, datetime,
+categorical and string columns, missing value codes, extra header and footer lines, and
+one of several CSV dialects. The packages are written in the layout used for the local
+sample packages (LOCAL_SAMPLE_ROOT_DIR), so they can be opened in DeX without network
+access, through /sample/<dist_url>:
+
+    <root>/<scope>.<id>.<ver>/Level-1-EML.xml
+    <root>/<scope>.<id>.<ver>/<entity>
+
+Generation is seeded, so the same arguments always create the same corpus.
+"""
+import argparse
+import collections
+import csv
+import datetime
+import json
+import logging
+import pathlib
+import random
+import string
+import sys
+import xml.sax.saxutils
+
+log = logging.getLogger(__name__)
+
+SCOPE_STR = 'knb-lter-syn'
+DIST_BASE_URL = 'https://sample/package'
+
+# Number of rows in the CSV for each size
+SIZE_DICT = {
+    'small': 1_000,
+    'medium': 20_000,
+    'large': 200_000,
+}
+
+# CSV dialects, as declared in the EML textFormat element
+Dialect = collections.namedtuple(
+    'Dialect', ['name', 'delimiter', 'quotechar', 'lineterminator', 'header_count', 'footer_count']
+)
+DIALECT_LIST = [
+    Dialect('comma', ',', '"', '\n', 1, 0),
+    Dialect('tab-crlf', '\t', '"', '\r\n', 3, 1),
+    Dialect('semicolon', ';', '"', '\n', 2, 2),
+]
+
+CATEGORY_LIST = [f'site-{c}' for c in string.ascii_uppercase[:12]]
+MISSING_FLOAT_STR = '-9999'
+MISSING_INT_STR = 'NA'
+
+# (name, EML measurementScale fragment) for each column
+COLUMN_LIST = [
+    (
+        'timestamp',
+        '<dateTime><formatString>YYYY-MM-DD hh:mm:ss</formatString></dateTime>',
+    ),
+    (
+        'site',
+        '<nominal><nonNumericDomain><enumeratedDomain>{}</enumeratedDomain>'
+        '</nonNumericDomain></nominal>'.format(
+            ''.join(
+                f'<codeDefinition><code>{c}</code><definition>{c}</definition></codeDefinition>'
+                for c in CATEGORY_LIST
+            )
+        ),
+    ),
+    (
+        'temperature',
+        '<ratio><unit><standardUnit>celsius</standardUnit></unit>'
+        '<numericDomain><numberType>real</numberType></numericDomain></ratio>',
+    ),
+    (
+        'count',
+        '<ratio><unit><standardUnit>number</standardUnit></unit>'
+        '<numericDomain><numberType>integer</numberType></numericDomain></ratio>',
+    ),
+    (
+        'sample_date',
+        '<dateTime><formatString>m/d/yyyy</formatString></dateTime>',
+    ),
+    (
+        'comment',
+        '<nominal><nonNumericDomain><textDomain><definition>Free text</definition>'
+        '</textDomain></nonNumericDomain></nominal>',
+    ),
+]
+MISSING_CODE_DICT = {
+    'temperature': MISSING_FLOAT_STR,
+    'count': MISSING_INT_STR,
+}
+
+# Column indexes, for building requests
+TIMESTAMP_COL_IDX = 0
+SITE_COL_IDX = 1
+TEMPERATURE_COL_IDX = 2
+
+EML_TEMPLATE = """<?xml version="1.0" encoding="UTF-8"?>
+<eml:eml xmlns:eml="https://eml.ecoinformatics.org/eml-2.2.0"
+  packageId="{pkg_id}" system="https://pasta.edirepository.org">
+  <dataset>
+    <title>Synthetic package {pkg_id}</title>
+    <dataTable>
+      <entityName>{entity_name}</entityName>
+      <physical>
+        <objectName>{entity_name}.csv</objectName>
+        <size unit="byte">{byte_count}</size>
+        <dataFormat>
+          <textFormat>
+            <numHeaderLines>{header_count}</numHeaderLines>
+            <numFooterLines>{footer_count}</numFooterLines>
+            <recordDelimiter>{record_delimiter}</recordDelimiter>
+            <attributeOrientation>column</attributeOrientation>
+            <simpleDelimited>
+              <fieldDelimiter>{field_delimiter}</fieldDelimiter>
+              <quoteCharacter>{quote_character}</quoteCharacter>
+            </simpleDelimited>
+          </textFormat>
+        </dataFormat>
+        <distribution>
+          <online>
+            <url function="download">{dist_url}</url>
+          </online>
+        </distribution>
+      </physical>
+      <attributeList>
+{attribute_xml}
+      </attributeList>
+      <numberOfRecords>{row_count}</numberOfRecords>
+    </dataTable>
+  </dataset>
+</eml:eml>
+"""
+
+ATTRIBUTE_TEMPLATE = """        <attribute>
+          <attributeName>{name}</attributeName>
+          <attributeDefinition>Synthetic {name}</attributeDefinition>
+          <measurementScale>{scale_xml}</measurementScale>{missing_xml}
+        </attribute>"""
+
+MISSING_TEMPLATE = """
+          <missingValueCode>
+            <code>{code}</code>
+            <codeExplanation>Missing</codeExplanation>
+          </missingValueCode>"""
+
+Package = collections.namedtuple(
+    'Package', ['pkg_id', 'dist_url', 'size_name', 'row_count', 'dialect_name', 'csv_path']
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('root_path', type=pathlib.Path, help='Dir in which to create corpus')
+    parser.add_argument(
+        '--size',
+        action='append',
+        choices=SIZE_DICT.keys(),
+        help='Create packages of this size. Can be repeated. Default: small and medium',
+    )
+    parser.add_argument('--seed', type=int, default=1, help='Random seed')
+    parser.add_argument(
+        '--copies', type=int, default=1, help='Number of packages per size and dialect'
+    )
+    parser.add_argument(
+        '--debug',
+        action='store_true',
+        help='Debug level logging',
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        format='%(levelname)-8s %(message)s',
+        level=logging.DEBUG if args.debug else logging.INFO,
+        stream=sys.stdout,
+    )
+
+    for package in create_corpus(
+        args.root_path, args.size or ['small', 'medium'], args.seed, args.copies
+    ):
+        log.info(f'{package.size_name:<8} {package.dialect_name:<10} {package.dist_url}')
+
+
+def create_corpus(root_path, size_list, seed=1, copy_count=1):
+    """Create copy_count packages for each combination of size and dialect, and return a
+    list of Package namedtuples. Existing packages are reused.
+
+    The copies have the same data, but are separate packages, so each gets its own rid
+    and cache in DeX.
+    """
+    package_list = []
+    for size_name in size_list:
+        for copy_idx in range(copy_count):
+            for dialect_idx, dialect in enumerate(DIALECT_LIST):
+                package_list.append(
+                    create_package(
+                        root_path,
+                        id_int=(
+                            (list(SIZE_DICT).index(size_name) + 1) * 1000
+                            + copy_idx * 10
+                            + dialect_idx
+                            + 1
+                        ),
+                        size_name=size_name,
+                        dialect=dialect,
+                        rnd=random.Random(f'{seed}-{size_name}-{dialect.name}'),
+                    )
+                )
+    return package_list
+
+
+def create_package(root_path, id_int, size_name, dialect, rnd):
+    row_count = SIZE_DICT[size_name]
+    pkg_id = f'{SCOPE_STR}.{id_int}.1'
+    entity_str = f'{size_name}-{dialect.name}-{id_int}'
+    dist_url = f'{DIST_BASE_URL}/data/eml/{SCOPE_STR}/{id_int}/1/{entity_str}'
+    pkg_path = pathlib.Path(root_path, pkg_id)
+    csv_path = pkg_path / entity_str
+    eml_path = pkg_path / 'Level-1-EML.xml'
+    package = Package(pkg_id, dist_url, size_name, row_count, dialect.name, csv_path)
+    if csv_path.exists() and eml_path.exists():
+        return package
+    pkg_path.mkdir(parents=True, exist_ok=True)
+    _write_csv(csv_path, row_count, dialect, rnd)
+    _write_eml(eml_path, package, dialect, csv_path.stat().st_size)
+    return package
+
+
+def get_filter_dict(package):
+    """Return a subset filter for the package, on the form posted by the subset page.
+    Filters on category, date range and columns.
+    """
+    return {
+        'row_filter': {'a': 1, 'b': package.row_count},
+        'category_filter': [[SITE_COL_IDX, ['site-A', 'site-B', 'site-C']]],
+        'date_filter': {'col_name': 'timestamp', 'start': '2000-01-05', 'end': '2010-01-01'},
+        'query_filter': '',
+        'column_filter': {
+            'index': True,
+            'selected_columns': ['timestamp', 'site', 'temperature', 'count'],
+        },
+    }
+
+
+def get_browse_query(start_idx, row_count, search_str='', order_col_idx=0, order_dir='asc'):
+    """Return the query string for a page of rows, as sent by DataTables."""
+    return '&'.join(
+        f'{k}={v}'
+        for k, v in {
+            'draw': 1,
+            'start': start_idx,
+            'length': row_count,
+            'search[value]': search_str,
+            'order[0][column]': order_col_idx,
+            'order[0][dir]': order_dir,
+        }.items()
+    )
+
+
+def get_plot_parm_uri():
+    """Return the plot parameters for a time series of the temperature column."""
+    return json.dumps({'x': TIMESTAMP_COL_IDX, 'y': [[TEMPERATURE_COL_IDX, False]]})
+
+
+def _write_csv(csv_path, row_count, dialect, rnd):
+    start_dt = datetime.datetime(2000, 1, 1)
+    with csv_path.open('w', newline='', encoding='utf-8') as f:
+        for i in range(dialect.header_count - 1):
+            f.write(f'Synthetic data, preamble line {i + 1}{dialect.lineterminator}')
+        writer = csv.writer(
+            f,
+            delimiter=dialect.delimiter,
+            quotechar=dialect.quotechar,
+            lineterminator=dialect.lineterminator,
+        )
+        writer.writerow([name for name, _ in COLUMN_LIST])
+        for i in range(row_count):
+            dt = start_dt + datetime.timedelta(minutes=30 * i)
+            writer.writerow(
+                [
+                    dt.strftime('%Y-%m-%d %H:%M:%S'),
+                    rnd.choice(CATEGORY_LIST),
+                    (
+                        MISSING_FLOAT_STR
+                        if rnd.random() < 0.02
+                        else f'{rnd.gauss(15, 8):.2f}'
+                    ),
+                    MISSING_INT_STR if rnd.random() < 0.02 else str(rnd.randint(0, 500)),
+                    f'{dt.month}/{dt.day}/{dt.year}',
+                    # Some values include the delimiter and the quote character, so must
+                    # be quoted.
+                    rnd.choice(
+                        [
+                            '',
+                            'ok',
+                            f'note{dialect.delimiter} see log',
+                            f'sensor {dialect.quotechar}B{dialect.quotechar} replaced',
+                            ''.join(rnd.choices(string.ascii_lowercase + ' ', k=20)),
+                        ]
+                    ),
+                ]
+            )
+        for i in range(dialect.footer_count):
+            f.write(f'Synthetic data, footer line {i + 1}{dialect.lineterminator}')
+
+
+def _write_eml(eml_path, package, dialect, byte_count):
+    def esc(s):
+        # Escape sequences are decoded by DeX when reading the dialect.
+        return xml.sax.saxutils.escape(s.encode('unicode_escape').decode('ascii'))
+
+    attribute_xml = '\n'.join(
+        ATTRIBUTE_TEMPLATE.format(
+            name=name,
+            scale_xml=scale_xml,
+            missing_xml=(
+                MISSING_TEMPLATE.format(code=MISSING_CODE_DICT[name])
+                if name in MISSING_CODE_DICT
+                else ''
+            ),
+        )
+        for name, scale_xml in COLUMN_LIST
+    )
+    eml_path.write_text(
+        EML_TEMPLATE.format(
+            pkg_id=package.pkg_id,
+            entity_name=package.dist_url.rsplit('/', 1)[-1],
+            byte_count=byte_count,
+            header_count=dialect.header_count,
+            footer_count=dialect.footer_count,
+            record_delimiter=esc(dialect.lineterminator),
+            field_delimiter=esc(dialect.delimiter),
+            quote_character=xml.sax.saxutils.escape(dialect.quotechar),
+            dist_url=package.dist_url,
+            attribute_xml=attribute_xml,
+            row_count=package.row_count,
+        ),
+        encoding='utf-8',
+    )
+
+
+if __name__ == '__main__':
+    sys.exit(main())
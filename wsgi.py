@@ -1,4 +1,8 @@
+import dex.lazy
 from dex.main import app
 
+if app.config['PRELOAD_LAZY_MODULES']:
+    dex.lazy.preload()
+
 if __name__ == "__main__":
     app.run()